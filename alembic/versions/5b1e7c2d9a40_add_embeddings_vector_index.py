@@ -0,0 +1,36 @@
+"""Add embeddings vector index
+
+Revision ID: 5b1e7c2d9a40
+Revises: 093875a2c7ba
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7c2d9a40'
+down_revision: Union[str, None] = '093875a2c7ba'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_embeddings_source_id'), 'embeddings', ['source_id'], unique=False)
+    op.create_index(
+        'ix_embeddings_vector_512_hnsw',
+        'embeddings',
+        ['vector_512'],
+        unique=False,
+        postgresql_using='hnsw',
+        postgresql_with={'m': 16, 'ef_construction': 64},
+        postgresql_ops={'vector_512': 'vector_cosine_ops'},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_embeddings_vector_512_hnsw', table_name='embeddings', postgresql_using='hnsw')
+    op.drop_index(op.f('ix_embeddings_source_id'), table_name='embeddings')
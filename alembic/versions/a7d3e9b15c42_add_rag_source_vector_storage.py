@@ -0,0 +1,26 @@
+"""Add rag source vector storage
+
+Revision ID: a7d3e9b15c42
+Revises: f2c8d4a61b93
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e9b15c42'
+down_revision: Union[str, None] = 'f2c8d4a61b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('rag_sources', sa.Column('vector_storage', sa.String(), server_default='float32', nullable=False, comment='Vector representation in the ANN index (float32, halfvec, binary)'))
+
+
+def downgrade() -> None:
+    op.drop_column('rag_sources', 'vector_storage')
@@ -0,0 +1,28 @@
+"""Add embeddings time position
+
+Revision ID: b4e8f2a9c613
+Revises: a7d3e9b15c42
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e8f2a9c613'
+down_revision: Union[str, None] = 'a7d3e9b15c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('embeddings', sa.Column('start_seconds', sa.Float(), nullable=True, comment='Chunk start time in the transcript (seconds)'))
+    op.add_column('embeddings', sa.Column('duration_seconds', sa.Float(), nullable=True, comment='Chunk duration in the transcript (seconds)'))
+
+
+def downgrade() -> None:
+    op.drop_column('embeddings', 'duration_seconds')
+    op.drop_column('embeddings', 'start_seconds')
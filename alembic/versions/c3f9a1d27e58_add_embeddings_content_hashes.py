@@ -0,0 +1,32 @@
+"""Add embeddings content hashes
+
+Revision ID: c3f9a1d27e58
+Revises: 5b1e7c2d9a40
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f9a1d27e58'
+down_revision: Union[str, None] = '5b1e7c2d9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('embeddings', sa.Column('file_path', sa.String(), nullable=True, comment='File path inside the archive'))
+    op.add_column('embeddings', sa.Column('file_hash', sa.String(length=64), nullable=True, comment='SHA-256 of the source file'))
+    op.add_column('embeddings', sa.Column('chunk_hash', sa.String(length=64), nullable=True, comment='SHA-256 of the text chunk'))
+    op.create_index('ix_embeddings_source_id_file_path', 'embeddings', ['source_id', 'file_path'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_embeddings_source_id_file_path', table_name='embeddings')
+    op.drop_column('embeddings', 'chunk_hash')
+    op.drop_column('embeddings', 'file_hash')
+    op.drop_column('embeddings', 'file_path')
@@ -0,0 +1,36 @@
+"""Add rag source versions
+
+Revision ID: d8e2b6f41c07
+Revises: c3f9a1d27e58
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8e2b6f41c07'
+down_revision: Union[str, None] = 'c3f9a1d27e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('rag_sources', sa.Column('root_id', sa.UUID(), nullable=True, comment='Logical source this row is a version of (NULL for the source itself)'))
+    op.add_column('rag_sources', sa.Column('version', sa.Integer(), server_default='1', nullable=False, comment='Version number'))
+    op.add_column('rag_sources', sa.Column('current_version_id', sa.UUID(), nullable=True, comment='Version whose embeddings are searched (NULL - the source itself)'))
+    op.create_index(op.f('ix_rag_sources_root_id'), 'rag_sources', ['root_id'], unique=False)
+    op.create_foreign_key('fk_rag_sources_root_id', 'rag_sources', 'rag_sources', ['root_id'], ['id'])
+    op.create_foreign_key('fk_rag_sources_current_version_id', 'rag_sources', 'rag_sources', ['current_version_id'], ['id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_rag_sources_current_version_id', 'rag_sources', type_='foreignkey')
+    op.drop_constraint('fk_rag_sources_root_id', 'rag_sources', type_='foreignkey')
+    op.drop_index(op.f('ix_rag_sources_root_id'), table_name='rag_sources')
+    op.drop_column('rag_sources', 'current_version_id')
+    op.drop_column('rag_sources', 'version')
+    op.drop_column('rag_sources', 'root_id')
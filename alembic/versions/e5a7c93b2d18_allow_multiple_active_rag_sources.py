@@ -0,0 +1,37 @@
+"""Allow multiple active rag sources per user
+
+Revision ID: e5a7c93b2d18
+Revises: d8e2b6f41c07
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c93b2d18'
+down_revision: Union[str, None] = 'd8e2b6f41c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint('active_rag_sources_user_id_key', 'active_rag_sources', type_='unique')
+    op.create_index(op.f('ix_active_rag_sources_user_id'), 'active_rag_sources', ['user_id'], unique=False)
+    op.create_unique_constraint(
+        'uq_active_rag_sources_user_id_source_id', 'active_rag_sources', ['user_id', 'source_id']
+    )
+
+
+def downgrade() -> None:
+    # Оставляем по одному (самому раннему) выбранному источнику на пользователя
+    op.execute(
+        "DELETE FROM active_rag_sources a USING active_rag_sources b "
+        "WHERE a.user_id = b.user_id AND (a.created_at, a.id) > (b.created_at, b.id)"
+    )
+    op.drop_constraint('uq_active_rag_sources_user_id_source_id', 'active_rag_sources', type_='unique')
+    op.drop_index(op.f('ix_active_rag_sources_user_id'), table_name='active_rag_sources')
+    op.create_unique_constraint('active_rag_sources_user_id_key', 'active_rag_sources', ['user_id'])
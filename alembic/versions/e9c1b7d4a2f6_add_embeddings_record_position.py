@@ -0,0 +1,30 @@
+"""Add embeddings record position
+
+Revision ID: e9c1b7d4a2f6
+Revises: b4e8f2a9c613
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9c1b7d4a2f6'
+down_revision: Union[str, None] = 'b4e8f2a9c613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('embeddings', sa.Column('row_start', sa.Integer(), nullable=True, comment='First spreadsheet row of the chunk document (from 1)'))
+    op.add_column('embeddings', sa.Column('row_end', sa.Integer(), nullable=True, comment='Last spreadsheet row of the chunk document (from 1)'))
+    op.add_column('embeddings', sa.Column('json_pointer', sa.String(), nullable=True, comment='RFC 6901 pointer of the JSON record'))
+
+
+def downgrade() -> None:
+    op.drop_column('embeddings', 'json_pointer')
+    op.drop_column('embeddings', 'row_end')
+    op.drop_column('embeddings', 'row_start')
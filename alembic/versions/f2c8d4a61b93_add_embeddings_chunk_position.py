@@ -0,0 +1,30 @@
+"""Add embeddings chunk position
+
+Revision ID: f2c8d4a61b93
+Revises: e5a7c93b2d18
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8d4a61b93'
+down_revision: Union[str, None] = 'e5a7c93b2d18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('embeddings', sa.Column('page', sa.Integer(), nullable=True, comment='Page number in the source file (from 1)'))
+    op.add_column('embeddings', sa.Column('sheet', sa.String(), nullable=True, comment='Spreadsheet sheet name'))
+    op.add_column('embeddings', sa.Column('char_offset', sa.Integer(), nullable=True, comment='Chunk start offset in the page/sheet text'))
+
+
+def downgrade() -> None:
+    op.drop_column('embeddings', 'char_offset')
+    op.drop_column('embeddings', 'sheet')
+    op.drop_column('embeddings', 'page')
@@ -0,0 +1,200 @@
+"""Бенчмарк ANN индексов pgvector: задержка и recall@k в зависимости от ef_search / probes.
+
+Создает отдельную таблицу bench_embeddings с синтетическими кластеризованными векторами
+(по умолчанию 1M x 512), считает точный top-k последовательным сканированием и сравнивает
+с результатами HNSW и IVFFlat индексов.
+
+Отдельно измеряется поиск с фильтром по маленькому источнику (--small-source-rows строк):
+обычный обход HNSW, hnsw.iterative_scan (pgvector 0.8+) и точное сканирование по индексу
+source_id, как в SearchService для источников меньше RAG_EXACT_SCAN_MAX_ROWS.
+
+Запуск:
+    python -m benchmarks.ann_index_benchmark --rows 1000000 --queries 200
+"""
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+import psycopg2
+from pgvector.psycopg2 import register_vector
+
+from configs.config import config
+
+DIM = 512
+TABLE = "bench_embeddings"
+
+
+def make_vectors(rows: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Кластеризованные векторы ближе к реальным эмбеддингам, чем равномерный шум."""
+    centers = rng.standard_normal((clusters, DIM)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((rows, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_table(conn, rows: int, sources: int, batch: int, rng: np.random.Generator) -> None:
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cur.execute(
+            f"CREATE TABLE {TABLE} (id bigserial PRIMARY KEY, source_id int NOT NULL, "
+            f"vector_512 vector({DIM}) NOT NULL)"
+        )
+    conn.commit()
+
+    loaded = 0
+    started = time.perf_counter()
+    while loaded < rows:
+        size = min(batch, rows - loaded)
+        vectors = make_vectors(size, clusters=64, rng=rng)
+        source_ids = rng.integers(0, sources, size=size)
+        buffer = io.StringIO()
+        for source_id, vector in zip(source_ids, vectors):
+            buffer.write(f"{source_id}\t[{','.join(f'{x:.6f}' for x in vector)}]\n")
+        buffer.seek(0)
+        with conn.cursor() as cur:
+            cur.copy_expert(f"COPY {TABLE} (source_id, vector_512) FROM STDIN", buffer)
+        conn.commit()
+        loaded += size
+        print(f"loaded {loaded}/{rows} rows ({time.perf_counter() - started:.0f}s)")
+
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE INDEX {TABLE}_source_id ON {TABLE} (source_id)")
+    conn.commit()
+
+
+def load_small_source(conn, source_id: int, rows: int, rng: np.random.Generator) -> None:
+    """Маленький источник среди миллиона строк: его векторы из тех же кластеров."""
+    vectors = make_vectors(rows, clusters=64, rng=rng)
+    buffer = io.StringIO()
+    for vector in vectors:
+        buffer.write(f"{source_id}\t[{','.join(f'{x:.6f}' for x in vector)}]\n")
+    buffer.seek(0)
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {TABLE} WHERE source_id = %s", (source_id,))
+        cur.copy_expert(f"COPY {TABLE} (source_id, vector_512) FROM STDIN", buffer)
+    conn.commit()
+
+
+def build_index(conn, method: str) -> float:
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {TABLE}_ann")
+        cur.execute("SET maintenance_work_mem = '2GB'")
+        with_clause = "m = 16, ef_construction = 64" if method == "hnsw" else "lists = 1000"
+        started = time.perf_counter()
+        cur.execute(
+            f"CREATE INDEX {TABLE}_ann ON {TABLE} USING {method} "
+            f"(vector_512 vector_cosine_ops) WITH ({with_clause})"
+        )
+        elapsed = time.perf_counter() - started
+        cur.execute(f"SELECT pg_size_pretty(pg_relation_size('{TABLE}_ann'))")
+        print(f"{method} index built in {elapsed:.1f}s, size {cur.fetchone()[0]}")
+    conn.commit()
+    return elapsed
+
+
+def query_top_k(
+        conn, query: np.ndarray, k: int, settings: dict, source_id: int = None, exact: bool = False
+) -> tuple[list[int], float]:
+    """top-k по всей таблице или по одному источнику; exact - сортировка мимо ANN индекса."""
+    where = "" if source_id is None else f"WHERE source_id = {int(source_id)}"
+    order = "(vector_512 <=> %s) + 0" if exact else "vector_512 <=> %s"
+    with conn.cursor() as cur:
+        for name, value in settings.items():
+            cur.execute(f"SET LOCAL {name} = {value}")
+        started = time.perf_counter()
+        cur.execute(f"SELECT id FROM {TABLE} {where} ORDER BY {order} LIMIT %s", (query, k))
+        ids = [row[0] for row in cur.fetchall()]
+        elapsed = time.perf_counter() - started
+    conn.commit()
+    return ids, elapsed
+
+
+def report(label: str, truth: list[list[int]], results: list[list[int]], latencies: list[float], k: int) -> None:
+    recall = statistics.mean(len(set(t) & set(r)) / k for t, r in zip(truth, results))
+    returned = statistics.mean(len(r) for r in results)
+    latencies_ms = sorted(x * 1000 for x in latencies)
+    p95 = latencies_ms[int(len(latencies_ms) * 0.95) - 1]
+    print(
+        f"{label:<32} recall@{k}={recall:.3f}  rows={returned:.1f}  "
+        f"p50={statistics.median(latencies_ms):.2f}ms  p95={p95:.2f}ms"
+    )
+
+
+def run_queries(conn, queries: np.ndarray, k: int, settings: dict, **kwargs) -> tuple[list[list[int]], list[float]]:
+    results, latencies = [], []
+    for query in queries:
+        ids, elapsed = query_top_k(conn, query, k, settings, **kwargs)
+        results.append(ids)
+        latencies.append(elapsed)
+    return results, latencies
+
+
+def filtered_search(conn, queries: np.ndarray, k: int, source_id: int, ef_search: int) -> None:
+    """Поиск по маленькому источнику с фильтром source_id через общий HNSW индекс."""
+    truth, latencies = run_queries(conn, queries, k, {}, source_id=source_id, exact=True)
+    report("filtered exact scan", truth, truth, latencies, k)
+
+    results, latencies = run_queries(conn, queries, k, {"hnsw.ef_search": ef_search}, source_id=source_id)
+    report(f"filtered hnsw ef_search={ef_search}", truth, results, latencies, k)
+
+    for mode in ("relaxed_order", "strict_order"):
+        settings = {"hnsw.ef_search": ef_search, "hnsw.iterative_scan": mode}
+        try:
+            results, latencies = run_queries(conn, queries, k, settings, source_id=source_id)
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"filtered hnsw {mode}: not supported ({str(e).strip()})")
+            continue
+        report(f"filtered hnsw {mode}", truth, results, latencies, k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=config.db.url.replace("postgresql+psycopg2", "postgresql"))
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sources", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--small-source-rows", type=int, default=1000, help="Строк маленького источника, 0 - без него")
+    parser.add_argument("--skip-load", action="store_true", help="Использовать уже загруженную таблицу")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    conn = psycopg2.connect(args.dsn)
+    register_vector(conn)
+
+    if not args.skip_load:
+        load_table(conn, args.rows, args.sources, args.batch, rng)
+    small_source_id = args.sources
+    if args.small_source_rows and not args.skip_load:
+        load_small_source(conn, small_source_id, args.small_source_rows, rng)
+
+    queries = make_vectors(args.queries, clusters=64, rng=rng)
+
+    # Точный ответ: индексы отключены, последовательное сканирование
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {TABLE}_ann")
+    conn.commit()
+    truth, latencies = run_queries(conn, queries, args.k, {"enable_indexscan": "off"})
+    report("seq scan", truth, truth, latencies, args.k)
+
+    build_index(conn, "hnsw")
+    for ef_search in (10, 20, 40, 80, 160, 320):
+        results, latencies = run_queries(conn, queries, args.k, {"hnsw.ef_search": ef_search})
+        report(f"hnsw ef_search={ef_search}", truth, results, latencies, args.k)
+    if args.small_source_rows:
+        filtered_search(conn, queries, args.k, small_source_id, config.vector_index.hnsw_ef_search)
+
+    build_index(conn, "ivfflat")
+    for probes in (1, 5, 10, 20, 50, 100):
+        results, latencies = run_queries(conn, queries, args.k, {"ivfflat.probes": probes})
+        report(f"ivfflat probes={probes}", truth, results, latencies, args.k)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Бенчмарк политик чанкинга: размер индекса и качество поиска.
+
+Разбирает файлы каталога теми же загрузчиками, что и индексация, режет документы
+каждой политикой (по умолчанию legacy - прежние 500/200 символов - и tokens) и считает:
+число чанков, примерный размер строк embeddings, долю чанков длиннее входа модели
+(их хвост модель отбрасывает при векторизации), время векторизации, а также
+hit@k и MRR на запросах-предложениях, выбранных из самих документов. Чанк считается
+релевантным, если он из того же документа и покрывает середину предложения.
+
+Поиск - точный косинусный в памяти, БД не нужна.
+
+Запуск:
+    python -m benchmarks.chunking_benchmark --path ./data/01_latoken --queries 300 --k 5
+"""
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+
+from configs.config import config
+from services.chunking_service import CHUNK_POLICIES, DocumentChunker, resolve_policy
+from services.embedding_service import model_registry
+from services.rag_service import load_file_documents
+
+# Вектор 512 x float4 + заголовок pgvector, uuid, две метки времени, хэши и uuid источника
+ROW_OVERHEAD_BYTES = 512 * 4 + 8 + 16 + 8 * 2 + 64 * 2 + 16
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]{40,300}[.!?]")
+
+
+def load_documents(path: str) -> list[tuple[str, str, dict]]:
+    documents = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            for text, metadata in load_file_documents(file_path):
+                documents.append((os.path.relpath(file_path, path), text, metadata))
+    return documents
+
+
+def sample_queries(documents: list, count: int, rng: np.random.Generator) -> list[tuple[int, int, str]]:
+    """(номер документа, середина предложения в тексте, предложение)."""
+    sentences = [
+        (doc_index, (match.start() + match.end()) // 2, match.group().strip())
+        for doc_index, (_, text, _) in enumerate(documents)
+        for match in SENTENCE_PATTERN.finditer(text)
+    ]
+    if not sentences:
+        raise SystemExit("Не найдено предложений для запросов")
+    picked = rng.choice(len(sentences), size=min(count, len(sentences)), replace=False)
+    return [sentences[i] for i in picked]
+
+
+def encode(model_name: str, texts: list[str]) -> np.ndarray:
+    model = model_registry.get(model_name)
+    return model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def run_policy(model_name: str, policy_name: str, documents: list, queries: list, query_vectors: np.ndarray,
+               k: int) -> dict:
+    chunker = DocumentChunker(model_name, resolve_policy(policy_name, 0, -1))
+    max_tokens = DocumentChunker.max_tokens(model_name)
+    tokenizer = model_registry.get(model_name).tokenizer
+
+    chunks, spans = [], []
+    started = time.perf_counter()
+    for doc_index, (_, text, metadata) in enumerate(documents):
+        for chunk in chunker.split(text, metadata):
+            offset = chunk.metadata["char_offset"] or 0
+            chunks.append(chunk.text)
+            spans.append((doc_index, offset, offset + len(chunk.text)))
+    chunk_seconds = time.perf_counter() - started
+
+    token_lengths = np.array([len(tokenizer.encode(chunk, add_special_tokens=False)) for chunk in chunks])
+    index_bytes = sum(ROW_OVERHEAD_BYTES + len(chunk.encode("utf-8")) for chunk in chunks)
+
+    started = time.perf_counter()
+    chunk_vectors = encode(model_name, chunks)
+    embed_seconds = time.perf_counter() - started
+
+    hits, reciprocal_ranks = 0, []
+    top = np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :k]
+    for (doc_index, position, _), ranking in zip(queries, top):
+        rank = next(
+            (
+                i + 1 for i, chunk_index in enumerate(ranking)
+                if spans[chunk_index][0] == doc_index and spans[chunk_index][1] <= position < spans[chunk_index][2]
+            ),
+            None,
+        )
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    return {
+        "policy": policy_name,
+        "chunks": len(chunks),
+        "index_mb": index_bytes / 2 ** 20,
+        "avg_tokens": float(token_lengths.mean()) if len(chunks) else 0.0,
+        "truncated": float((token_lengths > max_tokens).mean()) if len(chunks) else 0.0,
+        "chunk_s": chunk_seconds,
+        "embed_s": embed_seconds,
+        f"hit@{k}": hits / len(queries),
+        "mrr": float(np.mean(reciprocal_ranks)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", required=True, help="Каталог с документами (распакованный архив)")
+    parser.add_argument("--model", default=config.RAG_EMBED_MODEL)
+    parser.add_argument("--policies", default=",".join(CHUNK_POLICIES))
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    documents = load_documents(args.path)
+    print(f"{len(documents)} documents, {sum(len(text) for _, text, _ in documents)} chars")
+    queries = sample_queries(documents, args.queries, np.random.default_rng(args.seed))
+    query_vectors = encode(args.model, [sentence for _, _, sentence in queries])
+    print(f"{len(queries)} queries, max {DocumentChunker.max_tokens(args.model)} tokens per chunk\n")
+
+    results = [
+        run_policy(args.model, policy_name, documents, queries, query_vectors, args.k)
+        for policy_name in args.policies.split(",")
+    ]
+    columns = list(results[0])
+    print(" | ".join(f"{column:>10}" for column in columns))
+    for result in results:
+        print(" | ".join(
+            f"{value:>10.3f}" if isinstance(value, float) else f"{value:>10}" for value in result.values()
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Сравнение бэкендов модели эмбеддингов: PyTorch, ONNX Runtime и ONNX int8.
+
+Проверка совпадения: косинус между векторами PyTorch и каждого ONNX варианта на одних
+и тех же текстах (min / mean). Если min ниже --min-cosine, скрипт завершается с кодом 1,
+так что его можно запускать как проверку перед переключением RAG_EMBED_BACKEND.
+
+Замеры: загрузка модели, задержка одного запроса (p50 / p95, как в /qviz) и пропускная
+способность пачки чанков (как при индексации) через InferenceEngine.
+
+Запуск:
+    python -m benchmarks.embedding_backend_benchmark --quantization avx512_vnni
+    python -m benchmarks.embedding_backend_benchmark --quantization avx2 --bulk 5000 --min-cosine 0.98
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.inference_benchmark import make_texts
+from configs.config import config
+from services.embedding_service import EmbeddingModelRegistry
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_backend(label: str, registry: EmbeddingModelRegistry, model_name: str, queries: list[str],
+                bulk: list[str]) -> np.ndarray:
+    registry.get(model_name)
+    stats = registry.stats()[model_name]
+    engine = registry.engine(model_name)
+
+    engine.encode(queries[:5])  # прогрев
+    latencies_ms = []
+    for query in queries:
+        started = time.perf_counter()
+        engine.encode([query])
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+    latencies_ms.sort()
+    p95 = latencies_ms[int(len(latencies_ms) * 0.95) - 1]
+
+    started = time.perf_counter()
+    vectors = engine.encode(bulk)
+    bulk_seconds = time.perf_counter() - started
+
+    print(
+        f"{label:<20} load {stats.load_seconds:5.1f}s  query p50={statistics.median(latencies_ms):.1f}ms "
+        f"p95={p95:.1f}ms  bulk {len(bulk) / bulk_seconds:.1f} chunks/s"
+    )
+    engine.close()
+    return vectors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=config.RAG_EMBED_MODEL)
+    parser.add_argument("--quantization", default=config.inference.onnx_quantization or "avx2",
+                        help="arm64, avx2, avx512, avx512_vnni или пусто - без int8 варианта")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--bulk", type=int, default=2000)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    queries = make_texts(args.queries, rng)
+    bulk = make_texts(args.bulk, rng)
+
+    backends = [("torch", EmbeddingModelRegistry(backend="torch")), ("onnx", EmbeddingModelRegistry(backend="onnx"))]
+    if args.quantization:
+        backends.append((
+            f"onnx int8 {args.quantization}",
+            EmbeddingModelRegistry(backend="onnx", onnx_quantization=args.quantization),
+        ))
+
+    reference = None
+    failed = False
+    for label, registry in backends:
+        vectors = normalize(run_backend(label, registry, args.model, queries, bulk))
+        if reference is None:
+            reference = vectors
+            continue
+        cosines = np.sum(reference * vectors, axis=1)
+        passed = cosines.min() >= args.min_cosine
+        failed |= not passed
+        print(
+            f"{'':<20} parity vs torch: min cosine {cosines.min():.4f}, mean {cosines.mean():.4f} "
+            f"({'OK' if passed else f'below {args.min_cosine}'})"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
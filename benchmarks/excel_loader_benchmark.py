@@ -0,0 +1,91 @@
+"""Бенчмарк памяти и времени разбора Excel: прежний загрузчик против потокового ExcelLoader.
+
+Генерирует книгу (по умолчанию 500k строк x 8 колонок на двух листах) в write-only режиме
+openpyxl и разбирает ее в отдельных процессах, чтобы пик RSS каждого способа
+считался независимо:
+    legacy - load_workbook в полном режиме, активный лист одной строкой (как раньше);
+    stream - ExcelLoader: read-only режим, все листы, документы по группам строк.
+
+Запуск:
+    python -m benchmarks.excel_loader_benchmark --rows 500000
+    python -m benchmarks.excel_loader_benchmark --path big.xlsx --modes stream
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import openpyxl
+
+from utils.custom_loaders import ExcelLoader
+
+
+def make_workbook(path: str, rows: int, columns: int, sheets: int) -> None:
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_index in range(sheets):
+        sheet = workbook.create_sheet(f"Sheet{sheet_index + 1}")
+        sheet.append([f"column_{column}" for column in range(columns)])
+        for row in range(rows // sheets):
+            sheet.append([
+                row if column == 0 else f"value {row}-{column}" if column % 2 else row * 0.5
+                for column in range(columns)
+            ])
+    workbook.save(path)
+
+
+def legacy_load(path: str) -> tuple[int, int]:
+    workbook = openpyxl.load_workbook(path)
+    sheet = workbook.active
+    rows = ["\t".join("" if cell is None else str(cell) for cell in row) for row in sheet.iter_rows(values_only=True)]
+    text = "\n".join(rows)
+    return 1, len(text)
+
+
+def stream_load(path: str) -> tuple[int, int]:
+    documents = chars = 0
+    for document in ExcelLoader(path, header=True).lazy_load():
+        documents += 1
+        chars += len(document.page_content)
+    return documents, chars
+
+
+def _measure(mode: str, path: str, queue: multiprocessing.Queue) -> None:
+    started = time.perf_counter()
+    documents, chars = (legacy_load if mode == "legacy" else stream_load)(path)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss в Linux возвращается в килобайтах
+    queue.put((documents, chars, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", help="Готовая книга; без него генерируется временная")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--sheets", type=int, default=2)
+    parser.add_argument("--modes", default="legacy,stream")
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), f"excel_bench_{args.rows}.xlsx")
+        if not os.path.exists(path):
+            started = time.perf_counter()
+            make_workbook(path, args.rows, args.columns, args.sheets)
+            print(f"generated {path} in {time.perf_counter() - started:.1f}s")
+    print(f"{path}: {os.path.getsize(path) / 2 ** 20:.1f} MB\n")
+
+    context = multiprocessing.get_context("spawn")
+    for mode in args.modes.split(","):
+        queue = context.Queue()
+        process = context.Process(target=_measure, args=(mode, path, queue))
+        process.start()
+        documents, chars, elapsed, peak_mb = queue.get()
+        process.join()
+        print(f"{mode:<8} {elapsed:7.1f}s  peak RSS {peak_mb:8.1f} MB  {documents} documents, {chars} chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Бенчмарк пропускной способности векторизации на CPU (чанков в секунду).
+
+Сравнивает прежний вызов model.encode(texts) с InferenceEngine при разных размерах
+батча, бюджетах токенов, числе потоков torch и процессов. Тексты - синтетические
+чанки разной длины (как после чанкинга реальных документов), либо строки файла --texts.
+
+Запуск:
+    python -m benchmarks.inference_benchmark --count 5000
+    python -m benchmarks.inference_benchmark --texts chunks.txt --threads 4,8 --processes 0,2
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from configs.config import config
+from services.embedding_service import model_registry
+from services.inference_engine import InferenceEngine
+
+WORDS = (
+    "токен блокчейн биржа актив культура команда хакатон продукт пользователь ответ вопрос "
+    "exchange token market liquidity listing wallet trading security culture deck"
+).split()
+
+
+def make_texts(count: int, rng: np.random.Generator) -> list[str]:
+    lengths = rng.integers(5, 120, size=count)
+    return [" ".join(rng.choice(WORDS, size=length)) for length in lengths]
+
+
+def measure(label: str, encode, texts: list[str]) -> None:
+    started = time.perf_counter()
+    encode(texts)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<48} {elapsed:7.2f}s  {len(texts) / elapsed:8.1f} chunks/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=config.RAG_EMBED_MODEL)
+    parser.add_argument("--texts", help="Файл с текстами, по одному на строку")
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--batch-sizes", default="32,64,128")
+    parser.add_argument("--max-batch-tokens", default="4096,8192")
+    parser.add_argument("--threads", default="0", help="Потоки torch через запятую (0 - по умолчанию)")
+    parser.add_argument("--processes", default="0", help="Размеры пула процессов через запятую")
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as file:
+            texts = [line.strip() for line in file if line.strip()]
+    else:
+        texts = make_texts(args.count, np.random.default_rng(42))
+
+    model = model_registry.get(args.model)
+    print(f"{len(texts)} texts, model {args.model}, torch threads {torch.get_num_threads()}\n")
+    measure("model.encode (defaults)", lambda items: model.encode(items, convert_to_numpy=True), texts)
+
+    for threads in map(int, args.threads.split(",")):
+        if threads:
+            torch.set_num_threads(threads)
+        for processes in map(int, args.processes.split(",")):
+            for batch_size in map(int, args.batch_sizes.split(",")):
+                for max_batch_tokens in map(int, args.max_batch_tokens.split(",")):
+                    engine = InferenceEngine(
+                        model, batch_size=batch_size, max_batch_tokens=max_batch_tokens,
+                        torch_threads=threads, processes=processes, multi_process_min_texts=1,
+                    )
+                    try:
+                        measure(
+                            f"engine threads={threads or torch.get_num_threads()} processes={processes} "
+                            f"batch={batch_size} tokens={max_batch_tokens}",
+                            engine.encode,
+                            texts,
+                        )
+                        print(f"{'':<48} padding {engine.stats.padding_ratio:.1%}")
+                    finally:
+                        engine.close()
+
+
+if __name__ == "__main__":
+    main()
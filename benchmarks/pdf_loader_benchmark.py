@@ -0,0 +1,124 @@
+"""Бенчмарк пропускной способности разбора PDF: PyPDFLoader против ParallelPDFLoader.
+
+Генерирует синтетический PDF (по умолчанию 1000 страниц): страницы с текстом
+шрифтом Helvetica, а также пустые страницы и страницы только с картинкой
+(каждая --blank-every и --image-every страница), которые ParallelPDFLoader
+отбрасывает без извлечения текста. Результат - страниц в секунду для каждого
+числа процессов из --workers.
+
+Запуск:
+    python -m benchmarks.pdf_loader_benchmark --pages 1000
+    python -m benchmarks.pdf_loader_benchmark --path big.pdf --workers 1,2,4,8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
+
+from utils.custom_loaders import ParallelPDFLoader
+
+WORDS = (
+    "token blockchain exchange asset culture team hackathon product user answer question "
+    "market liquidity listing wallet trading security deck"
+).split()
+
+
+def _text_stream(page: int, lines: int) -> bytes:
+    rows = [f"BT /F1 10 Tf 50 {780 - 14 * line} Td" for line in range(lines)]
+    body = "\n".join(
+        f"{row} (Page {page} line {line}: {' '.join(WORDS[(page + line + i) % len(WORDS)] for i in range(12))}) Tj ET"
+        for line, row in enumerate(rows)
+    )
+    return body.encode("latin-1")
+
+
+def make_pdf(path: str, pages: int, lines: int, blank_every: int, image_every: int) -> None:
+    """Минимальный PDF без внешних зависимостей: каталог, дерево страниц, шрифт, картинка."""
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def stream(content: bytes, extra: bytes = b"") -> bytes:
+        return b"<< /Length %d %s>>\nstream\n%s\nendstream" % (len(content), extra, content)
+
+    catalog = add(b"")
+    pages_id = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    image = add(stream(b"\xff\x00" * 32, b"/Type /XObject /Subtype /Image /Width 8 /Height 8 "
+                                           b"/ColorSpace /DeviceGray /BitsPerComponent 8 "))
+    image_content = add(stream(b"q 200 0 0 200 100 400 cm /Im1 Do Q"))
+
+    kids = []
+    for page in range(pages):
+        if blank_every and page % blank_every == blank_every - 1:
+            resources, contents = b"<< >>", b""
+        elif image_every and page % image_every == image_every - 1:
+            resources, contents = b"<< /XObject << /Im1 %d 0 R >> >>" % image, b"/Contents %d 0 R" % image_content
+        else:
+            resources = b"<< /Font << /F1 %d 0 R >> >>" % font
+            contents = b"/Contents %d 0 R" % add(stream(_text_stream(page, lines)))
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources %s %s >>"
+            % (pages_id, resources, contents)
+        ))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    with open(path, "wb") as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        file.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+
+
+def measure(label: str, loader, pages: int) -> None:
+    started = time.perf_counter()
+    documents = chars = 0
+    for document in loader.lazy_load():
+        if document.page_content.strip():
+            documents += 1
+            chars += len(document.page_content)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:7.2f}s  {pages / elapsed:8.1f} pages/s  {documents} documents, {chars} chars")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", help="Готовый PDF; без него генерируется временный")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=45, help="Строк текста на странице")
+    parser.add_argument("--blank-every", type=int, default=10)
+    parser.add_argument("--image-every", type=int, default=7)
+    parser.add_argument("--workers", default=f"1,2,{os.cpu_count() or 1}")
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), f"pdf_bench_{args.pages}.pdf")
+        make_pdf(path, args.pages, args.lines, args.blank_every, args.image_every)
+    pages = len(PdfReader(path).pages)
+    print(f"{path}: {pages} pages, {os.path.getsize(path) / 2 ** 20:.1f} MB\n")
+
+    measure("PyPDFLoader", PyPDFLoader(path), pages)
+    for workers in sorted(set(map(int, args.workers.split(",")))):
+        loader = ParallelPDFLoader(path, workers=workers, pages_per_task=args.pages_per_task, min_parallel_pages=1)
+        measure(f"ParallelPDFLoader workers={workers}", loader, pages)
+        print(f"{'':<28} skipped {loader.skipped_pages} empty/image-only pages")
+
+
+if __name__ == "__main__":
+    main()
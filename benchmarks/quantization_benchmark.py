@@ -0,0 +1,166 @@
+"""Бенчмарк режимов хранения векторов: размер индекса, задержка и recall@k.
+
+Часть 1 (pgvector): на таблице bench_embeddings из ann_index_benchmark строит HNSW индекс
+по каждому представлению (float32, halfvec, binary) и выполняет тот же запрос, что
+SearchService: компактный индекс отбирает k * rescore_factor строк, они пересчитываются
+по float32. Recall считается относительно точного top-k последовательным сканированием.
+
+Часть 2 (numpy, без БД): полный перебор по float16, int8 (скалярное квантование
+по максимуму модуля вектора) и binary - recall@k до и после пересчета по float32 и байты
+на вектор. int8 есть только здесь: в pgvector нет int8 типа и операторов индекса.
+
+Запуск:
+    python -m benchmarks.quantization_benchmark --rows 1000000 --queries 200
+    python -m benchmarks.quantization_benchmark --skip-load --memory-rows 200000
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import psycopg2
+from pgvector.psycopg2 import register_vector
+
+from benchmarks.ann_index_benchmark import DIM, TABLE, load_table, make_vectors, report
+from configs.config import config
+from db.repos.vector_index_repo import VECTOR_STORAGE_INDEX_EXPRESSIONS
+
+COARSE_DISTANCES = {
+    "float32": "vector_512 <=> %(query)s",
+    "halfvec": f"vector_512::halfvec({DIM}) <=> %(query)s::halfvec({DIM})",
+    "binary": f"binary_quantize(vector_512)::bit({DIM}) <~> binary_quantize(%(query)s::vector({DIM}))",
+}
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def build_storage_index(conn, storage: str) -> str:
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {TABLE}_ann")
+        cur.execute("SET maintenance_work_mem = '2GB'")
+        started = time.perf_counter()
+        cur.execute(
+            f"CREATE INDEX {TABLE}_ann ON {TABLE} USING hnsw ({VECTOR_STORAGE_INDEX_EXPRESSIONS[storage]}) "
+            f"WITH (m = 16, ef_construction = 64)"
+        )
+        elapsed = time.perf_counter() - started
+        cur.execute(f"SELECT pg_size_pretty(pg_relation_size('{TABLE}_ann'))")
+        size = cur.fetchone()[0]
+    conn.commit()
+    print(f"{storage} index built in {elapsed:.1f}s, size {size}")
+    return size
+
+
+def query_rescored(conn, storage: str, query: np.ndarray, k: int, coarse_limit: int) -> tuple[list[int], float]:
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL hnsw.ef_search = {max(int(config.vector_index.hnsw_ef_search), coarse_limit)}")
+        started = time.perf_counter()
+        if storage == "float32":
+            cur.execute(
+                f"SELECT id FROM {TABLE} ORDER BY vector_512 <=> %(query)s LIMIT %(k)s",
+                {"query": query, "k": k},
+            )
+        else:
+            cur.execute(
+                f"SELECT id FROM {TABLE} WHERE id IN ("
+                f"SELECT id FROM {TABLE} ORDER BY {COARSE_DISTANCES[storage]} LIMIT %(coarse_limit)s"
+                f") ORDER BY vector_512 <=> %(query)s LIMIT %(k)s",
+                {"query": query, "k": k, "coarse_limit": coarse_limit},
+            )
+        ids = [row[0] for row in cur.fetchall()]
+        elapsed = time.perf_counter() - started
+    conn.commit()
+    return ids, elapsed
+
+
+def exact_top_k(conn, queries: np.ndarray, k: int) -> list[list[int]]:
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {TABLE}_ann")
+    conn.commit()
+    truth = []
+    for query in queries:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT id FROM {TABLE} ORDER BY vector_512 <=> %s LIMIT %s", (query, k))
+            truth.append([row[0] for row in cur.fetchall()])
+        conn.commit()
+    return truth
+
+
+def quantize_int8(vectors: np.ndarray) -> np.ndarray:
+    """Симметричное квантование по максимуму модуля: косинус от масштаба вектора не зависит."""
+    scale = np.abs(vectors).max(axis=1, keepdims=True) / 127
+    return np.round(vectors / np.maximum(scale, 1e-12)).astype(np.int8)
+
+
+def memory_benchmark(rows: int, queries: np.ndarray, k: int, rescore_factor: int, rng: np.random.Generator) -> None:
+    vectors = make_vectors(rows, clusters=64, rng=rng)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+    codes = {
+        "float16": (vectors.astype(np.float16), queries.astype(np.float16), 2 * DIM),
+        "int8": (quantize_int8(vectors), quantize_int8(queries), DIM),
+        "binary": (np.packbits(vectors > 0, axis=1), np.packbits(queries > 0, axis=1), DIM // 8),
+    }
+    print(f"\nnumpy brute force, {rows} vectors, float32 = {4 * DIM} bytes/vector")
+    for name, (stored, encoded_queries, vector_bytes) in codes.items():
+        started = time.perf_counter()
+        if name == "binary":
+            # Хэмминг: popcount XOR упакованных бит, по одному запросу, чтобы не раздувать память
+            scores = np.vstack([-_POPCOUNT[query ^ stored].sum(axis=1, dtype=np.int32) for query in encoded_queries])
+        else:
+            scores = encoded_queries.astype(np.float32) @ stored.astype(np.float32).T
+        coarse = np.argsort(-scores, axis=1, kind="stable")
+        elapsed = (time.perf_counter() - started) / len(queries)
+
+        coarse_recall = statistics.mean(len(set(t) & set(c[:k])) / k for t, c in zip(truth, coarse))
+        rescored = [
+            pool[np.argsort(-(vectors[pool] @ query))][:k]
+            for pool, query in zip(coarse[:, :k * rescore_factor], queries)
+        ]
+        rescored_recall = statistics.mean(len(set(t) & set(r)) / k for t, r in zip(truth, rescored))
+        print(
+            f"{name:<8} {vector_bytes:>5} bytes/vector  recall@{k}={coarse_recall:.3f}  "
+            f"rescored x{rescore_factor} recall@{k}={rescored_recall:.3f}  {elapsed * 1000:.1f}ms/query"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=config.db.url.replace("postgresql+psycopg2", "postgresql"))
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sources", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=config.vector_index.rescore_factor)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--memory-rows", type=int, default=100_000)
+    parser.add_argument("--skip-load", action="store_true", help="Использовать уже загруженную таблицу")
+    parser.add_argument("--skip-db", action="store_true", help="Только сравнение в памяти")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    queries = make_vectors(args.queries, clusters=64, rng=rng)
+
+    if not args.skip_db:
+        conn = psycopg2.connect(args.dsn)
+        register_vector(conn)
+        if not args.skip_load:
+            load_table(conn, args.rows, args.sources, args.batch, rng)
+
+        truth = exact_top_k(conn, queries, args.k)
+        coarse_limit = args.k * args.rescore_factor
+        for storage in VECTOR_STORAGE_INDEX_EXPRESSIONS:
+            size = build_storage_index(conn, storage)
+            results, latencies = [], []
+            for query in queries:
+                ids, elapsed = query_rescored(conn, storage, query, args.k, coarse_limit)
+                results.append(ids)
+                latencies.append(elapsed)
+            report(f"{storage} ({size})", truth, results, latencies, args.k)
+        conn.close()
+
+    memory_benchmark(args.memory_rows, queries, args.k, args.rescore_factor, rng)
+
+
+if __name__ == "__main__":
+    main()
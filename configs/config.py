@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dataclasses import dataclass, field
 
 
@@ -10,10 +11,167 @@ class DatabaseConfig:
     port: str = os.getenv('POSTGRES_PORT', '5432')
     database: str = os.getenv('POSTGRES_DB', 'db_latoken')
 
+    # Асинхронный движок для обработчиков бота
+    async_driver: str = os.getenv('POSTGRES_ASYNC_DRIVER', "postgresql+asyncpg")
+    pool_size: int = int(os.getenv('POSTGRES_POOL_SIZE', '10'))
+    max_overflow: int = int(os.getenv('POSTGRES_MAX_OVERFLOW', '20'))
+    pool_timeout: int = int(os.getenv('POSTGRES_POOL_TIMEOUT', '30'))
+    pool_recycle: int = int(os.getenv('POSTGRES_POOL_RECYCLE', '1800'))
+
     @property
     def url(self) -> str:
         return f"{self.driver}://{self.user}@{self.host}:{self.port}/{self.database}"
 
+    @property
+    def async_url(self) -> str:
+        return f"{self.async_driver}://{self.user}@{self.host}:{self.port}/{self.database}"
+
+
+@dataclass
+class VectorIndexConfig:
+    # Параметры построения HNSW индекса
+    hnsw_m: int = int(os.getenv('RAG_HNSW_M', '16'))
+    hnsw_ef_construction: int = int(os.getenv('RAG_HNSW_EF_CONSTRUCTION', '64'))
+    # Параметры поиска (точность/скорость), выставляются на каждый запрос
+    hnsw_ef_search: int = int(os.getenv('RAG_HNSW_EF_SEARCH', '100'))
+    ivfflat_probes: int = int(os.getenv('RAG_IVFFLAT_PROBES', '10'))
+    # Итеративный обход HNSW при фильтре по source_id: off, relaxed_order, strict_order.
+    # Параметр есть только в pgvector >= 0.8, поэтому по умолчанию (пусто) не выставляется
+    hnsw_iterative_scan: str = os.getenv('RAG_HNSW_ITERATIVE_SCAN', '')
+    # Источники меньше этого порога ищутся точным сканированием без ANN индекса
+    exact_scan_max_rows: int = int(os.getenv('RAG_EXACT_SCAN_MAX_ROWS', '5000'))
+    # Источники крупнее этого порога получают собственный частичный индекс
+    source_index_min_rows: int = int(os.getenv('RAG_SOURCE_INDEX_MIN_ROWS', '20000'))
+    source_index_method: str = os.getenv('RAG_SOURCE_INDEX_METHOD', 'hnsw')
+    # Представление векторов в ANN индексе новых источников: float32, halfvec или binary
+    storage: str = os.getenv('RAG_VECTOR_STORAGE', 'float32')
+    # halfvec/binary: индекс отдает candidates * rescore_factor строк, они пересчитываются по float32
+    rescore_factor: int = int(os.getenv('RAG_VECTOR_RESCORE_FACTOR', '4'))
+
+
+@dataclass
+class IngestionConfig:
+    # Каталог, где архивы ждут индексации (нужен для восстановления после рестарта)
+    uploads_dir: str = os.getenv('RAG_UPLOADS_DIR', os.path.join(tempfile.gettempdir(), 'rag_uploads'))
+    # Сколько архивов индексируется одновременно
+    concurrent_jobs: int = int(os.getenv('RAG_INGEST_CONCURRENT_JOBS', '1'))
+    # Процессы для разбора файлов (и диапазонов страниц PDF); распаковка, чанкинг,
+    # векторизация и запись идут в потоке задачи индексации
+    process_workers: int = int(os.getenv('RAG_INGEST_PROCESS_WORKERS', '2'))
+    # Размер пачки чанков: векторизация и запись в БД идут пачками
+    batch_size: int = int(os.getenv('RAG_INGEST_BATCH_SIZE', '256'))
+    # Запись эмбеддингов через COPY (FORMAT BINARY) в staging таблицу с атомарной заменой
+    bulk_load: bool = os.getenv('RAG_INGEST_BULK_LOAD', 'true').lower() == 'true'
+    # Строк COPY в одной транзакции
+    copy_batch_rows: int = int(os.getenv('RAG_INGEST_COPY_BATCH_ROWS', '5000'))
+    # Переиндексация пишет новую версию источника, поиск переключается на нее после завершения
+    source_versioning: bool = os.getenv('RAG_SOURCE_VERSIONING', 'true').lower() == 'true'
+    # Замененные версии удаляются в фоне не раньше чем через grace секунд после переключения
+    version_gc_interval: float = float(os.getenv('RAG_VERSION_GC_INTERVAL', '300'))
+    version_gc_grace: float = float(os.getenv('RAG_VERSION_GC_GRACE', '120'))
+    # Распаковка: stream - файлы читаются прямо из ZIP, patool - старая распаковка через каталог
+    extraction_mode: str = os.getenv('RAG_ARCHIVE_EXTRACTION', 'stream')
+    # Защита от zip-бомб
+    max_archive_members: int = int(os.getenv('RAG_ARCHIVE_MAX_MEMBERS', '2000'))
+    max_uncompressed_bytes: int = int(os.getenv('RAG_ARCHIVE_MAX_UNCOMPRESSED_MB', '200')) * 1024 * 1024
+    max_compression_ratio: int = int(os.getenv('RAG_ARCHIVE_MAX_COMPRESSION_RATIO', '100'))
+
+
+@dataclass
+class LoaderConfig:
+    # Excel: строк в одном документе и первая строка листа как подписи колонок
+    excel_rows_per_document: int = int(os.getenv('RAG_EXCEL_ROWS_PER_DOCUMENT', '50'))
+    excel_header: bool = os.getenv('RAG_EXCEL_HEADER', 'true').lower() == 'true'
+    # JSON: указатель на массив записей (RFC 6901, например /data/items) и поля записей через запятую
+    json_records_pointer: str = os.getenv('RAG_JSON_RECORDS_POINTER', '')
+    json_fields: str = os.getenv('RAG_JSON_FIELDS', '')
+    # PDF: страниц в одной задаче и минимальный размер файла, с которого страницы разбираются
+    # параллельно (при индексации - задачами в общем пуле процессов); pdf_workers - процессы
+    # ParallelPDFLoader вне пула индексации (0 - по числу CPU)
+    pdf_workers: int = int(os.getenv('RAG_PDF_WORKERS', '0'))
+    pdf_pages_per_task: int = int(os.getenv('RAG_PDF_PAGES_PER_TASK', '16'))
+    pdf_parallel_min_pages: int = int(os.getenv('RAG_PDF_PARALLEL_MIN_PAGES', '64'))
+    # Модули через запятую, регистрирующие дополнительные загрузчики в loader_registry
+    plugins: str = os.getenv('RAG_LOADER_PLUGINS', '')
+
+
+@dataclass
+class ChunkingConfig:
+    # tokens - чанки по токенам токенизатора модели эмбеддингов, legacy - прежние 500/200 символов
+    policy: str = os.getenv('RAG_CHUNK_POLICY', 'tokens')
+    # Переопределение размера и перекрытия политики (0 и -1 - значения политики)
+    chunk_size: int = int(os.getenv('RAG_CHUNK_SIZE', '0'))
+    chunk_overlap: int = int(os.getenv('RAG_CHUNK_OVERLAP', '-1'))
+
+
+@dataclass
+class TranscriptConfig:
+    # Каталог с сырыми транскриптами: переиндексация не запрашивает их повторно
+    cache_dir: str = os.getenv('RAG_TRANSCRIPT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'rag_transcripts'))
+    # Языки субтитров в порядке предпочтения
+    languages: str = os.getenv('RAG_TRANSCRIPT_LANGUAGES', 'ru,en')
+    # Сколько транскриптов запрашивается одновременно
+    concurrency: int = int(os.getenv('RAG_TRANSCRIPT_CONCURRENCY', '8'))
+    # Чанк - окно сегментов не длиннее window_seconds (и не длиннее чанка политики)
+    window_seconds: float = float(os.getenv('RAG_TRANSCRIPT_WINDOW_SECONDS', '60'))
+    max_videos: int = int(os.getenv('RAG_TRANSCRIPT_MAX_VIDEOS', '50'))
+
+
+@dataclass
+class InferenceConfig:
+    # Максимум текстов в батче модели эмбеддингов
+    batch_size: int = int(os.getenv('RAG_EMBED_BATCH_SIZE', '64'))
+    # Бюджет батча в токенах с учетом паддинга: короткие тексты идут большими батчами, длинные - малыми
+    max_batch_tokens: int = int(os.getenv('RAG_EMBED_MAX_BATCH_TOKENS', '8192'))
+    # Потоки torch (и ONNX Runtime при backend = onnx) в процессе бота (0 - по умолчанию)
+    torch_threads: int = int(os.getenv('RAG_EMBED_TORCH_THREADS', '0'))
+    # Пул процессов для больших пачек (0 - выключен), каждый процесс держит свою копию модели
+    processes: int = int(os.getenv('RAG_EMBED_PROCESSES', '0'))
+    multi_process_min_texts: int = int(os.getenv('RAG_EMBED_MULTI_PROCESS_MIN_TEXTS', '2000'))
+    # Бэкенд модели: torch или onnx (ONNX Runtime, нужен пакет optimum[onnxruntime])
+    backend: str = os.getenv('RAG_EMBED_BACKEND', 'torch')
+    # Динамическое int8 квантование ONNX модели под набор инструкций CPU:
+    # arm64, avx2, avx512, avx512_vnni (пусто - без квантования)
+    onnx_quantization: str = os.getenv('RAG_EMBED_ONNX_QUANTIZATION', '')
+    # Каталог экспортированных ONNX моделей (пусто - onnx/ в RAG_EMBED_MODELS_CACHE)
+    onnx_dir: str = os.getenv('RAG_EMBED_ONNX_DIR', '')
+
+
+@dataclass
+class EmbeddingCacheConfig:
+    enabled: bool = os.getenv('RAG_EMBED_CACHE_ENABLED', 'true').lower() == 'true'
+    # SQLite файл постоянного уровня кэша (пустая строка - только память)
+    path: str = os.getenv('RAG_EMBED_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'rag_embedding_cache.sqlite3'))
+    memory_items: int = int(os.getenv('RAG_EMBED_CACHE_MEMORY_ITEMS', '50000'))
+    max_disk_items: int = int(os.getenv('RAG_EMBED_CACHE_MAX_DISK_ITEMS', '2000000'))
+
+
+@dataclass
+class RetrievalCacheConfig:
+    enabled: bool = os.getenv('RAG_RETRIEVAL_CACHE_ENABLED', 'true').lower() == 'true'
+    ttl_seconds: float = float(os.getenv('RAG_RETRIEVAL_CACHE_TTL', '600'))
+    max_items: int = int(os.getenv('RAG_RETRIEVAL_CACHE_MAX_ITEMS', '1000'))
+
+
+@dataclass
+class AnswerCacheConfig:
+    enabled: bool = os.getenv('RAG_ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    path: str = os.getenv('RAG_ANSWER_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'rag_answer_cache.sqlite3'))
+    # Минимальное косинусное сходство вопросов, при котором ответ переиспользуется
+    similarity_threshold: float = float(os.getenv('RAG_ANSWER_CACHE_THRESHOLD', '0.95'))
+    max_age_seconds: float = float(os.getenv('RAG_ANSWER_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+    max_items: int = int(os.getenv('RAG_ANSWER_CACHE_MAX_ITEMS', '10000'))
+
+
+@dataclass
+class LLMConfig:
+    model: str = os.getenv('LLM_MODEL', 'claude-3-opus-20240229')
+    max_tokens: int = int(os.getenv('LLM_MAX_TOKENS', '3000'))
+    # Ответ выводится по мере генерации правками сообщения
+    streaming: bool = os.getenv('LLM_STREAMING', 'true').lower() == 'true'
+    # Не чаще одной правки сообщения за интервал (лимиты Telegram)
+    stream_edit_interval: float = float(os.getenv('LLM_STREAM_EDIT_INTERVAL', '1.0'))
+
 
 @dataclass
 class BotMessages:
@@ -24,7 +182,7 @@ class BotMessages:
 • /help - подробная инструкция по использованию
 • /qviz - умный диалог с базой знаний
 • /test - тестирование знаний
-• /choose_rag - выбор источника данных
+• /choose_rag - выбор источников данных (можно несколько)
 • /add_rag_source - добавление нового источника
 
 ⚡️ Текущие источники данных:
@@ -54,7 +212,8 @@ Culture Deck был собран с использованием специал
 1️⃣ Выбор источника данных и запрос:
 Шаг 1: /choose_rag
 
-Выберите нужный источник из списка, например "01_hackathon.zip"
+Отметьте нужные источники в списке, например "01_hackathon.zip", и нажмите "Готово".
+При выборе нескольких источников поиск идет по всем сразу
 Шаг 2: /qviz
 
 После выбора источника используйте команду /qviz и задайте ваш вопрос
@@ -126,8 +285,22 @@ class Config:
 
     RAG_EMBED_MODELS_CACHE: str = os.getenv('RAG_EMBED_MODELS_CACHE',
                                             '')
+    RAG_EMBED_MODEL: str = os.getenv('RAG_EMBED_MODEL',
+                                     'sentence-transformers/distiluse-base-multilingual-cased-v1')
+    # Кандидатов на переранжирование в поиске (0 - limit * 2)
+    RAG_SEARCH_CANDIDATES: int = int(os.getenv('RAG_SEARCH_CANDIDATES', '0'))
 
     db: DatabaseConfig = field(default_factory=DatabaseConfig)
+    vector_index: VectorIndexConfig = field(default_factory=VectorIndexConfig)
+    ingestion: IngestionConfig = field(default_factory=IngestionConfig)
+    loaders: LoaderConfig = field(default_factory=LoaderConfig)
+    chunking: ChunkingConfig = field(default_factory=ChunkingConfig)
+    transcripts: TranscriptConfig = field(default_factory=TranscriptConfig)
+    inference: InferenceConfig = field(default_factory=InferenceConfig)
+    embedding_cache: EmbeddingCacheConfig = field(default_factory=EmbeddingCacheConfig)
+    retrieval_cache: RetrievalCacheConfig = field(default_factory=RetrievalCacheConfig)
+    answer_cache: AnswerCacheConfig = field(default_factory=AnswerCacheConfig)
+    llm: LLMConfig = field(default_factory=LLMConfig)
     messages: BotMessages = field(default_factory=BotMessages)
 
 
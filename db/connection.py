@@ -1,10 +1,26 @@
+import functools
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from configs.config import config
 
 engine = create_engine(config.db.url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    config.db.async_url,
+    pool_size=config.db.pool_size,
+    max_overflow=config.db.max_overflow,
+    pool_timeout=config.db.pool_timeout,
+    pool_recycle=config.db.pool_recycle,
+    pool_pre_ping=True,
+)
+# Тип vector передается asyncpg в текстовом формате через bind/result процессоры pgvector.sqlalchemy
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 
 def get_db():
     db = SessionLocal()
@@ -12,3 +28,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def with_db_session(handler):
+    """Открывает отдельную AsyncSession на каждый апдейт и передает ее обработчику аргументом session."""
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        async with AsyncSessionLocal() as session:
+            return await handler(update, context, *args, session=session, **kwargs)
+
+    return wrapper
+
+
+async def close_db(*_) -> None:
+    """Закрывает пул соединений при остановке бота."""
+    await async_engine.dispose()
+    engine.dispose()
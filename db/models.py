@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, BigInteger, ForeignKey, Text
+from sqlalchemy import Column, String, BigInteger, Float, ForeignKey, Integer, Text, Index, UniqueConstraint
 from sqlalchemy import UUID
 from sqlalchemy.orm import relationship
 from pgvector.sqlalchemy import Vector
@@ -13,24 +13,69 @@ class RagSource(Base, BaseModel):
     index_status = Column(String, nullable=False, default="pending", comment="Indexing status")
     user_id = Column(BigInteger, nullable=False, comment="Telegram user ID")
 
+    # Версии: переиндексация пишет эмбеддинги в новую строку-версию (root_id = исходный источник),
+    # поиск по источнику идет по current_version_id, который переключается после индексации
+    root_id = Column(UUID, ForeignKey("rag_sources.id"), nullable=True, index=True,
+                     comment="Logical source this row is a version of (NULL for the source itself)")
+    version = Column(Integer, nullable=False, default=1, server_default="1", comment="Version number")
+    current_version_id = Column(UUID, ForeignKey("rag_sources.id"), nullable=True,
+                                comment="Version whose embeddings are searched (NULL - the source itself)")
+    vector_storage = Column(String, nullable=False, default="float32", server_default="float32",
+                            comment="Vector representation in the ANN index (float32, halfvec, binary)")
+
     # Связь с векторами
     embeddings = relationship("Embedding", back_populates="source", cascade="all, delete-orphan")
 
+    @property
+    def search_source_id(self):
+        """source_id эмбеддингов текущей версии источника."""
+        return self.current_version_id or self.id
+
 
 class Embedding(Base, BaseModel):
     __tablename__ = "embeddings"
+    __table_args__ = (
+        Index(
+            "ix_embeddings_vector_512_hnsw",
+            "vector_512",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"vector_512": "vector_cosine_ops"},
+        ),
+        Index("ix_embeddings_source_id_file_path", "source_id", "file_path"),
+    )
 
     text_chunk = Column(Text, nullable=False, comment="Text chunk")
     vector_512 = Column(Vector(512), nullable=False, comment="Embedding vector (512 dimensions)")
 
+    # Хэши для инкрементальной переиндексации
+    file_path = Column(String, nullable=True, comment="File path inside the archive")
+    file_hash = Column(String(64), nullable=True, comment="SHA-256 of the source file")
+    chunk_hash = Column(String(64), nullable=True, comment="SHA-256 of the text chunk")
+
+    # Положение чанка в исходном документе
+    page = Column(Integer, nullable=True, comment="Page number in the source file (from 1)")
+    sheet = Column(String, nullable=True, comment="Spreadsheet sheet name")
+    char_offset = Column(Integer, nullable=True, comment="Chunk start offset in the page/sheet text")
+    row_start = Column(Integer, nullable=True, comment="First spreadsheet row of the chunk document (from 1)")
+    row_end = Column(Integer, nullable=True, comment="Last spreadsheet row of the chunk document (from 1)")
+    json_pointer = Column(String, nullable=True, comment="RFC 6901 pointer of the JSON record")
+    # Положение чанка в транскрипте видео
+    start_seconds = Column(Float, nullable=True, comment="Chunk start time in the transcript (seconds)")
+    duration_seconds = Column(Float, nullable=True, comment="Chunk duration in the transcript (seconds)")
+
     # Связь с источником
-    source_id = Column(UUID, ForeignKey("rag_sources.id"), nullable=False)
+    source_id = Column(UUID, ForeignKey("rag_sources.id"), nullable=False, index=True)
     source = relationship("RagSource", back_populates="embeddings")
 
 
 class ActiveRagSource(Base, BaseModel):
     __tablename__ = "active_rag_sources"
+    # У пользователя может быть выбрано несколько источников (федеративный поиск)
+    __table_args__ = (
+        UniqueConstraint("user_id", "source_id", name="uq_active_rag_sources_user_id_source_id"),
+    )
 
-    user_id = Column(BigInteger, nullable=False, unique=True, comment="Telegram user ID")
+    user_id = Column(BigInteger, nullable=False, index=True, comment="Telegram user ID")
     source_id = Column(UUID, ForeignKey("rag_sources.id"), nullable=False)
     source = relationship("RagSource")
@@ -1,42 +1,73 @@
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from db.models import ActiveRagSource, RagSource
 
 logger = logging.getLogger(__name__)
 
 
-class ActiveRagSourceRepo:
-    def __init__(self, session: Session):
+class AsyncActiveRagSourceRepo:
+    """Активные RAG источники пользователей для обработчиков бота."""
+
+    def __init__(self, session: AsyncSession):
         self.session = session
 
-    def set_active_source(self, user_id: int, source_id: str) -> None:
-        """Установка активного RAG источника для пользователя"""
-        active_source = self.session.query(ActiveRagSource).filter(
-            ActiveRagSource.user_id == user_id
-        ).first()
+    async def set_active_source(self, user_id: int, source_id: str) -> None:
+        """Установка единственного активного RAG источника для пользователя"""
+        await self.session.execute(
+            delete(ActiveRagSource).where(
+                ActiveRagSource.user_id == user_id,
+                ActiveRagSource.source_id != source_id,
+            )
+        )
+        result = await self.session.execute(
+            select(ActiveRagSource).where(ActiveRagSource.user_id == user_id)
+        )
+        if not result.scalar_one_or_none():
+            self.session.add(ActiveRagSource(user_id=user_id, source_id=source_id))
+
+        await self.session.commit()
+
+    async def toggle_active_source(self, user_id: int, source_id: str) -> bool:
+        """Добавляет источник к выбранным или убирает его; возвращает, выбран ли он теперь"""
+        result = await self.session.execute(
+            select(ActiveRagSource).where(
+                ActiveRagSource.user_id == user_id,
+                ActiveRagSource.source_id == source_id,
+            )
+        )
+        active_source = result.scalar_one_or_none()
 
         if active_source:
-            active_source.source_id = source_id
+            await self.session.delete(active_source)
         else:
-            active_source = ActiveRagSource(user_id=user_id, source_id=source_id)
-            self.session.add(active_source)
+            self.session.add(ActiveRagSource(user_id=user_id, source_id=source_id))
 
-        self.session.commit()
+        await self.session.commit()
+        return active_source is None
 
-    def get_active_source(self, user_id: int) -> RagSource:
-        """Получение активного RAG источника пользователя"""
-        active_source = self.session.query(ActiveRagSource).filter(
-            ActiveRagSource.user_id == user_id
-        ).first()
-        return active_source.source if active_source else None
+    async def get_active_source(self, user_id: int) -> RagSource:
+        """Получение (первого выбранного) активного RAG источника пользователя"""
+        sources = await self.get_active_sources(user_id)
+        return sources[0] if sources else None
 
-    def get_all_sources(self, user_id: int = None) -> list[RagSource]:
-        """Получение всех доступных RAG источников"""
-        query = self.session.query(RagSource).filter(
-            RagSource.index_status == 'completed'
+    async def get_active_sources(self, user_id: int) -> list[RagSource]:
+        """Все выбранные пользователем RAG источники (в порядке выбора)"""
+        result = await self.session.execute(
+            select(ActiveRagSource)
+            .options(selectinload(ActiveRagSource.source))
+            .where(ActiveRagSource.user_id == user_id)
+            .order_by(ActiveRagSource.created_at)
         )
+        return [active_source.source for active_source in result.scalars().all()]
 
-        # if user_id is not None:
-        #     query = query.filter(RagSource.user_id == user_id)
-
-        return query.all()
+    async def get_all_sources(self, user_id: int = None) -> list[RagSource]:
+        """Получение всех доступных RAG источников"""
+        result = await self.session.execute(
+            select(RagSource).where(
+                RagSource.index_status == 'completed',
+                RagSource.root_id.is_(None),  # версии источника не показываются отдельно
+            )
+        )
+        return list(result.scalars().all())
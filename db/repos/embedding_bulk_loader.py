@@ -0,0 +1,214 @@
+import io
+import logging
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import bindparam, or_, text
+from sqlalchemy.orm import Session
+
+from configs.config import config
+from db.models import Embedding
+
+logger = logging.getLogger(__name__)
+
+# Порядок колонок в COPY и при переносе строк из staging таблицы
+COPY_COLUMNS = (
+    "id", "created_at", "updated_at", "text_chunk", "vector_512",
+    "file_path", "file_hash", "chunk_hash", "page", "sheet", "char_offset",
+    "row_start", "row_end", "json_pointer", "start_seconds", "duration_seconds", "source_id",
+)
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+_NULL = struct.pack("!i", -1)
+# timestamptz в бинарном формате - микросекунды от 2000-01-01 UTC
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+STAGING_TABLE_PREFIX = "embeddings_staging_"
+
+
+def _field(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return _NULL
+    return struct.pack("!i", len(value)) + value
+
+
+def _text(value: Optional[str]) -> Optional[bytes]:
+    return None if value is None else value.encode("utf-8")
+
+
+def _int4(value: Optional[int]) -> Optional[bytes]:
+    return None if value is None else struct.pack("!i", value)
+
+
+def _float8(value: Optional[float]) -> Optional[bytes]:
+    return None if value is None else struct.pack("!d", value)
+
+
+def encode_copy_binary(
+        embeddings_np: np.ndarray,
+        chunks: List[str],
+        source_id: str,
+        metadata: Optional[List[dict]] = None,
+) -> bytes:
+    """Строки embeddings в формате COPY ... (FORMAT BINARY).
+
+    vector кодируется как в vector_recv pgvector: int16 размерность, int16 0 и
+    float32 big-endian, поэтому матрица не проходит через списки Python и текст.
+    """
+    matrix = np.ascontiguousarray(embeddings_np, dtype=">f4")
+    vector_header = struct.pack("!hh", matrix.shape[1], 0)
+    now = datetime.now(timezone.utc)
+    timestamp = struct.pack("!q", (now - _PG_EPOCH) // timedelta(microseconds=1))
+    source_bytes = uuid.UUID(str(source_id)).bytes
+    field_count = struct.pack("!h", len(COPY_COLUMNS))
+    metadata = metadata or [{}] * len(chunks)
+
+    buffer = io.BytesIO()
+    buffer.write(_COPY_HEADER)
+    for vector, chunk, chunk_metadata in zip(matrix, chunks, metadata):
+        buffer.write(field_count)
+        buffer.write(_field(uuid.uuid4().bytes))
+        buffer.write(_field(timestamp))
+        buffer.write(_field(timestamp))
+        buffer.write(_field(_text(chunk)))
+        buffer.write(_field(vector_header + vector.tobytes()))
+        buffer.write(_field(_text(chunk_metadata.get("file_path"))))
+        buffer.write(_field(_text(chunk_metadata.get("file_hash"))))
+        buffer.write(_field(_text(chunk_metadata.get("chunk_hash"))))
+        buffer.write(_field(_int4(chunk_metadata.get("page"))))
+        buffer.write(_field(_text(chunk_metadata.get("sheet"))))
+        buffer.write(_field(_int4(chunk_metadata.get("char_offset"))))
+        buffer.write(_field(_int4(chunk_metadata.get("row_start"))))
+        buffer.write(_field(_int4(chunk_metadata.get("row_end"))))
+        buffer.write(_field(_text(chunk_metadata.get("json_pointer"))))
+        buffer.write(_field(_float8(chunk_metadata.get("start_seconds"))))
+        buffer.write(_field(_float8(chunk_metadata.get("duration_seconds"))))
+        buffer.write(_field(source_bytes))
+    buffer.write(_COPY_TRAILER)
+    return buffer.getvalue()
+
+
+class EmbeddingBulkLoader:
+    """Массовая запись эмбеддингов через COPY (psycopg2) и атомарная замена через staging таблицу.
+
+    Строки пишутся транзакциями по batch_rows. При записи в staging таблицу читатели
+    продолжают видеть прежние строки источника, пока swap_in не заменит их одной транзакцией.
+    """
+
+    def __init__(self, session: Session, batch_rows: int = config.ingestion.copy_batch_rows) -> None:
+        self.session = session
+        self.batch_rows = batch_rows
+
+    def copy(
+            self,
+            embeddings_np: np.ndarray,
+            chunks: List[str],
+            source_id: str,
+            metadata: Optional[List[dict]] = None,
+            table: str = "embeddings",
+            commit: bool = True,
+    ) -> None:
+        """Записывает строки в table потоком COPY, фиксируя транзакцию после каждой порции.
+
+        commit=False оставляет все порции в текущей транзакции.
+        """
+        metadata = metadata or [{}] * len(chunks)
+        statement = f"COPY {table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT BINARY)"
+
+        for start in range(0, len(chunks), self.batch_rows):
+            end = start + self.batch_rows
+            payload = encode_copy_binary(
+                embeddings_np[start:end], chunks[start:end], source_id, metadata[start:end]
+            )
+            try:
+                # Сырое соединение psycopg2 той же сессии: COPY идет в ее транзакции
+                cursor = self.session.connection().connection.cursor()
+                try:
+                    cursor.copy_expert(statement, io.BytesIO(payload))
+                finally:
+                    cursor.close()
+                if commit:
+                    self.session.commit()
+            except Exception as e:
+                self.session.rollback()
+                logger.error(f"Ошибка при записи эмбеддингов через COPY: {e}")
+                raise
+
+        logger.info(f"Записано {len(chunks)} эмбеддингов в {table} для источника: {source_id}")
+
+    def create_staging_table(self) -> str:
+        """UNLOGGED копия структуры embeddings без индексов: COPY в нее не перестраивает HNSW."""
+        table = f"{STAGING_TABLE_PREFIX}{uuid.uuid4().hex}"
+        self.session.execute(text(f"CREATE UNLOGGED TABLE {table} (LIKE embeddings INCLUDING DEFAULTS)"))
+        self.session.commit()
+        return table
+
+    def stage_existing(
+            self,
+            table: str,
+            source_id: str,
+            file_path: str,
+            chunk_hashes: Iterable[str],
+            file_hash: str,
+    ) -> None:
+        """Переносит в staging неизменившиеся чанки файла (без повторной векторизации) с новым хэшем файла."""
+        chunk_hashes = list(chunk_hashes)
+        if not chunk_hashes:
+            return
+
+        columns = ", ".join(COPY_COLUMNS)
+        statement = text(
+            f"INSERT INTO {table} ({columns}) "
+            f"SELECT id, created_at, now(), text_chunk, vector_512, file_path, :file_hash, chunk_hash, "
+            f"page, sheet, char_offset, row_start, row_end, json_pointer, start_seconds, duration_seconds, source_id "
+            f"FROM embeddings "
+            f"WHERE source_id = :source_id AND file_path = :file_path AND chunk_hash IN :chunk_hashes"
+        ).bindparams(bindparam("chunk_hashes", expanding=True))
+
+        try:
+            self.session.execute(statement, {
+                "file_hash": file_hash,
+                "source_id": str(source_id),
+                "file_path": file_path,
+                "chunk_hashes": chunk_hashes,
+            })
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Ошибка при переносе эмбеддингов в staging: {e}")
+            raise
+
+    def swap_in(self, table: str, source_id: str, file_paths: List[Optional[str]]) -> int:
+        """Одной транзакцией заменяет строки файлов источника содержимым staging и удаляет ее.
+
+        file_paths - файлы, строки которых заменяются (None - строки без пути файла).
+        """
+        paths = [file_path for file_path in file_paths if file_path is not None]
+        conditions = [Embedding.file_path.in_(paths)]
+        if None in file_paths:
+            conditions.append(Embedding.file_path.is_(None))
+        columns = ", ".join(COPY_COLUMNS)
+
+        try:
+            self.session.query(Embedding).filter(
+                Embedding.source_id == source_id, or_(*conditions)
+            ).delete(synchronize_session=False)
+            inserted = self.session.execute(
+                text(f"INSERT INTO embeddings ({columns}) SELECT {columns} FROM {table}")
+            ).rowcount
+            self.session.execute(text(f"DROP TABLE {table}"))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Ошибка при замене эмбеддингов источника {source_id}: {e}")
+            raise
+
+        logger.info(f"Staging {table} перенесена в embeddings: {inserted} строк для источника: {source_id}")
+        return inserted
+
+    def drop_staging_table(self, table: str) -> None:
+        self.session.rollback()
+        self.session.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        self.session.commit()
@@ -1,11 +1,20 @@
 import logging
-from typing import List
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
 import numpy as np
+from sqlalchemy import UUID, bindparam, delete, literal, or_, select, text, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from configs.config import config
 from db.models import Embedding, RagSource
+from db.repos.embedding_bulk_loader import EmbeddingBulkLoader
+from db.repos.vector_index_repo import bounded_counts_statement, coarse_distance, search_params_statements
 
 logger = logging.getLogger(__name__)
 
+# Группа кандидатов, которые ищутся точным сканированием без ANN индекса
+EXACT_SCAN = "exact"
+
 
 class EmbeddingRepo:
     """Репозиторий для работы с векторными эмбеддингами."""
@@ -25,27 +34,45 @@ class EmbeddingRepo:
             raise
 
     def insert_data(
-            self, embeddings_np: np.ndarray, chunks: List[str], source_id: str
+            self,
+            embeddings_np: np.ndarray,
+            chunks: List[str],
+            source_id: str,
+            metadata: Optional[List[dict]] = None,
+            commit: bool = True,
     ) -> None:
-        """Вставляет эмбеддинги в БД."""
+        """Вставляет эмбеддинги в БД.
+
+        metadata - значения дополнительных колонок Embedding для каждого чанка
+        (file_path, file_hash, chunk_hash, page, sheet, char_offset, row_start, row_end, json_pointer,
+        start_seconds, duration_seconds).
+        При config.ingestion.bulk_load матрица пишется через COPY в бинарном формате, без ORM объектов.
+        commit=False оставляет изменения в текущей транзакции (фиксирует их вызывающий код).
+        """
         try:
             # Проверяем существование источника
             source = self.session.query(RagSource).filter_by(id=source_id).first()
             if not source:
                 raise ValueError(f"Источник с id {source_id} не найден")
 
+            if config.ingestion.bulk_load:
+                EmbeddingBulkLoader(self.session).copy(embeddings_np, chunks, source_id, metadata, commit=commit)
+                return
+
             # Создаем объекты эмбеддингов
+            metadata = metadata or [{}] * len(chunks)
             embeddings = [
                 Embedding(
                     vector_512=vector.tolist(),
                     text_chunk=text,
-                    source_id=source_id
+                    source_id=source_id,
+                    **chunk_metadata
                 )
-                for vector, text in zip(embeddings_np, chunks)
+                for vector, text, chunk_metadata in zip(embeddings_np, chunks, metadata)
             ]
 
             self.session.bulk_save_objects(embeddings)
-            self.session.commit()
+            self._finish(commit)
 
             logger.info(
                 "Добавлено %d новых эмбеддингов для источника: %s",
@@ -58,15 +85,151 @@ class EmbeddingRepo:
             logger.error(f"Ошибка при сохранении эмбеддингов: {e}")
             raise
 
+    def commit(self) -> None:
+        """Фиксирует изменения, сделанные методами с commit=False."""
+        self.session.commit()
+
+    def rollback(self) -> None:
+        """Откатывает изменения, сделанные методами с commit=False."""
+        self.session.rollback()
+
+    def _finish(self, commit: bool) -> None:
+        if commit:
+            self.session.commit()
+        else:
+            self.session.flush()
+
+    def get_file_hashes(self, source_id: str) -> Dict[Optional[str], Optional[str]]:
+        """Хэши файлов, из которых построены эмбеддинги источника: {file_path: file_hash}."""
+        rows = (
+            self.session.query(Embedding.file_path, Embedding.file_hash)
+            .filter(Embedding.source_id == source_id)
+            .distinct()
+            .all()
+        )
+        return {file_path: file_hash for file_path, file_hash in rows}
+
+    def get_chunk_hashes(self, source_id: str, file_path: str) -> Set[str]:
+        """Хэши чанков, сохраненных для файла источника."""
+        rows = (
+            self.session.query(Embedding.chunk_hash)
+            .filter(Embedding.source_id == source_id, Embedding.file_path == file_path)
+            .all()
+        )
+        return {chunk_hash for chunk_hash, in rows if chunk_hash}
+
+    def delete_by_files(self, source_id: str, file_paths: List[Optional[str]], commit: bool = True) -> None:
+        """Удаляет эмбеддинги файлов источника (None - строки без пути файла)."""
+        paths = [file_path for file_path in file_paths if file_path is not None]
+        conditions = [Embedding.file_path.in_(paths)]
+        if None in file_paths:
+            conditions.append(Embedding.file_path.is_(None))
+
+        try:
+            deleted = (
+                self.session.query(Embedding)
+                .filter(Embedding.source_id == source_id, or_(*conditions))
+                .delete(synchronize_session=False)
+            )
+            self._finish(commit)
+            logger.info(f"Удалено {deleted} эмбеддингов удаленных файлов источника: {source_id}")
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Ошибка при удалении эмбеддингов: {e}")
+            raise
+
+    def delete_by_chunk_hashes(
+            self, source_id: str, file_path: str, chunk_hashes: List[str], commit: bool = True
+    ) -> None:
+        """Удаляет устаревшие чанки файла."""
+        try:
+            self.session.query(Embedding).filter(
+                Embedding.source_id == source_id,
+                Embedding.file_path == file_path,
+                Embedding.chunk_hash.in_(chunk_hashes),
+            ).delete(synchronize_session=False)
+            self._finish(commit)
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Ошибка при удалении эмбеддингов: {e}")
+            raise
+
+    def update_file_hash(self, source_id: str, file_path: str, file_hash: str, commit: bool = True) -> None:
+        """Обновляет хэш файла у оставшихся чанков этого файла."""
+        try:
+            self.session.execute(
+                update(Embedding)
+                .where(Embedding.source_id == source_id, Embedding.file_path == file_path)
+                .values(file_hash=file_hash)
+            )
+            self._finish(commit)
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Ошибка при обновлении хэша файла: {e}")
+            raise
+
+    def copy_from_source(
+            self,
+            from_source_id: str,
+            to_source_id: str,
+            file_paths: List[str],
+            chunk_hashes: Optional[Iterable[str]] = None,
+            file_hash: Optional[str] = None,
+    ) -> int:
+        """Копирует эмбеддинги файлов из версии источника в новую без повторной векторизации.
+
+        chunk_hashes ограничивает копирование частью чанков, file_hash заменяет хэш файла.
+        """
+        if not file_paths:
+            return 0
+
+        conditions = "source_id = :from_source_id AND file_path IN :file_paths"
+        params = {
+            "from_source_id": str(from_source_id),
+            "to_source_id": str(to_source_id),
+            "file_paths": list(file_paths),
+            "file_hash": file_hash,
+        }
+        expanding = [bindparam("file_paths", expanding=True)]
+        if chunk_hashes is not None:
+            params["chunk_hashes"] = list(chunk_hashes)
+            if not params["chunk_hashes"]:
+                return 0
+            conditions += " AND chunk_hash IN :chunk_hashes"
+            expanding.append(bindparam("chunk_hashes", expanding=True))
+
+        statement = text(
+            "INSERT INTO embeddings "
+            "(id, created_at, updated_at, text_chunk, vector_512, file_path, file_hash, chunk_hash, "
+            "page, sheet, char_offset, row_start, row_end, json_pointer, start_seconds, duration_seconds, source_id) "
+            "SELECT gen_random_uuid(), created_at, now(), text_chunk, vector_512, file_path, "
+            "COALESCE(:file_hash, file_hash), chunk_hash, page, sheet, char_offset, row_start, row_end, json_pointer, "
+            "start_seconds, duration_seconds, "
+            "CAST(:to_source_id AS uuid) "
+            f"FROM embeddings WHERE {conditions}"
+        ).bindparams(*expanding)
+
+        try:
+            copied = self.session.execute(statement, params).rowcount
+            self.session.commit()
+            return copied
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Ошибка при копировании эмбеддингов между версиями: {e}")
+            raise
+
     def search_similar(
             self, query_vector: np.ndarray, source_ids: List[str], limit: int = 5
     ) -> List[str]:
-        """Поиск похожих текстовых фрагментов."""
+        """Поиск похожих текстовых фрагментов (косинусное расстояние, использует HNSW индекс)."""
         try:
+            for statement in search_params_statements():
+                self.session.execute(statement)
+
             results = (
                 self.session.query(Embedding)
                 .filter(Embedding.source_id.in_(source_ids))
-                .order_by(Embedding.vector_512.op("<->")(query_vector))
+                .order_by(Embedding.vector_512.op("<=>")(query_vector))
                 .limit(limit)
                 .all()
             )
@@ -83,3 +246,165 @@ class EmbeddingRepo:
             raise
         finally:
             self.session.close()
+
+
+class AsyncEmbeddingRepo:
+    """Асинхронная версия EmbeddingRepo для обработчиков бота."""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def delete_by_source_id(self, source_id: str) -> None:
+        """Удаляет эмбеддинги для указанного источника."""
+        try:
+            await self.session.execute(delete(Embedding).where(Embedding.source_id == source_id))
+            await self.session.commit()
+            logger.info(f"Удалены все эмбеддинги для источника: {source_id}")
+        except Exception as e:
+            await self.session.rollback()
+            logger.error(f"Ошибка при удалении эмбеддингов: {e}")
+            raise
+
+    async def insert_data(
+            self,
+            embeddings_np: np.ndarray,
+            chunks: List[str],
+            source_id: str,
+            metadata: Optional[List[dict]] = None,
+    ) -> None:
+        """Вставляет эмбеддинги в БД."""
+        try:
+            source = await self.session.get(RagSource, source_id)
+            if not source:
+                raise ValueError(f"Источник с id {source_id} не найден")
+
+            metadata = metadata or [{}] * len(chunks)
+            self.session.add_all([
+                Embedding(
+                    vector_512=vector,
+                    text_chunk=text,
+                    source_id=source_id,
+                    **chunk_metadata
+                )
+                for vector, text, chunk_metadata in zip(embeddings_np, chunks, metadata)
+            ])
+            await self.session.commit()
+
+            logger.info(
+                "Добавлено %d новых эмбеддингов для источника: %s",
+                len(chunks),
+                source_id
+            )
+
+        except Exception as e:
+            await self.session.rollback()
+            logger.error(f"Ошибка при сохранении эмбеддингов: {e}")
+            raise
+
+    async def count_rows(self, source_ids: List[str], limit: int) -> Dict[str, int]:
+        """Число эмбеддингов каждого источника, но не больше limit (один запрос на все источники)."""
+        result = await self.session.execute(bounded_counts_statement(source_ids, limit))
+        counts = {str(source_id): rows_count for source_id, rows_count in result.all()}
+        return {str(source_id): counts.get(str(source_id), 0) for source_id in source_ids}
+
+    async def set_search_params(self, ef_search: Optional[int] = None, probes: Optional[int] = None) -> None:
+        """Параметры ANN индекса; действуют только в рамках текущей транзакции."""
+        for statement in search_params_statements(ef_search, probes):
+            await self.session.execute(statement)
+
+    @staticmethod
+    def candidates_statement(
+            storage: str,
+            version_ids: List[str],
+            query_vector: np.ndarray,
+            candidates_limit: int,
+            coarse_limit: int,
+            source_index: bool = False,
+    ):
+        """Кандидаты из источников с одним vector_storage, по возрастанию точного косинусного расстояния.
+
+        Для halfvec/binary индекс по компактному представлению отбирает coarse_limit
+        строк, которые затем пересчитываются по исходному float32 вектору.
+        EXACT_SCAN - точный перебор строк источников: фильтр по source_id после обхода HNSW
+        может оставить маленькому источнику меньше candidates_limit строк.
+        source_index - один источник с частичным индексом: его id подставляется в SQL
+        литералом, иначе generic план asyncpg не сопоставит условие с предикатом индекса.
+        """
+        exact_distance = Embedding.vector_512.op("<=>")(query_vector)
+        stmt = select(
+            Embedding.text_chunk, Embedding.vector_512, Embedding.source_id, exact_distance.label("distance")
+        )
+        if source_index:
+            (version_id,) = version_ids
+            source_filter = Embedding.source_id == literal(uuid.UUID(str(version_id)), UUID, literal_execute=True)
+        else:
+            source_filter = Embedding.source_id.in_(version_ids)
+
+        if storage == EXACT_SCAN:
+            # Выражение "+ 0" не совпадает с выражением индекса, планировщик берет строки
+            # по индексу source_id и сортирует их
+            return stmt.where(source_filter).order_by(exact_distance + 0).limit(candidates_limit)
+        if storage == "float32":
+            return stmt.where(source_filter).order_by(exact_distance).limit(candidates_limit)
+
+        coarse_ids = (
+            select(Embedding.id)
+            .where(source_filter)
+            .order_by(coarse_distance(storage, query_vector))
+            .limit(coarse_limit)
+        )
+        return stmt.where(Embedding.id.in_(coarse_ids.scalar_subquery())).order_by(exact_distance).limit(
+            candidates_limit
+        )
+
+    async def search_candidates(
+            self,
+            version_ids_by_group: Dict[tuple, List[str]],
+            query_vector: np.ndarray,
+            candidates_limit: int,
+            coarse_limit: int,
+    ) -> list:
+        """Строки (text_chunk, vector_512, source_id, distance) ближайших кандидатов всех групп одним запросом.
+
+        Группа - (vector_storage, id источника с частичным индексом или None).
+        """
+        statements = [
+            self.candidates_statement(
+                storage, group_version_ids, query_vector, candidates_limit, coarse_limit,
+                source_index=index_source_id is not None,
+            )
+            for (storage, index_source_id), group_version_ids in version_ids_by_group.items()
+        ]
+        if len(statements) > 1:
+            # Группы объединяются в один запрос: каждая сохраняет свой ORDER BY/LIMIT (и свой индекс)
+            # как подзапрос, общий список сортируется по точному расстоянию
+            candidates = union_all(*[select(statement.subquery()) for statement in statements]).subquery()
+            statement = select(candidates).order_by(candidates.c.distance).limit(candidates_limit)
+        else:
+            (statement,) = statements
+        result = await self.session.execute(statement)
+        return result.all()
+
+    async def search_similar(
+            self, query_vector: np.ndarray, source_ids: List[str], limit: int = 5
+    ) -> List[str]:
+        """Поиск похожих текстовых фрагментов (косинусное расстояние, использует HNSW индекс)."""
+        try:
+            await self.set_search_params()
+
+            result = await self.session.execute(
+                select(Embedding.text_chunk)
+                .where(Embedding.source_id.in_(source_ids))
+                .order_by(Embedding.vector_512.op("<=>")(query_vector))
+                .limit(limit)
+            )
+            texts = list(result.scalars().all())
+
+            logger.info("Найдено %d похожих фрагментов", len(texts))
+            logger.debug("Найденные фрагменты: %s", texts)
+
+            return texts
+
+        except Exception as e:
+            logger.error(f"Ошибка при поиске похожих фрагментов: {e}")
+            raise
@@ -1,6 +1,11 @@
 import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from db.models import RagSource
+from configs.config import config
+from db.models import Embedding, RagSource
 
 logger = logging.getLogger(__name__)
 
@@ -11,13 +16,16 @@ class RagSourceRepo:
     def __init__(self, session: Session):
         self.session = session
 
-    def create_source_from_archive(self, filename: str, user_id: int) -> RagSource:
-        """Создание нового RAG источника из архива."""
+    def create_source_from_archive(
+            self, filename: str, user_id: int, vector_storage: Optional[str] = None, source_type: str = 'archive'
+    ) -> RagSource:
+        """Создание нового RAG источника из архива (или списка видео, source_type = youtube)."""
         source = RagSource(
             name=filename,
-            source_type='archive',
+            source_type=source_type,
             index_status='pending',
-            user_id=user_id
+            user_id=user_id,
+            vector_storage=vector_storage or config.vector_index.storage,
         )
 
         self.session.add(source)
@@ -36,3 +44,138 @@ class RagSourceRepo:
     def get_by_id(self, source_id: str) -> RagSource:
         """Получение источника по ID."""
         return self.session.query(RagSource).filter(RagSource.id == source_id).first()
+
+    def get_garbage_versions(self, older_than: datetime) -> list[RagSource]:
+        """Версии, которые больше не понадобятся: замененные, упавшие и отмененные."""
+        return (
+            self.session.query(RagSource)
+            .filter(
+                RagSource.root_id.isnot(None),
+                RagSource.index_status.in_(["superseded", "failed", "cancelled"]),
+                RagSource.updated_at < older_than,
+            )
+            .all()
+        )
+
+    def get_superseded_roots(self, older_than: datetime) -> list[RagSource]:
+        """Источники, чьи собственные эмбеддинги (первая версия) заменены новой версией."""
+        return (
+            self.session.query(RagSource)
+            .filter(
+                RagSource.current_version_id.isnot(None),
+                RagSource.current_version_id != RagSource.id,
+                RagSource.updated_at < older_than,
+                exists().where(Embedding.source_id == RagSource.id),
+            )
+            .all()
+        )
+
+    def delete(self, source: RagSource) -> None:
+        """Удаляет строку источника (эмбеддинги должны быть удалены заранее)."""
+        self.session.delete(source)
+        self.session.commit()
+
+
+class AsyncRagSourceRepo:
+    """Асинхронная версия RagSourceRepo для обработчиков бота."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create_source_from_archive(
+            self, filename: str, user_id: int, vector_storage: Optional[str] = None, source_type: str = 'archive'
+    ) -> RagSource:
+        """Создание нового RAG источника из архива (или списка видео, source_type = youtube)."""
+        source = RagSource(
+            name=filename,
+            source_type=source_type,
+            index_status='pending',
+            user_id=user_id,
+            vector_storage=vector_storage or config.vector_index.storage,
+        )
+
+        self.session.add(source)
+        await self.session.commit()
+        await self.session.refresh(source)
+
+        return source
+
+    async def update_index_status(self, source_id: str, status: str) -> None:
+        """Обновляет статус индексации источника."""
+        source = await self.get_by_id(source_id)
+        if source:
+            source.index_status = status
+            await self.session.commit()
+
+    async def get_by_id(self, source_id: str) -> RagSource:
+        """Получение источника по ID."""
+        result = await self.session.execute(select(RagSource).where(RagSource.id == source_id))
+        return result.scalar_one_or_none()
+
+    async def create_version(self, source: RagSource, vector_storage: Optional[str] = None) -> RagSource:
+        """Новая версия источника для переиндексации (status = pending).
+
+        Версия наследует vector_storage источника, если не задано другое.
+        """
+        result = await self.session.execute(
+            select(func.max(RagSource.version))
+            .where((RagSource.id == source.id) | (RagSource.root_id == source.id))
+        )
+        version = RagSource(
+            name=source.name,
+            source_type=source.source_type,
+            index_status='pending',
+            user_id=source.user_id,
+            root_id=source.id,
+            version=(result.scalar() or 1) + 1,
+            vector_storage=vector_storage or source.vector_storage,
+        )
+
+        self.session.add(version)
+        await self.session.commit()
+        await self.session.refresh(version)
+
+        return version
+
+    async def activate_version(self, root_id: str, version_id: str) -> None:
+        """Одной транзакцией делает версию текущей; прежняя версия помечается superseded."""
+        try:
+            root = await self.get_by_id(root_id)
+            version = await self.get_by_id(version_id)
+            previous_id = root.search_source_id
+
+            version.index_status = 'completed'
+            root.current_version_id = version.id
+            # Поиск выбирает выражение расстояния по vector_storage источника
+            root.vector_storage = version.vector_storage
+            root.index_status = 'completed'
+            if str(previous_id) != str(root.id):
+                previous = await self.get_by_id(previous_id)
+                if previous:
+                    previous.index_status = 'superseded'
+
+            await self.session.commit()
+            logger.info(f"Source {root_id} switched to version {version.version} ({version_id})")
+        except Exception as e:
+            await self.session.rollback()
+            logger.error(f"Ошибка при переключении версии источника {root_id}: {e}")
+            raise
+
+    async def get_by_index_statuses(self, statuses: list[str]) -> list[RagSource]:
+        """Источники с указанными статусами индексации (в порядке создания)."""
+        result = await self.session.execute(
+            select(RagSource)
+            .where(RagSource.index_status.in_(statuses))
+            .order_by(RagSource.created_at)
+        )
+        return list(result.scalars().all())
+
+    async def get_by_name(self, user_id: int, name: str) -> RagSource:
+        """Последний источник пользователя с указанным именем архива (без учета версий)."""
+        result = await self.session.execute(
+            select(RagSource)
+            .where(RagSource.user_id == user_id, RagSource.name == name, RagSource.root_id.is_(None))
+            .order_by(RagSource.created_at.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
@@ -0,0 +1,162 @@
+import logging
+import uuid
+from typing import Optional
+
+import numpy as np
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import cast, func, select, text, true
+from sqlalchemy.orm import Session
+
+from configs.config import config
+from db.models import Embedding, RagSource
+
+logger = logging.getLogger(__name__)
+
+INDEX_METHODS = ("hnsw", "ivfflat")
+VECTOR_DIM = 512
+
+# Индексы строятся по выражению над vector_512: float32 остается в таблице
+# для точного пересчета кандидатов, а граф/списки индекса хранят компактное представление
+# (halfvec - 2 байта на измерение, binary - 1 бит)
+VECTOR_STORAGE_INDEX_EXPRESSIONS = {
+    "float32": "vector_512 vector_cosine_ops",
+    "halfvec": f"(vector_512::halfvec({VECTOR_DIM})) halfvec_cosine_ops",
+    "binary": f"(binary_quantize(vector_512)::bit({VECTOR_DIM})) bit_hamming_ops",
+}
+VECTOR_STORAGE_MODES = tuple(VECTOR_STORAGE_INDEX_EXPRESSIONS)
+HNSW_ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+
+
+def search_params_statements(
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        iterative_scan: Optional[str] = None,
+) -> list:
+    """SET LOCAL выражения с параметрами ANN поиска для текущей транзакции.
+
+    Выполняются вызывающей стороной, поэтому подходят и для Session, и для AsyncSession.
+    iterative_scan (pgvector >= 0.8) продолжает обход HNSW, пока фильтр по source_id
+    не пропустит LIMIT строк; пустая строка - параметр не выставляется.
+    """
+    ef_search = config.vector_index.hnsw_ef_search if ef_search is None else ef_search
+    probes = config.vector_index.ivfflat_probes if probes is None else probes
+    iterative_scan = config.vector_index.hnsw_iterative_scan if iterative_scan is None else iterative_scan
+    # SET не принимает bind-параметры, поэтому значения приводятся к int / проверяются по списку
+    statements = [
+        text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"),
+        text(f"SET LOCAL ivfflat.probes = {int(probes)}"),
+    ]
+    if iterative_scan:
+        if iterative_scan not in HNSW_ITERATIVE_SCAN_MODES:
+            raise ValueError(f"Unknown hnsw.iterative_scan mode: {iterative_scan}")
+        statements.append(text(f"SET LOCAL hnsw.iterative_scan = {iterative_scan}"))
+    return statements
+
+
+def bounded_counts_statement(source_ids, limit: int):
+    """Пары (source_id, число строк) для нескольких источников одним запросом.
+
+    Число строк не больше limit: на каждый источник читается не больше limit записей индекса по source_id.
+    """
+    rows = select(Embedding.id).where(Embedding.source_id == RagSource.id).limit(limit).lateral()
+    return (
+        select(RagSource.id, func.count(rows.c.id))
+        .select_from(RagSource)
+        .outerjoin(rows, true())
+        .where(RagSource.id.in_(source_ids))
+        .group_by(RagSource.id)
+    )
+
+
+def coarse_distance(storage: str, query_vector: np.ndarray):
+    """Расстояние до запроса в представлении storage - то выражение, которое ускоряет его индекс."""
+    if storage == "float32":
+        return Embedding.vector_512.op("<=>")(query_vector)
+    if storage == "halfvec":
+        return cast(Embedding.vector_512, HALFVEC(VECTOR_DIM)).op("<=>")(cast(query_vector, HALFVEC(VECTOR_DIM)))
+    if storage == "binary":
+        return cast(func.binary_quantize(Embedding.vector_512), BIT(VECTOR_DIM)).op("<~>")(
+            func.binary_quantize(cast(query_vector, Vector(VECTOR_DIM)))
+        )
+    raise ValueError(f"Unknown vector storage: {storage}")
+
+
+class VectorIndexRepo:
+    """Управление ANN индексами по embeddings.vector_512 (общими и частичными по источнику)."""
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    @staticmethod
+    def source_index_name(source_id: str, storage: str) -> str:
+        # Представление входит в имя: после смены vector_storage IF NOT EXISTS не оставит прежний индекс
+        return f"ix_embeddings_vec_src_{storage}_{uuid.UUID(str(source_id)).hex}"
+
+    def source_index_names(self, source_id: str) -> list:
+        """Имена всех возможных частичных индексов источника, включая имя без представления (старый формат)."""
+        return [
+            *(self.source_index_name(source_id, storage) for storage in VECTOR_STORAGE_MODES),
+            f"ix_embeddings_vec_src_{uuid.UUID(str(source_id)).hex}",
+        ]
+
+    def count_rows(self, source_id: str) -> int:
+        return self.session.query(Embedding).filter(Embedding.source_id == source_id).count()
+
+    def source_storage(self, source_id: str) -> str:
+        storage = self.session.query(RagSource.vector_storage).filter(RagSource.id == source_id).scalar()
+        return storage or "float32"
+
+    def create_source_index(self, source_id: str, method: Optional[str] = None, storage: Optional[str] = None) -> str:
+        """Строит частичный индекс только по векторам источника в его представлении (vector_storage)."""
+        method = method or config.vector_index.source_index_method
+        if method not in INDEX_METHODS:
+            raise ValueError(f"Unknown vector index method: {method}")
+        storage = storage or self.source_storage(source_id)
+        if storage not in VECTOR_STORAGE_MODES:
+            raise ValueError(f"Unknown vector storage: {storage}")
+
+        source_uuid = uuid.UUID(str(source_id))
+        index_name = self.source_index_name(source_id, storage)
+
+        if method == "hnsw":
+            with_clause = (
+                f"m = {int(config.vector_index.hnsw_m)}, "
+                f"ef_construction = {int(config.vector_index.hnsw_ef_construction)}"
+            )
+        else:
+            # Рекомендация pgvector: lists = rows / 1000 для таблиц до 1M строк
+            lists = max(self.count_rows(source_id) // 1000, 10)
+            with_clause = f"lists = {lists}"
+
+        statement = text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+            f"ON embeddings USING {method} ({VECTOR_STORAGE_INDEX_EXPRESSIONS[storage]}) "
+            f"WITH ({with_clause}) "
+            f"WHERE source_id = '{source_uuid}'"
+        )
+        self._execute_autocommit(statement)
+        logger.info(f"Создан {method} ({storage}) индекс {index_name} для источника: {source_id}")
+
+        # Индекс в прежнем представлении поиску больше не подходит
+        for stale_index_name in self.source_index_names(source_id):
+            if stale_index_name != index_name:
+                self._execute_autocommit(text(f"DROP INDEX CONCURRENTLY IF EXISTS {stale_index_name}"))
+        return index_name
+
+    def drop_source_index(self, source_id: str) -> None:
+        """Удаляет частичные индексы источника, если они есть."""
+        for index_name in self.source_index_names(source_id):
+            self._execute_autocommit(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+        logger.info(f"Удалены индексы источника: {source_id}")
+
+    def ensure_source_index(self, source_id: str) -> Optional[str]:
+        """Создает частичный индекс для крупных источников, мелким хватает общего индекса."""
+        rows = self.count_rows(source_id)
+        if rows < config.vector_index.source_index_min_rows:
+            return None
+        return self.create_source_index(source_id)
+
+    def _execute_autocommit(self, statement) -> None:
+        # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        with self.session.get_bind().connect() as connection:
+            connection.execution_options(isolation_level="AUTOCOMMIT").execute(statement)
@@ -1,11 +1,17 @@
 import logging
-import os
-import tempfile
 from typing import Optional, Any
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
 
+from configs.config import config
+from db.connection import with_db_session
+from db.repos.rag_source_repo import AsyncRagSourceRepo
+from db.repos.vector_index_repo import VECTOR_STORAGE_MODES
+from services.ingestion_service import TRANSCRIPT_SOURCE_TYPE, IngestionJob, IngestionWorker
+from services.transcript_service import extract_video_ids, transcript_source_name
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -36,6 +42,17 @@ async def add_rag_source(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         user_id = update.effective_user.id
         logger.info(f"User {user_id} initiated RAG source addition")
 
+        # /add_rag_source binary - представление векторов в индексе источника
+        if context.args:
+            vector_storage = context.args[0].lower()
+            if vector_storage not in VECTOR_STORAGE_MODES:
+                await update.message.reply_text(
+                    f"❌ Неизвестный режим хранения векторов. Доступны: {', '.join(VECTOR_STORAGE_MODES)}"
+                )
+                context.user_data.clear()
+                return END
+            context.user_data['vector_storage'] = vector_storage
+
         instructions = """
 📚 Загрузите ZIP-архив с документами для создания базы знаний.
 
@@ -46,11 +63,15 @@ async def add_rag_source(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 • Текстовые файлы (*.txt)
 • Json
 
+🎬 Или отправьте ссылки на YouTube видео (по одной на строку) - база знаний будет построена по их субтитрам.
+
 ⚠️ Убедитесь, что:
 1. Все файлы упакованы в ZIP-архив
 2. Размер архива не превышает 20MB
 3. Файлы содержат текстовую информацию
 
+💾 Компактный индекс для больших баз: /add_rag_source halfvec или /add_rag_source binary
+
 Отправьте архив как документ...
 """
         await update.message.reply_text(instructions)
@@ -74,14 +95,13 @@ async def handle_other_commands(update: Update, context: ContextTypes.DEFAULT_TY
     return END
 
 
-async def handle_archive(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@with_db_session
+async def handle_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession) -> int:
     """Обработчик загрузки архива"""
     user_id = update.effective_user.id
+    source_repo = AsyncRagSourceRepo(session)
     logger.info(f"Handling archive upload from user {user_id}")
 
-    source: Optional[Any] = None
-    temp_zip_path: Optional[str] = None
-
     try:
         if not update.message.document:
             logger.warning(f"User {user_id} didn't send a document")
@@ -103,56 +123,138 @@ async def handle_archive(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return WAITING_ARCHIVE
 
         # Скачиваем файл
-        await update.message.reply_text("⏳ Начинаю обработку архива...")
         file = await update.message.document.get_file()
+        downloaded_bytes = await file.download_as_bytearray()
 
-        # Создаем временный файл для архива
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
-            temp_zip_path = temp_file.name
-            downloaded_bytes = await file.download_as_bytearray()
-            temp_file.write(downloaded_bytes)
+        await _queue_ingestion(update, context, source_repo, file_name, bytes(downloaded_bytes))
 
-        # Создаем источник в БД
-        source = context.bot_data['source_repo'].create_source_from_archive(
-            filename=file_name,
-            user_id=user_id
+    except Exception as e:
+        logger.error(f"Error processing archive for user {user_id}: {str(e)}", exc_info=True)
+        await update.message.reply_text(
+            "❌ Произошла ошибка при обработке архива. Пожалуйста, попробуйте позже."
         )
 
-        # Обрабатываем архив и получаем количество чанков
-        chunks_count = await context.bot_data['archive_processor'].process_archive(temp_zip_path, source.id)
+    finally:
+        context.user_data.clear()
 
-        # Обновляем статус источника
-        context.bot_data['source_repo'].update_index_status(source.id, "completed")
+    return ConversationHandler.END
 
-        success_message = (
-            f"✅ Архив успешно обработан и добавлен в базу знаний!\n"
-            f"📊 Добавлено чанков: {chunks_count}\n"
-            f"🗂 Источник: {file_name}"
-        )
 
-        await update.message.reply_text(success_message)
-        logger.info(f"Successfully completed processing for user {user_id}, source {source.id}, chunks: {chunks_count}")
+async def _queue_ingestion(
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        source_repo: AsyncRagSourceRepo,
+        name: str,
+        payload: bytes,
+        source_type: str = "archive",
+) -> Optional[Any]:
+    """Создает источник (или его новую версию) и ставит индексацию в очередь.
 
-    except Exception as e:
-        logger.error(f"Error processing archive for user {user_id}: {str(e)}", exc_info=True)
-        await update.message.reply_text(
-            "❌ Произошла ошибка при обработке архива. Пожалуйста, попробуйте позже."
+    Возвращает источник, в который пишется индексация, или None, если источник уже обрабатывается.
+    """
+    user_id = update.effective_user.id
+    ingestion_worker: IngestionWorker = context.bot_data['ingestion_worker']
+    vector_storage = context.user_data.get('vector_storage')
+
+    # Повторная загрузка архива с тем же именем переиндексирует существующий источник:
+    # неизменившиеся файлы и чанки не векторизуются заново
+    source = await source_repo.get_by_name(user_id, name)
+    if source and ingestion_worker.get_job(str(source.id)):
+        await update.message.reply_text("⏳ Этот источник уже обрабатывается, дождитесь окончания.")
+        return None
+
+    if source and source.index_status == "completed" and config.ingestion.source_versioning:
+        # Готовый источник остается доступным для поиска, пока строится новая версия
+        target = await source_repo.create_version(source, vector_storage)
+    elif source:
+        if vector_storage:
+            source.vector_storage = vector_storage
+        await source_repo.update_index_status(source.id, "pending")
+        target = source
+    else:
+        # Создаем источник в БД (status = pending, задача ждет в очереди)
+        source = target = await source_repo.create_source_from_archive(
+            filename=name,
+            user_id=user_id,
+            vector_storage=vector_storage,
+            source_type=source_type,
         )
-        if source:
-            context.bot_data['source_repo'].update_index_status(source.id, "failed")
 
+    try:
+        # Архив хранится до окончания индексации, чтобы задачу можно было восстановить после рестарта
+        archive_path = ingestion_worker.archive_path(str(target.id), source_type)
+        with open(archive_path, 'wb') as archive_file:
+            archive_file.write(payload)
+
+        # Индексация идет в фоне, прогресс редактируется в отдельном сообщении
+        await ingestion_worker.submit(IngestionJob(
+            source_id=str(target.id),
+            source_name=name,
+            archive_path=archive_path,
+            chat_id=update.effective_chat.id,
+            root_source_id=str(source.id) if target is not source else None,
+            source_type=source_type,
+        ))
+    except Exception:
+        await source_repo.update_index_status(target.id, "failed")
+        raise
+
+    logger.info(f"Queued {source_type} processing for user {user_id}, source {source.id}, version {target.version}")
+    return target
+
+
+@with_db_session
+async def handle_video_links(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession) -> int:
+    """Обработчик ссылок на YouTube видео: источник из их транскриптов"""
+    user_id = update.effective_user.id
+    video_ids = extract_video_ids(update.message.text or "")
+
+    if not video_ids:
+        await update.message.reply_text("Пожалуйста, отправьте ZIP-архив, ссылки на YouTube видео или используйте /cancel")
+        return WAITING_ARCHIVE
+
+    if len(video_ids) > config.transcripts.max_videos:
+        await update.message.reply_text(f"❌ Не больше {config.transcripts.max_videos} видео в одном источнике")
+        return WAITING_ARCHIVE
+
+    logger.info(f"Handling {len(video_ids)} video links from user {user_id}")
+    # Повторная отправка того же набора видео переиндексирует источник
+    name = transcript_source_name(video_ids)
+
+    try:
+        await _queue_ingestion(
+            update, context, AsyncRagSourceRepo(session), name,
+            "\n".join(video_ids).encode("utf-8"), source_type=TRANSCRIPT_SOURCE_TYPE,
+        )
+    except Exception as e:
+        logger.error(f"Error queueing video transcripts for user {user_id}: {str(e)}", exc_info=True)
+        await update.message.reply_text("❌ Произошла ошибка при обработке ссылок. Пожалуйста, попробуйте позже.")
     finally:
         context.user_data.clear()
 
-        if temp_zip_path and os.path.exists(temp_zip_path):
-            try:
-                os.unlink(temp_zip_path)
-            except Exception as e:
-                logger.error(f"Error removing temporary file {temp_zip_path}: {str(e)}")
-
     return ConversationHandler.END
 
 
+@with_db_session
+async def cancel_ingest_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
+    """Отмена фоновой индексации архива кнопкой под сообщением с прогрессом"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    source_id = query.data.replace("cancel_ingest_", "")
+
+    source = await AsyncRagSourceRepo(session).get_by_id(source_id)
+    if not source or source.user_id != user_id:
+        await query.answer("Нельзя отменить чужую загрузку", show_alert=True)
+        return
+
+    ingestion_worker: IngestionWorker = context.bot_data['ingestion_worker']
+    if ingestion_worker.cancel(source_id):
+        logger.info(f"User {user_id} cancelled ingestion of source {source_id}")
+        await query.answer("Обработка будет остановлена")
+    else:
+        await query.answer("Обработка уже завершена")
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена загрузки архива"""
     try:
@@ -182,6 +284,7 @@ rag_conv_handler = ConversationHandler(
     states={
         WAITING_ARCHIVE: [
             MessageHandler(filters.Document.ALL & ~filters.COMMAND, handle_archive),
+            MessageHandler(filters.TEXT & ~filters.COMMAND, handle_video_links),
             CommandHandler("cancel", cancel),
             CommandHandler("start", handle_other_commands),
             CommandHandler("help", handle_other_commands),
@@ -196,7 +299,7 @@ rag_conv_handler = ConversationHandler(
         CommandHandler("cancel", cancel),
         MessageHandler(
             filters.ALL & ~filters.Document.ALL & ~filters.COMMAND,
-            lambda u, c: u.message.reply_text("Пожалуйста, отправьте ZIP-архив или используйте /cancel")
+            lambda u, c: u.message.reply_text("Пожалуйста, отправьте ZIP-архив, ссылки на YouTube видео или используйте /cancel")
         )
     ],
     conversation_timeout=300,
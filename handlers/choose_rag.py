@@ -1,17 +1,20 @@
 # handlers/choose_rag.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
-from db.repos.active_rag_repo import ActiveRagSourceRepo
+from db.connection import with_db_session
+from db.repos.active_rag_repo import AsyncActiveRagSourceRepo
 
 
-async def choose_rag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@with_db_session
+async def choose_rag_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик команды /choose_rag"""
     user_id = update.effective_user.id
 
-    # Получаем репозиторий активных RAG-источников из глобальных данных бота
-    active_rag_repo: ActiveRagSourceRepo = context.bot_data['active_rag_repo']
+    # Репозиторий активных RAG-источников работает в сессии текущего апдейта
+    active_rag_repo = AsyncActiveRagSourceRepo(session)
 
-    sources = active_rag_repo.get_all_sources()
+    sources = await active_rag_repo.get_all_sources()
 
     if not sources:
         await update.message.reply_text(
@@ -20,35 +23,55 @@ async def choose_rag_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return
 
+    selected_ids = {source.id for source in await active_rag_repo.get_active_sources(user_id)}
+    reply_markup = build_sources_keyboard(sources, selected_ids)
+
+    await update.message.reply_text(
+        "📚 Выберите один или несколько RAG источников для работы:",
+        reply_markup=reply_markup
+    )
+
+
+def build_sources_keyboard(sources, selected_ids) -> InlineKeyboardMarkup:
+    """Клавиатура источников: нажатие отмечает или снимает источник, "Готово" завершает выбор"""
     keyboard = []
     for source in sources:
+        mark = "✅ " if source.id in selected_ids else ""
         keyboard.append([InlineKeyboardButton(
-            f"{source.name}",
+            f"{mark}{source.name}",
             callback_data=f"choose_rag_{source.id}"
         )])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await update.message.reply_text(
-        "📚 Выберите RAG источник для работы:",
-        reply_markup=reply_markup
-    )
+    keyboard.append([InlineKeyboardButton("Готово", callback_data="choose_rag_done")])
+    return InlineKeyboardMarkup(keyboard)
 
 
-async def choose_rag_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик выбора RAG источника"""
+@with_db_session
+async def choose_rag_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
+    """Обработчик выбора RAG источников"""
     query = update.callback_query
     user_id = update.effective_user.id
 
-    source_id = query.data.replace("choose_rag_", "")
+    active_rag_repo = AsyncActiveRagSourceRepo(session)
 
-    active_rag_repo: ActiveRagSourceRepo = context.bot_data['active_rag_repo']
-    active_rag_repo.set_active_source(user_id, source_id)
+    if query.data == "choose_rag_done":
+        sources = await active_rag_repo.get_active_sources(user_id)
+        await query.answer()
+        if not sources:
+            await query.edit_message_text("❌ Ни один источник не выбран. Повторите выбор командой /choose_rag")
+            return
 
-    source = active_rag_repo.get_active_source(user_id)
+        names = "\n".join(f"• {source.name}" for source in sources)
+        await query.edit_message_text(
+            f"✅ Выбраны источники:\n{names}\n"
+            "Теперь вы можете начать диалог командой /qviz"
+        )
+        return
+
+    source_id = query.data.replace("choose_rag_", "")
+    selected = await active_rag_repo.toggle_active_source(user_id, source_id)
 
-    await query.answer()
-    await query.edit_message_text(
-        f"✅ Выбран источник: {source.name}\n"
-        "Теперь вы можете начать диалог командой /qviz"
+    selected_ids = {source.id for source in await active_rag_repo.get_active_sources(user_id)}
+    await query.answer("Источник добавлен" if selected else "Источник убран")
+    await query.edit_message_reply_markup(
+        build_sources_keyboard(await active_rag_repo.get_all_sources(), selected_ids)
     )
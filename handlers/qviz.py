@@ -1,11 +1,19 @@
 # handlers/qviz.py
 import logging
+import os
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Union
 
-from anthropic import Anthropic
+import numpy as np
+from anthropic import AsyncAnthropic
+from sqlalchemy.ext.asyncio import AsyncSession
 from telegram import Update
 from telegram.ext import ContextTypes
+from configs.config import config
+from services.answer_cache import answer_cache
 from services.search_service import SearchService
-from db.connection import get_db
+from db.connection import with_db_session
+from db.repos.active_rag_repo import AsyncActiveRagSourceRepo
+from utils.telegram_stream import StreamingMessage
 from dotenv import load_dotenv
 
 
@@ -13,29 +21,80 @@ import asyncio
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-client = Anthropic(
+client = AsyncAnthropic(
     api_key=os.getenv('ANTHROPIC_API_KEY',)
+)
+CLAUDE_MODEL = config.llm.model
+CLAUDE_ERROR_MESSAGE = "Извините, произошла ошибка при получении ответа. Попробуйте позже."
+
+
+def build_claude_request(user_query: str, context: str) -> dict:
+    return dict(
+        model=CLAUDE_MODEL,
+        max_tokens=config.llm.max_tokens,
+        temperature=0,
+        messages=[
+            {
+                "role": "user",
+                "content": f"Context: {context}\n\nQuestion: {user_query}\n\nPlease answer based only on the provided context. Please answer only on russian language."
+            }
+        ]
+    )
+
 
+async def request_claude_response(user_query: str, context: str) -> AsyncIterator[str]:
+    """Текст ответа по частям: потоком (config.llm.streaming) или одним куском."""
+    request = build_claude_request(user_query, context)
+    if not config.llm.streaming:
+        response = await client.messages.create(**request)
+        yield response.content[0].text
+        return
 
-async def get_claude_response(user_query: str, context: str) -> str:
+    async with client.messages.stream(**request) as stream:
+        async for text in stream.text_stream:
+            yield text
+
+
+async def get_claude_response(
+        user_query: str,
+        similar_texts: List[str],
+        source_id: Optional[Union[str, List[str]]] = None,
+        query_vector: Optional[np.ndarray] = None,
+        on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> str:
+    """Ответ LLM по найденным фрагментам.
+
+    on_text получает текст по мере генерации. При temperature=0 ответ определяется
+    вопросом и контекстом, поэтому для перефразированного вопроса с тем же набором
+    фрагментов берется ответ из кэша.
+    """
+    use_cache = answer_cache is not None and source_id is not None and query_vector is not None
+    fingerprint = answer_cache.context_fingerprint(similar_texts, CLAUDE_MODEL) if use_cache else None
+
+    if use_cache:
+        cached_answer = await asyncio.to_thread(answer_cache.get, source_id, query_vector, fingerprint)
+        if cached_answer is not None:
+            if on_text:
+                await on_text(cached_answer)
+            return cached_answer
+
+    parts = []
     try:
-        response = await asyncio.to_thread(
-            lambda: client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=3000,
-                temperature=0,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"Context: {context}\n\nQuestion: {user_query}\n\nPlease answer based only on the provided context. Please answer only on russian language."
-                    }
-                ]
-            )
-        )
-        return response.content[0].text
+        async for text in request_claude_response(user_query, "\n".join(similar_texts)):
+            parts.append(text)
+            if on_text:
+                await on_text(text)
     except Exception as e:
         logger.error(f"Error getting Claude response: {e}", exc_info=True)
-        return "Извините, произошла ошибка при получении ответа. Попробуйте позже."
+        # Уже выведенную часть ответа не стираем, ошибку дописываем следом
+        if on_text:
+            await on_text(f"\n\n{CLAUDE_ERROR_MESSAGE}" if parts else CLAUDE_ERROR_MESSAGE)
+        return CLAUDE_ERROR_MESSAGE
+
+    answer = "".join(parts)
+    if use_cache:
+        await asyncio.to_thread(answer_cache.put, source_id, query_vector, fingerprint, answer)
+    return answer
 
 
 async def check_and_stop_dialog(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -50,15 +109,16 @@ async def check_and_stop_dialog(update: Update, context: ContextTypes.DEFAULT_TY
     return False
 
 
-async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@with_db_session
+async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик команды /qviz"""
     user_id = update.effective_user.id
 
-    # Проверяем наличие активного источника
-    active_rag_repo = context.bot_data['active_rag_repo']
-    active_source = active_rag_repo.get_active_source(user_id)
+    # Проверяем наличие активных источников
+    active_rag_repo = AsyncActiveRagSourceRepo(session)
+    active_sources = await active_rag_repo.get_active_sources(user_id)
 
-    if not active_source:
+    if not active_sources:
         await update.message.reply_text(
             "❌ У вас не выбран RAG источник.\n"
             "Пожалуйста, выберите источник командой /choose_rag"
@@ -67,11 +127,12 @@ async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Устанавливаем флаг активного диалога
     context.user_data['is_dialog_active'] = True
-    context.user_data['active_source_id'] = active_source.id
+    context.user_data['active_source_ids'] = [source.id for source in active_sources]
 
+    source_names = ", ".join(source.name for source in active_sources)
     await update.message.reply_text(
         f"🟢 Режим диалога активирован!\n\n"
-        f"Текущий RAG источник: {active_source.name}\n"
+        f"Текущие RAG источники: {source_names}\n"
         "Задавайте любые вопросы.\n"
         "Для выхода используйте любую команду или /stop"
     )
@@ -92,25 +153,43 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
-async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def send_fragments(update: Update, similar_texts: List[str]) -> None:
+    """Отправляет исходные фрагменты сообщениями не длиннее 4096 символов."""
+    fragments_response = "📚 Исходные фрагменты:\n"
+    for i, text in enumerate(similar_texts, 1):
+        fragments_response += f"{i}. {text}\n\n"
+
+        # Отправляем каждые 4000 символов
+        if len(fragments_response) > 4000:
+            await update.message.reply_text(fragments_response)
+            fragments_response = ""
+
+    # Отправляем оставшиеся фрагменты
+    if fragments_response:
+        await update.message.reply_text(fragments_response)
+
+
+@with_db_session
+async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     """Обработчик всех текстовых сообщений в режиме диалога"""
     if context.user_data.get('is_dialog_active'):
         user_message = update.message.text
-        active_source_id = context.user_data.get('active_source_id')
+        # Поиск идет сразу по всем выбранным источникам одним запросом
+        active_source_ids = context.user_data.get('active_source_ids')
 
         try:
-            # Получаем сессию через генератор
-            db = next(get_db())
-            search_service = SearchService(db)
+            # Сессия открывается на каждый апдейт декоратором with_db_session
+            search_service = SearchService(session)
 
             # Показываем пользователю, что запрос обрабатывается
             waiting_message = await update.message.reply_text("⏳ Ищу информацию и формирую ответ...")
 
             # Ищем похожие тексты
-            similar_texts = await search_service.search(
-                source_id=active_source_id,
+            retrieval = await search_service.retrieve(
+                source_id=active_source_ids,
                 query=user_message,
             )
+            similar_texts = retrieval.chunks
 
             if not similar_texts:
                 await waiting_message.delete()
@@ -119,10 +198,25 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return
 
-            # Формируем контекст из найденных текстов
-            context_text = "\n".join(similar_texts)
+            if config.llm.streaming:
+                # Ответ появляется в сообщении-плейсхолдере по мере генерации
+                answer_message = StreamingMessage(
+                    waiting_message, header="🤖 Ответ:\n", edit_interval=config.llm.stream_edit_interval
+                )
+                try:
+                    await get_claude_response(
+                        user_message, similar_texts, active_source_ids, retrieval.query_vector,
+                        on_text=answer_message.append,
+                    )
+                finally:
+                    # Полученная часть ответа дописывается и при ошибке генерации
+                    await answer_message.finish()
+                await send_fragments(update, similar_texts)
+                return
 
-            gpt_response = await get_claude_response(user_message, context_text)
+            gpt_response = await get_claude_response(
+                user_message, similar_texts, active_source_ids, retrieval.query_vector
+            )
 
             await waiting_message.delete()
 
@@ -142,18 +236,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text(f"🤖 Ответ:\n{gpt_response}")
 
                 # Затем отправляем исходные фрагменты
-                fragments_response = "📚 Исходные фрагменты:\n"
-                for i, text in enumerate(similar_texts, 1):
-                    fragments_response += f"{i}. {text}\n\n"
-
-                    # Отправляем каждые 4000 символов
-                    if len(fragments_response) > 4000:
-                        await update.message.reply_text(fragments_response)
-                        fragments_response = ""
-
-                # Отправляем оставшиеся фрагменты
-                if fragments_response:
-                    await update.message.reply_text(fragments_response)
+                await send_fragments(update, similar_texts)
             else:
                 await update.message.reply_text(response)
 
@@ -162,6 +245,3 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(
                 "❌ Произошла ошибка при обработке запроса. Пожалуйста, попробуйте позже."
             )
-        finally:
-            if 'db' in locals():
-                db.close()
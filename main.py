@@ -1,40 +1,68 @@
 # main.py
 
+from sqlalchemy.orm import Session
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from configs.config import config
-from db.connection import get_db
+from db.connection import close_db
 from handlers import start, help, test, qviz, add_rag_source, choose_rag
+from services.embedding_service import model_registry
+from services.ingestion_service import IngestionWorker
 from services.rag_service import RagArchiveProcessor
 from services.text_service import TextService
 from services.temp_file_service import TempFilesService
+from db.repos.embedding_bulk_loader import EmbeddingBulkLoader
 from db.repos.embedding_repo import EmbeddingRepo
 from db.repos.rag_source_repo import RagSourceRepo
-from db.repos.active_rag_repo import ActiveRagSourceRepo
+from db.repos.vector_index_repo import VectorIndexRepo
+from utils.telegram_updates import PerChatUpdateProcessor
 
 
-def main():
-    # Создание зависимостей
-    db = next(get_db())
-    source_repo = RagSourceRepo(db)
-    embedding_repo = EmbeddingRepo(db)
-    active_rag_repo = ActiveRagSourceRepo(db)
-    text_service = TextService()
-    temp_files = TempFilesService()
-
-    archive_processor = RagArchiveProcessor(
-        source_repo=source_repo,
-        embedding_repo=embedding_repo,
-        text_service=text_service,
-        temp_files=temp_files,
-        model_name_or_path="sentence-transformers/distiluse-base-multilingual-cased-v1",
+def build_archive_processor(db: Session) -> RagArchiveProcessor:
+    """Процессор архивов поверх отдельной синхронной сессии (одна на задачу индексации)."""
+    return RagArchiveProcessor(
+        source_repo=RagSourceRepo(db),
+        embedding_repo=EmbeddingRepo(db),
+        text_service=TextService(),
+        temp_files=TempFilesService(),
+        model_name_or_path=config.RAG_EMBED_MODEL,
+        index_repo=VectorIndexRepo(db),
+        bulk_loader=EmbeddingBulkLoader(db) if config.ingestion.bulk_load else None,
     )
 
-    application = Application.builder().token(config.TELEGRAM_TOKEN).build()
+
+def main():
+    # Обработчики открывают собственную AsyncSession на каждый апдейт,
+    # индексация архивов идет в фоне через IngestionWorker
+    ingestion_worker = IngestionWorker(build_archive_processor)
+
+    # Загружаем модель эмбеддингов один раз до старта бота
+    model_registry.warm_up([config.RAG_EMBED_MODEL])
+    for stats in model_registry.stats().values():
+        print(
+            f"Embedding model {stats.model_name_or_path} ({stats.backend}) loaded in {stats.load_seconds:.2f}s, "
+            f"params: {stats.params_bytes / 2 ** 20:.0f} MB"
+        )
+
+    async def post_init(app: Application) -> None:
+        await ingestion_worker.start(app.bot)
+
+    async def post_shutdown(app: Application) -> None:
+        await ingestion_worker.stop()
+        model_registry.close()
+        await close_db()
+
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_TOKEN)
+        # Апдейты разных чатов обрабатываются параллельно, одного чата - по очереди
+        .concurrent_updates(PerChatUpdateProcessor())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     application.bot_data.update({
-        'archive_processor': archive_processor,
-        'source_repo': source_repo,
-        'active_rag_repo': active_rag_repo,
+        'ingestion_worker': ingestion_worker,
     })
 
     application.add_handler(add_rag_source.rag_conv_handler)
@@ -49,6 +77,7 @@ def main():
 
     application.add_handler(CallbackQueryHandler(choose_rag.choose_rag_callback, pattern="^choose_rag_"))
     application.add_handler(CallbackQueryHandler(test.button_handler, pattern="^test_"))
+    application.add_handler(CallbackQueryHandler(add_rag_source.cancel_ingest_callback, pattern="^cancel_ingest_"))
 
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, qviz.message_handler))
 
@@ -57,4 +86,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+
+from configs.config import config
+from services.retrieval_cache import RetrievalCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnswerCacheStats:
+    """Счетчики семантического кэша ответов."""
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def _source_key(source_ids: Union[str, Iterable[str]]) -> str:
+    """Набор источников вопроса одной строкой (как в кэше поиска, без учета порядка выбора)."""
+    return ",".join(RetrievalCache.source_key(source_ids))
+
+
+class AnswerCache:
+    """Семантический кэш ответов LLM в SQLite.
+
+    Ответ переиспользуется, если вопрос задан к тому же источнику, поиск вернул
+    тот же набор фрагментов (отпечаток контекста) и эмбеддинг нового вопроса
+    близок к сохраненному не меньше чем на similarity_threshold по косинусу.
+    """
+
+    def __init__(
+            self,
+            path: str = config.answer_cache.path,
+            similarity_threshold: float = config.answer_cache.similarity_threshold,
+            max_age_seconds: float = config.answer_cache.max_age_seconds,
+            max_items: int = config.answer_cache.max_items,
+    ):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.max_age_seconds = max_age_seconds
+        self.max_items = max_items
+
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+        self.stats = AnswerCacheStats()
+
+    @staticmethod
+    def context_fingerprint(chunks: List[str], *parts: str) -> str:
+        """Отпечаток набора фрагментов (и прочего, от чего зависит ответ, например модели)."""
+        payload = "\0".join([*parts, *sorted(chunks)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, source_id: Union[str, List[str]], query_vector: np.ndarray, fingerprint: str) -> Optional[str]:
+        """Самый близкий по смыслу сохраненный ответ, если он проходит порог сходства."""
+        query = self._normalize(query_vector)
+        min_created_at = time.time() - self.max_age_seconds
+
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT query_vector, answer FROM answers "
+                "WHERE source_id = ? AND fingerprint = ? AND created_at >= ?",
+                (_source_key(source_id), fingerprint, min_created_at),
+            ).fetchall()
+
+        best_answer, best_similarity = None, self.similarity_threshold
+        for blob, answer in rows:
+            similarity = float(np.dot(np.frombuffer(blob, dtype=np.float32), query))
+            if similarity >= best_similarity:
+                best_answer, best_similarity = answer, similarity
+
+        if best_answer is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        logger.info(
+            f"Answer cache hit for source {source_id}: similarity {best_similarity:.3f} "
+            f"(hit rate: {self.stats.hit_rate:.1%})"
+        )
+        return best_answer
+
+    def put(
+            self, source_id: Union[str, List[str]], query_vector: np.ndarray, fingerprint: str, answer: str
+    ) -> None:
+        vector = self._normalize(query_vector)
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT INTO answers (source_id, fingerprint, query_vector, answer, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (_source_key(source_id), fingerprint, vector.tobytes(), answer, time.time()),
+                )
+
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._writes_since_prune = 0
+                self._prune()
+
+    def invalidate_source(self, source_id: str) -> None:
+        """Удаляет ответы с участием источника (вызывается при переиндексации)."""
+        with self._lock:
+            db = self._db()
+            with db:
+                deleted = db.execute(
+                    "DELETE FROM answers WHERE ',' || source_id || ',' LIKE ?", (f"%,{source_id},%",)
+                ).rowcount
+        logger.info(f"Answer cache invalidated for source {source_id}: {deleted} entries")
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, source_id TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                "query_vector BLOB NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_answers_lookup ON answers (source_id, fingerprint)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS ix_answers_created_at ON answers (created_at)")
+        return self._connection
+
+    def _prune(self) -> None:
+        """Удаляет устаревшие записи и самые старые сверх max_items."""
+        db = self._db()
+        with db:
+            expired = db.execute(
+                "DELETE FROM answers WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+            ).rowcount
+            (count,) = db.execute("SELECT COUNT(*) FROM answers").fetchone()
+            excess = max(count - self.max_items, 0)
+            if excess:
+                db.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY created_at LIMIT ?)",
+                    (excess,),
+                )
+        if expired or excess:
+            logger.info(f"Answer cache pruned {expired + excess} entries")
+
+
+answer_cache = AnswerCache() if config.answer_cache.enabled else None
@@ -0,0 +1,141 @@
+import logging
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from configs.config import config
+from services.embedding_service import model_registry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ChunkPolicy:
+    """Размер и перекрытие чанков.
+
+    unit - в чем измеряется длина: tokens (токенизатор модели эмбеддингов) или chars.
+    chunk_size = 0 - максимальная длина входа модели без служебных токенов,
+    так что чанк векторизуется целиком, без обрезки.
+    """
+    name: str
+    unit: str
+    chunk_size: int
+    chunk_overlap: int
+
+
+CHUNK_POLICIES: Dict[str, ChunkPolicy] = {
+    # Прежнее поведение: 500 символов с перекрытием 40%
+    "legacy": ChunkPolicy("legacy", "chars", 500, 200),
+    "tokens": ChunkPolicy("tokens", "tokens", 0, 16),
+}
+
+
+def resolve_policy(
+        name: str = config.chunking.policy,
+        chunk_size: int = config.chunking.chunk_size,
+        chunk_overlap: int = config.chunking.chunk_overlap,
+) -> ChunkPolicy:
+    """Политика по имени с переопределением размера (0 - как в политике) и перекрытия (-1 - как в политике)."""
+    policy = CHUNK_POLICIES.get(name)
+    if policy is None:
+        raise ValueError(f"Unknown chunk policy: {name}. Available: {', '.join(CHUNK_POLICIES)}")
+    return replace(
+        policy,
+        chunk_size=chunk_size or policy.chunk_size,
+        chunk_overlap=chunk_overlap if chunk_overlap >= 0 else policy.chunk_overlap,
+    )
+
+
+@dataclass
+class Chunk:
+    """Чанк документа и его положение: page, sheet, row_start / row_end, json_pointer (если есть у документа) и char_offset."""
+    text: str
+    metadata: dict = field(default_factory=dict)
+
+
+class DocumentChunker:
+    """Разбиение документов (страниц, листов) на чанки по политике.
+
+    Каждый документ режется отдельно, поэтому чанки не пересекают границы файлов
+    и страниц и наследуют метаданные документа. Для политики tokens длина меряется
+    токенизатором модели эмбеддингов, а разрезы делаются по абзацам, строкам и
+    предложениям раньше, чем по словам.
+    """
+
+    TOKEN_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+    def __init__(self, model_name_or_path: str = config.RAG_EMBED_MODEL, policy: Optional[ChunkPolicy] = None):
+        self.model_name_or_path = model_name_or_path
+        self.policy = policy or resolve_policy()
+        self._splitter: Optional[RecursiveCharacterTextSplitter] = None
+        self._tokenizer = None
+        self._chunk_limit = 0
+
+    @property
+    def splitter(self) -> RecursiveCharacterTextSplitter:
+        if self._splitter is None:
+            self._splitter = self._build_splitter()
+        return self._splitter
+
+    def _build_splitter(self) -> RecursiveCharacterTextSplitter:
+        if self.policy.unit == "chars":
+            self._chunk_limit = self.policy.chunk_size
+            return RecursiveCharacterTextSplitter(
+                chunk_size=self.policy.chunk_size,
+                chunk_overlap=self.policy.chunk_overlap,
+                add_start_index=True,
+            )
+        if self.policy.unit != "tokens":
+            raise ValueError(f"Unknown chunk size unit: {self.policy.unit}")
+
+        model = model_registry.get(self.model_name_or_path)
+        self._tokenizer = model.tokenizer
+        chunk_size = self._chunk_limit = self.policy.chunk_size or self.max_tokens(self.model_name_or_path)
+        logger.info(
+            f"Token chunking for {self.model_name_or_path}: "
+            f"{chunk_size} tokens, overlap {self.policy.chunk_overlap}"
+        )
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=self.policy.chunk_overlap,
+            length_function=self.token_length,
+            separators=self.TOKEN_SEPARATORS,
+            add_start_index=True,
+        )
+
+    @staticmethod
+    def max_tokens(model_name_or_path: str) -> int:
+        """Сколько токенов текста модель векторизует без обрезки."""
+        model = model_registry.get(model_name_or_path)
+        return model.max_seq_length - model.tokenizer.num_special_tokens_to_add()
+
+    @property
+    def chunk_limit(self) -> int:
+        """Максимальная длина чанка в единицах политики."""
+        if self._splitter is None:
+            self._splitter = self._build_splitter()
+        return self._chunk_limit
+
+    def length(self, text: str) -> int:
+        """Длина текста в единицах политики (токены или символы)."""
+        if self.policy.unit != "tokens":
+            return len(text)
+        if self._tokenizer is None:
+            self._splitter = self._build_splitter()
+        return self.token_length(text)
+
+    def token_length(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def split(self, text: str, metadata: Optional[dict] = None) -> List[Chunk]:
+        """Чанки одного документа; metadata документа копируется в каждый чанк вместе с char_offset."""
+        metadata = metadata or {}
+        documents = self.splitter.create_documents([text], [metadata])
+        return [
+            Chunk(
+                text=document.page_content,
+                metadata={**metadata, "char_offset": document.metadata.pop("start_index", None)},
+            )
+            for document in documents
+        ]
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from configs.config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EmbeddingCacheStats:
+    """Счетчики попаданий кэша эмбеддингов."""
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+
+class EmbeddingCache:
+    """Двухуровневый кэш эмбеддингов: LRU в памяти и SQLite на диске.
+
+    Ключ - модель и SHA-256 нормализованного текста, поэтому повторяющиеся чанки
+    (между источниками и при повторных загрузках) не попадают в модель дважды.
+    """
+
+    def __init__(
+            self,
+            path: Optional[str] = config.embedding_cache.path,
+            memory_items: int = config.embedding_cache.memory_items,
+            max_disk_items: int = config.embedding_cache.max_disk_items,
+    ):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_disk_items = max_disk_items
+
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+        self.stats = EmbeddingCacheStats()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Нормализация, не меняющая токенизацию: NFC и схлопывание пробельных символов."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model_key: str, text: str) -> str:
+        return hashlib.sha256(f"{model_key}\0{cls.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_key: str, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """Возвращает найденные векторы по индексам текстов и индексы промахов."""
+        keys = [self.make_key(model_key, text) for text in texts]
+        found: Dict[int, np.ndarray] = {}
+        disk_lookup: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                    self.stats.memory_hits += 1
+                else:
+                    disk_lookup.setdefault(key, []).append(i)
+
+            if disk_lookup:
+                for key, vector in self._disk_get(list(disk_lookup)).items():
+                    self._remember(key, vector)
+                    for i in disk_lookup.pop(key):
+                        found[i] = vector
+                        self.stats.disk_hits += 1
+
+            missing = sorted(i for indices in disk_lookup.values() for i in indices)
+            self.stats.misses += len(missing)
+
+        return found, missing
+
+    def put_many(self, model_key: str, texts: List[str], vectors: np.ndarray) -> None:
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(model_key, text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes(), vector.shape[0], time.time()))
+            self._disk_put(rows)
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # Соединение открывается лениво: модуль импортируется и в процессах пула разбора
+        if not self.path:
+            return None
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, dim INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS ix_created_at ON embeddings (created_at)")
+        return self._connection
+
+    def _disk_get(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        db = self._db()
+        if db is None:
+            return {}
+
+        result = {}
+        # SQLite ограничивает число параметров в запросе
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            for key, blob, _ in db.execute(
+                    f"SELECT key, vector, dim FROM embeddings WHERE key IN ({placeholders})", part
+            ):
+                result[key] = np.frombuffer(blob, dtype=np.float32)
+        return result
+
+    def _disk_put(self, rows: list) -> None:
+        db = self._db()
+        if db is None or not rows:
+            return
+
+        with db:
+            db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+
+        self._writes_since_prune += len(rows)
+        if self._writes_since_prune >= 10_000:
+            self._writes_since_prune = 0
+            self._prune()
+
+    def _prune(self) -> None:
+        """Удаляет самые старые записи сверх max_disk_items."""
+        db = self._db()
+        (count,) = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_disk_items
+        if excess > 0:
+            with db:
+                db.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY created_at LIMIT ?)",
+                    (excess,),
+                )
+            logger.info(f"Embedding cache pruned {excess} entries")
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+
+embedding_cache = EmbeddingCache() if config.embedding_cache.enabled else None
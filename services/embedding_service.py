@@ -1,31 +1,268 @@
 # utils/embedding_generator.py
 import logging
+import resource
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from configs.config import config
+from services.embedding_cache import EmbeddingCache, embedding_cache
+from services.inference_engine import InferenceEngine
 
 logger = logging.getLogger(__name__)
 
 
-class EmbeddingGenerator:
-    """Генератор векторов с помощью SentenceTransformer."""
+@dataclass
+class ModelStats:
+    """Статистика загрузки модели."""
+    model_name_or_path: str
+    resolved_path: str
+    backend: str
+    load_seconds: float
+    params_bytes: int
+    peak_rss_delta_bytes: int
+
+
+class EmbeddingModelRegistry:
+    """Реестр моделей: каждая модель загружается один раз на процесс.
+
+    backend = onnx: трансформер модели при первом запуске экспортируется в ONNX
+    (и при onnx_quantization квантуется в int8) в onnx_dir и выполняется ONNX Runtime.
+    """
+
+    def __init__(
+            self,
+            cache_dir: Optional[str] = None,
+            backend: str = config.inference.backend,
+            onnx_quantization: str = config.inference.onnx_quantization,
+            onnx_dir: str = config.inference.onnx_dir,
+    ):
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self.cache_dir = cache_dir if cache_dir is not None else config.RAG_EMBED_MODELS_CACHE
+        self.backend = backend
+        self.onnx_quantization = onnx_quantization
+        self.onnx_dir = onnx_dir or str(Path(self.cache_dir) / "onnx")
+        self._models: Dict[str, SentenceTransformer] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self._engines: Dict[str, InferenceEngine] = {}
+        self._lock = threading.Lock()
+
+    def resolve_path(self, model_name_or_path: str) -> Path:
+        """Ищет модель по пути либо в кэше HuggingFace (RAG_EMBED_MODELS_CACHE)."""
+        direct_path = Path(model_name_or_path)
+        if direct_path.exists():
+            return direct_path
+
+        model_dir = Path(self.cache_dir) / f"models--{model_name_or_path.replace('/', '--')}"
+        ref_file = model_dir / "refs" / "main"
+        if ref_file.exists():
+            snapshot = model_dir / "snapshots" / ref_file.read_text().strip()
+            if snapshot.exists():
+                return snapshot
+
+        snapshots = sorted((model_dir / "snapshots").glob("*")) if model_dir.exists() else []
+        if not snapshots:
+            raise ValueError(f"Model {model_name_or_path} not found in {self.cache_dir}")
+        return snapshots[-1]
+
+    def get(self, model_name_or_path: str) -> SentenceTransformer:
+        """Возвращает загруженную модель, загружая её при первом обращении."""
+        model = self._models.get(model_name_or_path)
+        if model is not None:
+            return model
+
+        with self._lock:
+            model = self._models.get(model_name_or_path)
+            if model is None:
+                model = self._load(model_name_or_path)
+                self._models[model_name_or_path] = model
+        return model
 
-    def __init__(self):
-        model_path = Path(
-            config.RAG_EMBED_MODELS_CACHE) / "models--sentence-transformers--distiluse-base-multilingual-cased-v1/snapshots/457e815abce54e7e5841550b602b28c0811fd286"
+    def engine(self, model_name_or_path: str) -> InferenceEngine:
+        """Движок инференса модели (один на модель, вместе с его пулом процессов и статистикой)."""
+        engine = self._engines.get(model_name_or_path)
+        if engine is not None:
+            return engine
 
+        model = self.get(model_name_or_path)
+        with self._lock:
+            engine = self._engines.get(model_name_or_path)
+            if engine is None:
+                engine = self._engines[model_name_or_path] = InferenceEngine(model)
+        return engine
+
+    def close(self) -> None:
+        """Останавливает пулы процессов движков инференса."""
+        for engine in self._engines.values():
+            engine.close()
+
+    def _load(self, model_name_or_path: str) -> SentenceTransformer:
+        model_path = self.resolve_path(model_name_or_path)
         logger.info(f"Loading model from: {model_path}")
 
-        if not model_path.exists():
-            raise ValueError(f"Model not found at {model_path}")
+        rss_before = self._peak_rss_bytes()
+        started = time.perf_counter()
+        if self.backend == "onnx":
+            model, model_path = self._load_onnx(model_name_or_path, model_path)
+        else:
+            model = SentenceTransformer(str(model_path))
+        load_seconds = time.perf_counter() - started
+
+        self._stats[model_name_or_path] = ModelStats(
+            model_name_or_path=model_name_or_path,
+            resolved_path=str(model_path),
+            backend=self.backend,
+            load_seconds=load_seconds,
+            params_bytes=self._params_bytes(model, model_path),
+            peak_rss_delta_bytes=max(self._peak_rss_bytes() - rss_before, 0),
+        )
+        logger.info(f"Model loaded successfully from: {model_path} in {load_seconds:.2f}s")
+        return model
+
+    def _params_bytes(self, model: SentenceTransformer, model_path: Path) -> int:
+        """Размер весов модели.
+
+        torch модули считаются по parameters(). У ONNX модели веса трансформера лежат
+        в ONNX файле (и его внешних данных) и в parameters() не попадают, поэтому к
+        параметрам оставшихся torch модулей (Pooling, Dense) добавляется размер файлов.
+        """
+        params_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        if self.backend == "onnx":
+            params_bytes += sum(
+                path.stat().st_size
+                for path in (model_path, model_path.with_name(f"{model_path.name}_data"))
+                if path.is_file()
+            )
+        return params_bytes
+
+    def onnx_file_suffix(self) -> str:
+        return f"qint8_{self.onnx_quantization}"
+
+    def onnx_file_name(self) -> str:
+        if self.onnx_quantization:
+            return f"model_{self.onnx_file_suffix()}.onnx"
+        return "model.onnx"
+
+    def _load_onnx(self, model_name_or_path: str, model_path: Path) -> tuple[SentenceTransformer, Path]:
+        """Загружает ONNX версию модели, экспортируя ее при первом обращении.
+
+        Возвращает модель и путь к ONNX файлу: он входит в ключ кэша эмбеддингов,
+        так что векторы квантованной модели не смешиваются с векторами PyTorch.
+        """
+        export_dir = Path(self.onnx_dir) / model_name_or_path.replace("/", "--")
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if config.inference.torch_threads > 0:
+            import onnxruntime
 
-        self.model = SentenceTransformer(str(model_path))
-        logger.info(f"Model loaded successfully from: {model_path}")
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = config.inference.torch_threads
+            model_kwargs["session_options"] = session_options
 
-    def create_embeddings(self, texts: list[str]) -> np.ndarray:
+        if self._find_onnx_file(export_dir, self.onnx_file_name()) is None:
+            if self._find_onnx_file(export_dir, "model.onnx") is None:
+                logger.info(f"Exporting {model_name_or_path} to ONNX: {export_dir}")
+                SentenceTransformer(str(model_path), backend="onnx", model_kwargs=model_kwargs).save(str(export_dir))
+            if self.onnx_quantization:
+                # Импорт здесь: функции экспорта нужны только при первом запуске
+                from sentence_transformers import export_dynamic_quantized_onnx_model
+
+                logger.info(f"Quantizing ONNX model {model_name_or_path} for {self.onnx_quantization}")
+                # Суффикс задается явно: по умолчанию он зависит от типа весов (avx2 - quint8)
+                export_dynamic_quantized_onnx_model(
+                    SentenceTransformer(str(export_dir), backend="onnx", model_kwargs=model_kwargs),
+                    self.onnx_quantization,
+                    str(export_dir),
+                    file_suffix=self.onnx_file_suffix(),
+                )
+
+        onnx_file = self._find_onnx_file(export_dir, self.onnx_file_name())
+        if onnx_file is None:
+            raise ValueError(f"ONNX model {self.onnx_file_name()} not found in {export_dir}")
+        model = SentenceTransformer(
+            str(export_dir),
+            backend="onnx",
+            model_kwargs={**model_kwargs, "file_name": onnx_file.relative_to(export_dir).as_posix()},
+        )
+        return model, onnx_file
+
+    @staticmethod
+    def _find_onnx_file(export_dir: Path, file_name: str) -> Optional[Path]:
+        """ONNX файл сохраненной модели: в подкаталоге onnx/ или в корне, в зависимости от версии экспорта."""
+        for candidate in (export_dir / "onnx" / file_name, export_dir / file_name):
+            if candidate.exists():
+                return candidate
+        return None
+
+    def warm_up(self, model_names: Iterable[str]) -> None:
+        """Предзагрузка моделей при старте бота."""
+        for model_name_or_path in model_names:
+            self.get(model_name_or_path)
+
+    def stats(self) -> Dict[str, ModelStats]:
+        """Статистика по загруженным моделям."""
+        return dict(self._stats)
+
+    def is_loaded(self, model_name_or_path: str) -> bool:
+        return model_name_or_path in self._models
+
+    @staticmethod
+    def _peak_rss_bytes() -> int:
+        # ru_maxrss в Linux возвращается в килобайтах
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+model_registry = EmbeddingModelRegistry()
+
+
+class EmbeddingGenerator:
+    """Генератор векторов с помощью SentenceTransformer.
+
+    Перед моделью стоит кэш эмбеддингов: повторяющиеся тексты не векторизуются повторно.
+    """
+
+    def __init__(
+            self,
+            model_name_or_path: str = config.RAG_EMBED_MODEL,
+            cache: Optional[EmbeddingCache] = embedding_cache,
+    ):
+        self.model_name_or_path = model_name_or_path
+        self.model = model_registry.get(model_name_or_path)
+        self.engine = model_registry.engine(model_name_or_path)
+        self.cache = cache
+        # Идентичность модели для ключа кэша: имя и конкретный снимок весов
+        self.model_key = f"{model_name_or_path}@{model_registry.stats()[model_name_or_path].resolved_path}"
+
+    def create_embeddings(self, texts: list[str], progress: Optional[Callable[[int], None]] = None) -> np.ndarray:
+        """progress получает число векторизованных моделью текстов (попадания в кэш не считаются)."""
         logger.info(f"Creating embeddings for {len(texts)} texts")
-        result = self.model.encode(texts, convert_to_numpy=True)
-        logger.info(f"Created embeddings with shape: {result.shape}")
+        if self.cache is None:
+            result = self.engine.encode(texts, progress)
+            logger.info(f"Created embeddings with shape: {result.shape}")
+            return result
+
+        found, missing = self.cache.get_many(self.model_key, texts)
+        unique_texts = []
+        if missing:
+            # Одинаковые (после нормализации) тексты внутри пачки тоже векторизуются один раз
+            indices_by_key = {}
+            for i in missing:
+                indices_by_key.setdefault(self.cache.make_key(self.model_key, texts[i]), []).append(i)
+            unique_texts = [texts[indices[0]] for indices in indices_by_key.values()]
+
+            vectors = self.engine.encode(unique_texts, progress)
+            self.cache.put_many(self.model_key, unique_texts, vectors)
+            for indices, vector in zip(indices_by_key.values(), vectors):
+                for i in indices:
+                    found[i] = vector
+
+        result = np.vstack([found[i] for i in range(len(texts))]) if texts else np.zeros((0, 0), np.float32)
+        logger.info(
+            f"Created embeddings with shape: {result.shape}, encoded {len(unique_texts)}, "
+            f"cache hit rate: {self.cache.stats.hit_rate:.1%}"
+        )
         return result
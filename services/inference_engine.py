@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+from configs.config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class InferenceStats:
+    """Накопленная статистика векторизации."""
+    texts: int = 0
+    batches: int = 0
+    tokens: int = 0
+    padded_tokens: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.texts / self.seconds if self.seconds else 0.0
+
+    @property
+    def padding_ratio(self) -> float:
+        """Доля паддинга в обработанных моделью токенах."""
+        return 1 - self.tokens / self.padded_tokens if self.padded_tokens else 0.0
+
+
+class InferenceEngine:
+    """Векторизация пачек текстов моделью SentenceTransformer.
+
+    Тексты сортируются по длине в токенах и режутся на батчи по бюджету
+    max_batch_tokens (длина самого длинного текста батча * размер батча), так что
+    короткие чанки идут крупными батчами, а паддинг почти не тратит вычисления.
+    Пачки от multi_process_min_texts текстов при processes > 0 кодируются пулом процессов.
+    """
+
+    def __init__(
+            self,
+            model: SentenceTransformer,
+            batch_size: int = config.inference.batch_size,
+            max_batch_tokens: int = config.inference.max_batch_tokens,
+            torch_threads: int = config.inference.torch_threads,
+            processes: int = config.inference.processes,
+            multi_process_min_texts: int = config.inference.multi_process_min_texts,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.processes = processes
+        self.multi_process_min_texts = multi_process_min_texts
+        self.stats = InferenceStats()
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        if torch_threads > 0:
+            torch.set_num_threads(torch_threads)
+            logger.info(f"Torch intra-op threads: {torch_threads}")
+
+    def tokenize(self, texts: List[str]) -> Tuple[dict, np.ndarray]:
+        """Признаки модели для всех текстов (как в SentenceTransformer.encode) и их длины в токенах.
+
+        Длины считаются по attention_mask - со служебными токенами и обрезкой до max_seq_length.
+        """
+        features = self.model.tokenize(texts)
+        lengths = features["attention_mask"].sum(dim=1).cpu().numpy().astype(np.int64)
+        return features, lengths
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Длины текстов в токенах, как их увидит модель."""
+        return self.tokenize(texts)[1]
+
+    def plan_batches(self, sorted_lengths: np.ndarray) -> List[slice]:
+        """Батчи по отсортированным по убыванию длинам: в каждом не больше max_batch_tokens с паддингом."""
+        batches = []
+        start = 0
+        while start < len(sorted_lengths):
+            longest = max(int(sorted_lengths[start]), 1)
+            size = max(min(self.batch_size, self.max_batch_tokens // longest), 1)
+            batches.append(slice(start, start + size))
+            start += size
+        return batches
+
+    def encode(self, texts: List[str], progress: Optional[Callable[[int], None]] = None) -> np.ndarray:
+        """Эмбеддинги в исходном порядке texts; progress вызывается с числом готовых текстов."""
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        started = time.perf_counter()
+        if self.processes > 0 and len(texts) >= self.multi_process_min_texts:
+            return self._encode_multi_process(texts, started, progress)
+
+        # Тексты токенизируются один раз: те же признаки дают длины для батчей и вход модели
+        features, lengths = self.tokenize(texts)
+        # Длинные первыми: самый тяжелый батч выполняется сразу, а не в конце
+        order = np.argsort(-lengths, kind="stable")
+        sorted_lengths = lengths[order]
+        batches = self.plan_batches(sorted_lengths)
+
+        parts = []
+        done = 0
+        for batch in batches:
+            parts.append(self._forward(texts, features, order[batch], int(sorted_lengths[batch].max())))
+            done += len(parts[-1])
+            if progress:
+                progress(done)
+        sorted_vectors = np.vstack(parts)
+
+        result = np.empty_like(sorted_vectors)
+        result[order] = sorted_vectors
+
+        elapsed = time.perf_counter() - started
+        padded_tokens = sum(int(sorted_lengths[batch].max()) * len(sorted_lengths[batch]) for batch in batches)
+        self.stats.texts += len(texts)
+        self.stats.batches += len(batches)
+        self.stats.tokens += int(lengths.sum())
+        self.stats.padded_tokens += padded_tokens
+        self.stats.seconds += elapsed
+        if len(texts) > 1:
+            logger.info(
+                f"Encoded {len(texts)} texts in {len(batches)} batches, {elapsed:.2f}s "
+                f"({len(texts) / elapsed:.1f} chunks/s, padding {1 - lengths.sum() / padded_tokens:.1%}; "
+                f"total {self.stats.chunks_per_second:.1f} chunks/s)"
+            )
+        return result
+
+    def _forward(self, texts: List[str], features: dict, indices: np.ndarray, longest: int) -> np.ndarray:
+        """Эмбеддинги texts[indices] по уже готовым признакам, обрезанным до самого длинного в батче."""
+        if self.model.tokenizer.padding_side != "right":
+            # Паддинг слева нельзя обрезать срезом колонок - такие батчи токенизирует сама модель
+            batch_texts = [texts[i] for i in indices]
+            return self.model.encode(
+                batch_texts, batch_size=len(batch_texts), convert_to_numpy=True, show_progress_bar=False
+            )
+
+        rows = torch.as_tensor(indices)
+        batch_features = {
+            name: value[rows, :longest] if isinstance(value, torch.Tensor) and value.dim() == 2 else value
+            for name, value in features.items()
+        }
+        batch_features = {
+            name: value.to(self.model.device) if isinstance(value, torch.Tensor) else value
+            for name, value in batch_features.items()
+        }
+        with torch.no_grad():
+            embeddings = self.model(batch_features)["sentence_embedding"]
+        return embeddings.detach().cpu().numpy()
+
+    def _encode_multi_process(
+            self, texts: List[str], started: float, progress: Optional[Callable[[int], None]]
+    ) -> np.ndarray:
+        """Кодирование пулом процессов: токенизируют сами процессы пула.
+
+        Для порядка хватает длины в символах, поэтому в основном процессе тексты
+        не токенизируются; статистика паддинга для таких пачек не считается.
+        """
+        # Каждому процессу уходят куски соседних (близких по длине) текстов
+        order = np.argsort(-np.array([len(text) for text in texts]), kind="stable")
+        sorted_texts = [texts[i] for i in order]
+        chunk_size = max(len(sorted_texts) // (self.processes * 4), self.batch_size)
+        sorted_vectors = self.model.encode_multi_process(
+            sorted_texts, self._get_pool(), batch_size=self.batch_size, chunk_size=chunk_size
+        )
+        if progress:
+            progress(len(texts))
+
+        result = np.empty_like(sorted_vectors)
+        result[order] = sorted_vectors
+
+        elapsed = time.perf_counter() - started
+        self.stats.texts += len(texts)
+        self.stats.batches += -(-len(texts) // self.batch_size)
+        self.stats.seconds += elapsed
+        logger.info(
+            f"Encoded {len(texts)} texts with {self.processes} processes, {elapsed:.2f}s "
+            f"({len(texts) / elapsed:.1f} chunks/s; total {self.stats.chunks_per_second:.1f} chunks/s)"
+        )
+        return result
+
+    def _get_pool(self) -> dict:
+        with self._pool_lock:
+            if self._pool is None:
+                # Потоки torch делятся между процессами пула, иначе ядра переподписываются
+                threads = str(max((os.cpu_count() or 1) // self.processes, 1))
+                previous = os.environ.get("OMP_NUM_THREADS")
+                os.environ["OMP_NUM_THREADS"] = threads
+                try:
+                    self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.processes)
+                finally:
+                    if previous is None:
+                        os.environ.pop("OMP_NUM_THREADS", None)
+                    else:
+                        os.environ["OMP_NUM_THREADS"] = previous
+                logger.info(f"Started embedding process pool: {self.processes} processes x {threads} threads")
+            return self._pool
+
+    def close(self) -> None:
+        """Останавливает пул процессов, если он запускался."""
+        with self._pool_lock:
+            if self._pool is not None:
+                SentenceTransformer.stop_multi_process_pool(self._pool)
+                self._pool = None
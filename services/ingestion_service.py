@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from configs.config import config
+from db.connection import AsyncSessionLocal, SessionLocal
+from db.repos.rag_source_repo import AsyncRagSourceRepo
+from services.answer_cache import answer_cache
+from services.rag_service import RagArchiveProcessor
+from services.retrieval_cache import retrieval_cache
+from services.temp_file_service import ArchiveLimitError
+
+logger = logging.getLogger(__name__)
+
+# Статусы rag_sources.index_status, которые означают незавершенную индексацию
+UNFINISHED_STATUSES = ["pending", "processing"]
+# Тип источника со списком видео вместо архива (rag_sources.source_type)
+TRANSCRIPT_SOURCE_TYPE = "youtube"
+# Не чаще одного редактирования сообщения с прогрессом за этот интервал (лимиты Telegram)
+PROGRESS_INTERVAL_SECONDS = 3.0
+
+
+class IngestionCancelled(Exception):
+    """Индексация отменена пользователем."""
+
+
+@dataclass
+class IngestionJob:
+    """Задача индексации архива (или списка видео для source_type = youtube)."""
+    source_id: str
+    source_name: str
+    archive_path: str
+    chat_id: int
+    message_id: Optional[int] = None
+    cancelled: bool = False
+    chunks_count: int = 0
+    # Источник, новой версией которого является source_id (None - индексация на месте)
+    root_source_id: Optional[str] = None
+    source_type: str = "archive"
+
+
+class IngestionWorker:
+    """Фоновая очередь индексации архивов.
+
+    Очередь переживает рестарт: задача хранится как rag_sources.index_status = 'pending'
+    плюс архив в config.ingestion.uploads_dir. Файлы архива разбираются в пуле процессов,
+    чанкинг, векторизация и запись идут пачками в отдельном потоке, event loop бота
+    не блокируется. Переиндексация пишет новую версию источника, поиск переключается
+    на нее после завершения, а замененные версии периодически удаляются в фоне.
+    """
+
+    def __init__(
+            self,
+            processor_factory: Callable[[Session], RagArchiveProcessor],
+            uploads_dir: str = config.ingestion.uploads_dir,
+            concurrent_jobs: int = config.ingestion.concurrent_jobs,
+            process_workers: int = config.ingestion.process_workers,
+            gc_interval: float = config.ingestion.version_gc_interval,
+            gc_grace: float = config.ingestion.version_gc_grace,
+    ):
+        self.processor_factory = processor_factory
+        self.uploads_dir = uploads_dir
+        self.concurrent_jobs = concurrent_jobs
+        self.process_workers = process_workers
+        self.gc_interval = gc_interval
+        self.gc_grace = gc_grace
+
+        self.bot: Optional[Bot] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def archive_path(self, source_id: str, source_type: str = "archive") -> str:
+        """Путь, по которому архив (или список id видео) источника хранится до окончания индексации."""
+        extension = "txt" if source_type == TRANSCRIPT_SOURCE_TYPE else "zip"
+        return os.path.join(self.uploads_dir, f"{source_id}.{extension}")
+
+    async def start(self, bot: Bot) -> None:
+        """Запуск обработчиков очереди и восстановление незавершенных задач."""
+        self.bot = bot
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        # spawn: дочерние процессы не наследуют потоки torch и соединения с БД
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.process_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._tasks = [
+            asyncio.create_task(self._consume(), name=f"ingestion-worker-{i}")
+            for i in range(self.concurrent_jobs)
+        ]
+        self._tasks.append(asyncio.create_task(self._collect_garbage_periodically(), name="ingestion-gc"))
+        await self.recover()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def recover(self) -> None:
+        """Возвращает в очередь задачи, оставшиеся в pending/processing после рестарта."""
+        async with AsyncSessionLocal() as session:
+            source_repo = AsyncRagSourceRepo(session)
+            sources = await source_repo.get_by_index_statuses(UNFINISHED_STATUSES)
+
+            for source in sources:
+                source_id = str(source.id)
+                if source_id in self._jobs:
+                    continue
+
+                archive_path = self.archive_path(source_id, source.source_type)
+                if not os.path.exists(archive_path):
+                    logger.warning(f"Archive for unfinished source {source_id} is missing, marking as failed")
+                    await source_repo.update_index_status(source.id, "failed")
+                    continue
+
+                logger.info(f"Recovering ingestion job for source {source_id}")
+                await source_repo.update_index_status(source.id, "pending")
+                # В личных чатах chat_id совпадает с user_id
+                await self.submit(IngestionJob(
+                    source_id=source_id,
+                    source_name=source.name,
+                    archive_path=archive_path,
+                    chat_id=source.user_id,
+                    root_source_id=str(source.root_id) if source.root_id else None,
+                    source_type=source.source_type,
+                ))
+
+    async def submit(self, job: IngestionJob) -> None:
+        """Ставит задачу в очередь и показывает пользователю сообщение с прогрессом."""
+        self._jobs[job.source_id] = job
+        await self._report(job, "🕓 Архив в очереди на обработку...", cancellable=True)
+        await self._queue.put(job)
+
+    def cancel(self, source_id: str) -> bool:
+        """Помечает задачу отмененной; она прервется на ближайшей границе этапов."""
+        job = self._jobs.get(str(source_id))
+        if not job:
+            return False
+        job.cancelled = True
+        return True
+
+    def get_job(self, source_id: str) -> Optional[IngestionJob]:
+        """Задача источника или любой его версии."""
+        source_id = str(source_id)
+        if source_id in self._jobs:
+            return self._jobs[source_id]
+        return next((job for job in self._jobs.values() if job.root_source_id == source_id), None)
+
+    async def _consume(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._jobs.pop(job.source_id, None)
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob) -> None:
+        loop = asyncio.get_running_loop()
+
+        try:
+            self._check_cancelled(job)
+            await self._set_status(job, "processing")
+
+            if job.source_type == TRANSCRIPT_SOURCE_TYPE:
+                await self._report(job, "🎬 Загрузка транскриптов видео...", cancellable=True)
+            else:
+                await self._report(job, "📂 Распаковка и разбор файлов...", cancellable=True)
+            job.chunks_count = await asyncio.to_thread(self._ingest, job, loop)
+
+            if job.root_source_id:
+                # Поиск переключается на новую версию одной транзакцией
+                async with AsyncSessionLocal() as session:
+                    await AsyncRagSourceRepo(session).activate_version(job.root_source_id, job.source_id)
+            else:
+                await self._set_status(job, "completed")
+            await self._report(
+                job,
+                f"✅ Архив успешно обработан и добавлен в базу знаний!\n"
+                f"📊 Добавлено чанков: {job.chunks_count}\n"
+                f"🗂 Источник: {job.source_name}"
+            )
+            logger.info(f"Ingestion completed for source {job.source_id}, chunks: {job.chunks_count}")
+
+        except IngestionCancelled:
+            await self._set_status(job, "cancelled")
+            await self._report(job, f"🚫 Обработка архива {job.source_name} отменена.")
+            logger.info(f"Ingestion cancelled for source {job.source_id}")
+
+        except ArchiveLimitError as e:
+            logger.warning(f"Archive for source {job.source_id} rejected: {e}")
+            await self._set_status(job, "failed")
+            await self._report(job, f"❌ Архив отклонен: превышены ограничения на распаковку.\n{e}")
+
+        except Exception as e:
+            logger.error(f"Error processing archive for source {job.source_id}: {str(e)}", exc_info=True)
+            await self._set_status(job, "failed")
+            await self._report(job, "❌ Произошла ошибка при обработке архива. Пожалуйста, попробуйте позже.")
+
+        finally:
+            # Даже прерванная индексация могла изменить чанки источника
+            # Кэши ключуются по источнику, который выбирает пользователь (для версий - root)
+            searched_source_id = job.root_source_id or job.source_id
+            if retrieval_cache is not None:
+                retrieval_cache.invalidate_source(searched_source_id)
+            if answer_cache is not None:
+                answer_cache.invalidate_source(searched_source_id)
+            if os.path.exists(job.archive_path):
+                os.unlink(job.archive_path)
+
+    def _ingest(self, job: IngestionJob, loop: asyncio.AbstractEventLoop) -> int:
+        """Выполняется в отдельном потоке; прогресс отправляется обратно в event loop."""
+
+        started = last_report = time.monotonic()
+
+        def progress(chunks_count: int) -> None:
+            nonlocal last_report
+            self._check_cancelled(job)
+            job.chunks_count = chunks_count
+
+            if time.monotonic() - last_report < PROGRESS_INTERVAL_SECONDS:
+                return
+            last_report = time.monotonic()
+            rate = chunks_count / max(last_report - started, 1e-9)
+            asyncio.run_coroutine_threadsafe(
+                self._report(job, f"🧠 Обработано чанков: {chunks_count} ({rate:.0f} чанков/с)...", cancellable=True),
+                loop,
+            )
+
+        # Отдельная синхронная сессия на задачу: задачи не делят соединение
+        with SessionLocal() as session:
+            processor = self.processor_factory(session)
+            base_source_id = None
+            if job.root_source_id:
+                base_source_id = str(processor.source_repo.get_by_id(job.root_source_id).search_source_id)
+            if job.source_type == TRANSCRIPT_SOURCE_TYPE:
+                with open(job.archive_path, encoding="utf-8") as file:
+                    video_ids = [line.strip() for line in file if line.strip()]
+                chunks_count = processor.ingest_transcripts(
+                    video_ids, job.source_id, progress=progress, base_source_id=base_source_id,
+                )
+            else:
+                chunks_count = processor.ingest_archive(
+                    job.archive_path, job.source_id, executor=self._pool, progress=progress,
+                    base_source_id=base_source_id, max_in_flight=2 * self.process_workers,
+                )
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Source {job.source_id}: {chunks_count} chunks in {elapsed:.1f}s "
+            f"({chunks_count / max(elapsed, 1e-9):.1f} chunks/s)"
+        )
+        return chunks_count
+
+    async def _collect_garbage_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.collect_garbage)
+            except Exception as e:
+                logger.error(f"Error collecting outdated source versions: {e}", exc_info=True)
+            await asyncio.sleep(self.gc_interval)
+
+    def collect_garbage(self) -> int:
+        """Удаляет данные версий, замененных больше gc_grace секунд назад."""
+        # updated_at пишется как datetime.utcnow()
+        older_than = datetime.utcnow() - timedelta(seconds=self.gc_grace)
+        with SessionLocal() as session:
+            return self.processor_factory(session).collect_garbage(older_than)
+
+    @staticmethod
+    def _check_cancelled(job: IngestionJob) -> None:
+        if job.cancelled:
+            raise IngestionCancelled(job.source_id)
+
+    @staticmethod
+    async def _set_status(job: IngestionJob, status: str) -> None:
+        async with AsyncSessionLocal() as session:
+            await AsyncRagSourceRepo(session).update_index_status(job.source_id, status)
+
+    async def _report(self, job: IngestionJob, text: str, cancellable: bool = False) -> None:
+        """Редактирует сообщение с прогрессом (или отправляет его, если его еще нет)."""
+        if not self.bot:
+            return
+
+        reply_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("Отменить", callback_data=f"cancel_ingest_{job.source_id}")
+        ]]) if cancellable else None
+
+        try:
+            if job.message_id is None:
+                message = await self.bot.send_message(job.chat_id, text, reply_markup=reply_markup)
+                job.message_id = message.message_id
+            else:
+                await self.bot.edit_message_text(
+                    text, chat_id=job.chat_id, message_id=job.message_id, reply_markup=reply_markup
+                )
+        except BadRequest as e:
+            # "Message is not modified" и удаленные сообщения не должны ронять индексацию
+            logger.warning(f"Could not update progress message for source {job.source_id}: {e}")
+        except Exception as e:
+            logger.error(f"Error sending progress for source {job.source_id}: {e}")
@@ -0,0 +1,273 @@
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import magic
+from langchain_community.document_loaders import Docx2txtLoader, TextLoader
+
+from configs.config import config
+from utils.custom_loaders import ExcelLoader, JSONStreamLoader, ParallelPDFLoader
+
+logger = logging.getLogger(__name__)
+
+LoaderFactory = Callable[[str], Any]
+SNIFF_BYTES = 4096
+
+
+@dataclass
+class LoaderSpec:
+    """Тип файлов и фабрика его загрузчика (принимает путь файла)."""
+    name: str
+    factory: LoaderFactory
+    extensions: Tuple[str, ...] = ()
+    mime_types: Tuple[str, ...] = ()
+    mime_prefixes: Tuple[str, ...] = ()
+
+
+@dataclass
+class ParseTiming:
+    """Разбор одного файла: каким загрузчиком, сколько документов и за сколько секунд."""
+    loader: Optional[str]
+    detected_by: str
+    seconds: float
+    documents: int = 0
+    failed: bool = False
+
+
+@dataclass
+class ParseStats:
+    """Суммарное время разбора по типам загрузчиков за одну индексацию."""
+    files: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+    documents: Dict[str, int] = field(default_factory=dict)
+    failed: Dict[str, int] = field(default_factory=dict)
+    detected_by: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, timing: ParseTiming) -> None:
+        loader = timing.loader or "unsupported"
+        self.files[loader] = self.files.get(loader, 0) + 1
+        self.seconds[loader] = self.seconds.get(loader, 0.0) + timing.seconds
+        self.documents[loader] = self.documents.get(loader, 0) + timing.documents
+        self.failed[loader] = self.failed.get(loader, 0) + timing.failed
+        self.detected_by[timing.detected_by] = self.detected_by.get(timing.detected_by, 0) + 1
+
+    def summary(self) -> str:
+        parts = [
+            f"{loader}: {files} files, {self.documents[loader]} docs, {self.seconds[loader]:.2f}s"
+            + (f", {self.failed[loader]} failed" if self.failed[loader] else "")
+            for loader, files in sorted(self.files.items(), key=lambda item: -self.seconds[item[0]])
+        ]
+        detection = ", ".join(f"{method}: {count}" for method, count in sorted(self.detected_by.items()))
+        return f"{'; '.join(parts)} (detected by {detection})"
+
+
+class LoaderRegistry:
+    """Выбор загрузчика для файла.
+
+    Тип определяется по расширению, затем по сигнатуре первых байт и только
+    после этого через libmagic; экземпляр magic.Magic один на поток, база libmagic
+    не перечитывается для каждого файла. Новые типы регистрируются через register,
+    в том числе из модулей-плагинов (RAG_LOADER_PLUGINS).
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, LoaderSpec] = {}
+        self._by_extension: Dict[str, str] = {}
+        self._by_mime: Dict[str, str] = {}
+        self._local = threading.local()
+
+    def register(
+            self,
+            name: str,
+            extensions: Tuple[str, ...] = (),
+            mime_types: Tuple[str, ...] = (),
+            mime_prefixes: Tuple[str, ...] = (),
+    ) -> Callable[[LoaderFactory], LoaderFactory]:
+        """Декоратор фабрики загрузчика; повторная регистрация имени заменяет прежнюю."""
+
+        def decorator(factory: LoaderFactory) -> LoaderFactory:
+            spec = LoaderSpec(
+                name=name,
+                factory=factory,
+                extensions=tuple(extension.lower() for extension in extensions),
+                mime_types=tuple(mime_types),
+                mime_prefixes=tuple(mime_prefixes),
+            )
+            self._specs[name] = spec
+            for extension in spec.extensions:
+                self._by_extension[extension] = name
+            for mime_type in spec.mime_types:
+                self._by_mime[mime_type] = name
+            return factory
+
+        return decorator
+
+    def detect(self, file_path: str) -> Tuple[Optional[str], str]:
+        """Имя загрузчика и способ определения: extension, signature или libmagic."""
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in self._by_extension:
+            return self._by_extension[extension], "extension"
+
+        with open(file_path, "rb") as file:
+            head = file.read(SNIFF_BYTES)
+        name = self._sniff(file_path, head)
+        if name in self._specs:
+            return name, "signature"
+
+        mime_type = self._magic().from_file(file_path)
+        logger.info(f"Detected MIME type for {file_path}: {mime_type}")
+        return self._by_mime_type(mime_type), "libmagic"
+
+    def create_loader(self, name: str, file_path: str) -> Any:
+        return self._specs[name].factory(file_path)
+
+    def _by_mime_type(self, mime_type: str) -> Optional[str]:
+        if mime_type in self._by_mime:
+            return self._by_mime[mime_type]
+        for spec in self._specs.values():
+            if any(mime_type.startswith(prefix) for prefix in spec.mime_prefixes):
+                return spec.name
+        return None
+
+    @staticmethod
+    def _sniff(file_path: str, head: bytes) -> Optional[str]:
+        """Тип по сигнатуре начала файла; None - решит libmagic (например, OLE .doc/.xls)."""
+        if head.startswith(b"%PDF"):
+            return "pdf"
+        if head.startswith(b"PK\x03\x04"):
+            # Office Open XML - ZIP с характерным каталогом внутри
+            try:
+                with zipfile.ZipFile(file_path) as archive:
+                    names = archive.namelist()
+            except zipfile.BadZipFile:
+                return None
+            if any(name.startswith("word/") for name in names):
+                return "docx"
+            if any(name.startswith("xl/") for name in names):
+                return "excel"
+            return None
+        if not head or b"\x00" in head:
+            return None
+        try:
+            text = head.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # Символ UTF-8, разрезанный границей прочитанного блока, не делает файл бинарным
+            if len(head) < SNIFF_BYTES or e.start < len(head) - 3:
+                return None
+            text = head[:e.start].decode("utf-8")
+        if text.lstrip("\ufeff \t\r\n")[:1] in ("{", "[") and _looks_like_json(text, len(head) < SNIFF_BYTES):
+            return "json"
+        return "text"
+
+    def _magic(self) -> magic.Magic:
+        detector = getattr(self._local, "magic", None)
+        if detector is None:
+            detector = self._local.magic = magic.Magic(mime=True)
+        return detector
+
+
+def _looks_like_json(text: str, complete: bool) -> bool:
+    """Маленький файл проверяется целиком, у большого достаточно первого символа."""
+    if not complete:
+        return True
+    try:
+        json.loads(text.lstrip("\ufeff"))
+        return True
+    except ValueError:
+        return False
+
+
+def parse_file(file_path: str) -> Tuple[List[Tuple[str, dict]], ParseTiming]:
+    """Документы файла (текст, metadata загрузчика) и время разбора."""
+    started = time.perf_counter()
+    name, detected_by, documents, failed = None, "none", [], False
+    try:
+        name, detected_by = loader_registry.detect(file_path)
+        if name:
+            logger.info(f"Loading file {file_path} with {name} loader")
+            for doc in loader_registry.create_loader(name, file_path).lazy_load():
+                if doc.page_content.strip():  # проверяем, что контент не пустой
+                    documents.append((doc.page_content, doc.metadata))
+            logger.info(f"Successfully loaded content from {file_path}")
+        else:
+            logger.warning(f"No suitable loader found for file: {file_path}")
+    except Exception as e:
+        failed = True
+        logger.error(f"Error loading file {file_path}: {str(e)}", exc_info=True)
+
+    return documents, ParseTiming(name, detected_by, time.perf_counter() - started, len(documents), failed)
+
+
+loader_registry = LoaderRegistry()
+
+
+@loader_registry.register(
+    "json",
+    extensions=(".json", ".jsonl", ".ndjson"),
+    mime_types=("application/json", "application/x-ndjson", "application/jsonl"),
+)
+def _json_loader(file_path: str) -> Any:
+    return JSONStreamLoader(
+        file_path,
+        records_pointer=config.loaders.json_records_pointer,
+        fields=[field.strip() for field in config.loaders.json_fields.split(",") if field.strip()],
+    )
+
+
+@loader_registry.register(
+    "text", extensions=(".txt", ".md", ".csv", ".tsv", ".log", ".html", ".htm", ".xml"), mime_prefixes=("text",)
+)
+def _text_loader(file_path: str) -> Any:
+    return TextLoader(file_path)
+
+
+@loader_registry.register("pdf", extensions=(".pdf",), mime_types=("application/pdf",))
+def _pdf_loader(file_path: str) -> Any:
+    return ParallelPDFLoader(
+        file_path,
+        workers=config.loaders.pdf_workers,
+        pages_per_task=config.loaders.pdf_pages_per_task,
+        min_parallel_pages=config.loaders.pdf_parallel_min_pages,
+    )
+
+
+@loader_registry.register(
+    "excel",
+    extensions=(".xlsx", ".xls"),
+    mime_types=(
+        "application/vnd.ms-excel",  # .xls
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # .xlsx
+        "application/x-excel",
+    ),
+)
+def _excel_loader(file_path: str) -> Any:
+    return ExcelLoader(
+        file_path,
+        rows_per_document=config.loaders.excel_rows_per_document,
+        header=config.loaders.excel_header,
+    )
+
+
+@loader_registry.register(
+    "docx",
+    extensions=(".docx", ".doc"),
+    mime_types=(
+        "application/msword",  # .doc
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
+        "application/vnd.ms-word.document.12",
+    ),
+)
+def _docx_loader(file_path: str) -> Any:
+    return Docx2txtLoader(file_path)
+
+
+# Плагины регистрируют свои загрузчики при импорте (импорт идет и в процессах пула разбора)
+for plugin in filter(None, (name.strip() for name in config.loaders.plugins.split(","))):
+    importlib.import_module(plugin)
+    logger.info(f"Loaded document loader plugin: {plugin}")
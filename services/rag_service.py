@@ -1,15 +1,27 @@
+import json
 import logging
-from typing import Any, List
+import time
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+from dataclasses import asdict
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
-import magic
+from pypdf import PdfReader
 
+from configs.config import config
+from db.repos.embedding_bulk_loader import EmbeddingBulkLoader
 from db.repos.embedding_repo import EmbeddingRepo
 from db.repos.rag_source_repo import RagSourceRepo
+from db.repos.vector_index_repo import VectorIndexRepo
+from services.chunking_service import Chunk, ChunkPolicy, DocumentChunker
+from services.loader_registry import ParseStats, ParseTiming, loader_registry, parse_file
 from services.temp_file_service import TempFilesService
 from services.text_service import TextService
-from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader, TextLoader, JSONLoader
-from utils.custom_loaders import ExcelLoader
+from services.transcript_service import TranscriptSegment, TranscriptService, window_segments
+from utils.custom_loaders import extract_pdf_range, pdf_page_ranges
+from utils.hashing import file_sha256, keyed_sha256, text_sha256
 
 logger = logging.getLogger(__name__)
 
@@ -24,115 +36,470 @@ class RagArchiveProcessor:
             text_service: TextService,
             temp_files: TempFilesService,
             model_name_or_path: str,
+            index_repo: Optional[VectorIndexRepo] = None,
+            bulk_loader: Optional[EmbeddingBulkLoader] = None,
+            chunker: Optional[DocumentChunker] = None,
+            transcripts: Optional[TranscriptService] = None,
     ):
         self.source_repo = source_repo
         self.embedding_repo = embedding_repo
         self.text_service = text_service
         self.temp_files = temp_files
         self.model_name_or_path = model_name_or_path
+        self.index_repo = index_repo
+        self.bulk_loader = bulk_loader
+        self.chunker = chunker or DocumentChunker(model_name_or_path)
+        self.transcripts = transcripts or TranscriptService()
+        # Сохраненные хэши файлов и чанков включают index_key: после смены модели
+        # или политики чанкинга все файлы источника векторизуются заново
+        self.index_key = index_key(model_name_or_path, self.chunker.policy)
 
-    async def process_archive(self, archive_file: Any, source_id: str) -> int:
-        """
-        Обработка архива и создание векторных представлений.
-        Возвращает количество обработанных чанков.
+    def ingest_archive(
+            self,
+            archive_file: Any,
+            source_id: str,
+            executor: Optional[Executor] = None,
+            batch_size: int = config.ingestion.batch_size,
+            progress: Optional[Callable[[int], None]] = None,
+            base_source_id: Optional[str] = None,
+            max_in_flight: int = 2 * config.ingestion.process_workers,
+    ) -> int:
+        """Потоковая инкрементальная индексация архива.
+
+        Файлы, хэш которых совпадает с сохраненным, не разбираются вовсе. В измененных
+        файлах векторизуются только новые чанки, устаревшие удаляются. Разбор идет в пуле,
+        векторизация и запись в БД - пачками по batch_size чанков.
+        progress вызывается после каждой пачки с числом добавленных чанков;
+        исключение из progress прерывает индексацию.
+        С bulk_loader изменения копятся в staging таблице и применяются одной
+        транзакцией в конце: до этого поиск видит прежнее состояние источника,
+        а прерванная индексация не оставляет следов.
+        base_source_id - текущая версия источника, когда source_id - ее новая версия:
+        неизменившиеся файлы и чанки копируются из нее, сама она не меняется.
+        max_in_flight - сколько задач разбора одновременно отдается executor.
+        Возвращает количество добавленных чанков.
         """
-        logger.info("Starting archive processing")
-        chunks_count = 0
         files_list = None
 
         try:
-            # Очистка старых эмбеддингов
-            self.embedding_repo.delete_by_source_id(source_id)
-
             # Распаковка архива и получение списка файлов
-            files_list = self.temp_files.extract_and_store_files(archive_file)
+            files_list = self.temp_files.extract_files(archive_file)
+            archive_files = {
+                self.temp_files.archive_relative_path(file_path): (file_path, self._indexed_hash(file_sha256(file_path)))
+                for file_path in files_list
+            }
 
-            # Загрузка и обработка файлов
-            combined_text = self._load_files(files_list)
+            parse_stats = ParseStats()
 
-            # Создание и сохранение чанков
-            chunks = self.text_service.split_text_into_chunks(combined_text)
-            chunks_count = len(chunks)  #
+            def file_chunks(changed_files: Dict[str, Tuple[str, str]]) -> Iterator[Tuple[str, List[Chunk]]]:
+                documents = self.iter_documents(list(changed_files), executor, parse_stats, max_in_flight)
+                return self._split_documents(documents)
 
-            embeddings = self.text_service.create_embeddings_from_chunks(
-                chunks,
-                self.model_name_or_path,
+            chunks_count = self._ingest_items(
+                source_id, archive_files, file_chunks, batch_size, progress, base_source_id
             )
-            self.embedding_repo.insert_data(embeddings, chunks, source_id)
-
-            logger.info(f"Archive processing completed successfully. Processed {chunks_count} chunks")
+            if parse_stats.files:
+                logger.info(f"Parse timings: {parse_stats.summary()}")
             return chunks_count
 
-        except Exception as e:
-            logger.error(f"Error processing archive: {str(e)}")
-            raise
-
         finally:
             if files_list:
                 self.temp_files.clean_up_temp_files(files_list)
 
-    def _load_files(self, file_paths: List[str]) -> str:
-        """Загрузка и объединение содержимого файлов."""
-        combined_text = []
-
-        for file_path in file_paths:
-            try:
-                loader = self._get_loader(file_path)
-                if loader:
-                    logger.info(f"Loading file: {file_path}")
-                    documents = loader.load()
-                    for doc in documents:
-                        if doc.page_content.strip():  # проверяем, что контент не пустой
-                            combined_text.append(doc.page_content)
-                            logger.info(f"Successfully loaded content from {file_path}")
+    def ingest_transcripts(
+            self,
+            video_ids: List[str],
+            source_id: str,
+            batch_size: int = config.ingestion.batch_size,
+            progress: Optional[Callable[[int], None]] = None,
+            base_source_id: Optional[str] = None,
+    ) -> int:
+        """Инкрементальная индексация транскриптов видео - то же, что ingest_archive, где файл - видео.
+
+        Транскрипты запрашиваются параллельно (не больше transcripts.concurrency) и кэшируются
+        на диске, так что переиндексация их не запрашивает. Видео хранится как файл
+        youtube/<id> с хэшем транскрипта, чанки - временные окна сегментов с
+        start_seconds и duration_seconds. Если транскрипт видео получить не удалось,
+        его ранее сохраненные чанки остаются. Возвращает количество добавленных чанков.
+        """
+        stored_hashes = self.embedding_repo.get_file_hashes(base_source_id or source_id)
+        segments_by_video: Dict[str, List[TranscriptSegment]] = {}
+        videos: Dict[str, Tuple[str, str]] = {}
+        failed = []
+
+        for video_id, segments, error in self.transcripts.fetch_many(video_ids):
+            video_path = transcript_path(video_id)
+            if segments:
+                segments_by_video[video_id] = segments
+                videos[video_path] = (video_id, self._indexed_hash(transcript_sha256(segments)))
+                continue
+            failed.append(video_id)
+            if video_path in stored_hashes:
+                # Прежние чанки видео считаются неизменившимися
+                videos[video_path] = (video_id, stored_hashes[video_path])
+
+        if failed:
+            logger.warning(f"No transcripts for {len(failed)} of {len(video_ids)} videos: {', '.join(failed)}")
+        if not videos:
+            raise ValueError(f"No transcripts available for videos: {', '.join(video_ids)}")
+
+        def file_chunks(changed_videos: Dict[str, Tuple[str, str]]) -> Iterator[Tuple[str, List[Chunk]]]:
+            for video_id in changed_videos:
+                yield video_id, self.transcript_chunks(segments_by_video[video_id])
+
+        return self._ingest_items(source_id, videos, file_chunks, batch_size, progress, base_source_id)
+
+    def transcript_chunks(self, segments: List[TranscriptSegment]) -> List[Chunk]:
+        """Чанки транскрипта по временным окнам не длиннее чанка политики.
+
+        Окно из одного слишком длинного сегмента дорезается чанкером и сохраняет время окна.
+        """
+        chunks = []
+        for window in window_segments(segments, max_length=self.chunker.chunk_limit,
+                                      length_function=self.chunker.length):
+            if self.chunker.length(window.text) > self.chunker.chunk_limit:
+                chunks.extend(self.chunker.split(window.text, window.metadata))
+            else:
+                chunks.append(window)
+        return chunks
+
+    def _indexed_hash(self, content_hash: str) -> str:
+        """Хэш содержимого файла или чанка, под которым он хранится в embeddings."""
+        return keyed_sha256(content_hash, self.index_key)
+
+    def _ingest_items(
+            self,
+            source_id: str,
+            items: Dict[str, Tuple[str, str]],
+            file_chunks: Callable[[Dict[str, Tuple[str, str]]], Iterable[Tuple[str, List[Chunk]]]],
+            batch_size: int,
+            progress: Optional[Callable[[int], None]],
+            base_source_id: Optional[str],
+    ) -> int:
+        """Общая часть инкрементальной индексации.
+
+        items - {путь в источнике: (ключ, хэш содержимого)}, где ключ - локальный путь файла
+        или id видео. file_chunks получает измененные элементы {ключ: (путь, хэш)} и отдает
+        (ключ, чанки) по мере готовности.
+        Без bulk_loader и base_source_id источник меняется на месте одной транзакцией:
+        прерванная индексация не оставляет файлов с новым хэшем, но без новых чанков.
+        """
+        staging_table = None
+        chunks_count = 0
+        in_place = not self.bulk_loader and not base_source_id
+        uncommitted = in_place
+
+        try:
+            stored_hashes = self.embedding_repo.get_file_hashes(base_source_id or source_id)
+
+            # Файлы, которых больше нет в архиве (и строки без хэшей, созданные до инкрементальной индексации)
+            removed_files = set(stored_hashes) - set(items)
+            if removed_files and in_place:
+                self.embedding_repo.delete_by_files(source_id, list(removed_files), commit=False)
+
+            changed_files = {
+                key: (archive_path, file_hash)
+                for archive_path, (key, file_hash) in items.items()
+                if stored_hashes.get(archive_path) != file_hash
+            }
+            logger.info(
+                f"Incremental indexing: {len(changed_files)} changed, "
+                f"{len(items) - len(changed_files)} unchanged, {len(removed_files)} removed files"
+            )
+
+            if base_source_id:
+                # Новая версия не видна поиску до переключения, staging ей не нужен
+                unchanged_files = [
+                    archive_path for archive_path, (key, _) in items.items()
+                    if key not in changed_files
+                ]
+                self.embedding_repo.copy_from_source(base_source_id, source_id, unchanged_files)
+            elif self.bulk_loader:
+                staging_table = self.bulk_loader.create_staging_table()
+
+            new_chunks = self._iter_new_chunks(
+                source_id, file_chunks(changed_files), changed_files, staging_table, base_source_id
+            )
+            for batch in _batched(new_chunks, batch_size):
+                chunks = [text for text, _ in batch]
+                metadata = [chunk_metadata for _, chunk_metadata in batch]
+                embeddings = self.embed_chunks(chunks)
+                if self.bulk_loader:
+                    self.bulk_loader.copy(embeddings, chunks, source_id, metadata, table=staging_table or "embeddings")
                 else:
-                    logger.warning(f"No suitable loader found for file: {file_path}")
-            except Exception as e:
-                logger.error(f"Error loading file {file_path}: {str(e)}", exc_info=True)
+                    self.embedding_repo.insert_data(
+                        embeddings, chunks, source_id, metadata=metadata, commit=not in_place
+                    )
+                chunks_count += len(chunks)
+
+                if progress:
+                    progress(chunks_count)
+
+            if staging_table:
+                # Строки удаленных и измененных файлов заменяются содержимым staging атомарно
+                replaced_files = [*removed_files, *(archive_path for archive_path, _ in changed_files.values())]
+                self.bulk_loader.swap_in(staging_table, source_id, replaced_files)
+                staging_table = None
+
+            if uncommitted:
+                self.embedding_repo.commit()
+                uncommitted = False
+
+            # Крупным источникам строим отдельный частичный ANN индекс
+            if self.index_repo:
+                self.index_repo.ensure_source_index(source_id)
+
+            return chunks_count
+
+        finally:
+            if uncommitted:
+                self.embedding_repo.rollback()
+            if staging_table:
+                self.bulk_loader.drop_staging_table(staging_table)
+
+    def _split_documents(
+            self, documents: Iterable[Tuple[str, List[Tuple[str, dict]]]]
+    ) -> Iterator[Tuple[str, List[Chunk]]]:
+        """Каждый документ файла режется отдельно, чанк получает его положение в файле и char_offset."""
+        for file_path, file_documents in documents:
+            yield file_path, [
+                chunk
+                for text, document_metadata in file_documents
+                for chunk in self.chunker.split(text, document_metadata)
+            ]
+
+    def _iter_new_chunks(
+            self,
+            source_id: str,
+            file_chunks: Iterable[Tuple[str, List[Chunk]]],
+            changed_files: Dict[str, Tuple[str, str]],
+            staging_table: Optional[str] = None,
+            base_source_id: Optional[str] = None,
+    ) -> Iterator[Tuple[str, dict]]:
+        """Сравнивает чанки измененных файлов с сохраненными и отдает только новые.
+
+        Неизменившиеся чанки копируются из base_source_id в новую версию, либо
+        переносятся в staging_table (embeddings не меняется до swap_in), либо
+        остаются на месте с обновленным хэшем файла.
+        """
+        for file_path, file_chunk_list in file_chunks:
+            archive_path, file_hash = changed_files[file_path]
+
+            chunks = {}
+            for chunk in file_chunk_list:
+                chunks.setdefault(self._indexed_hash(text_sha256(chunk.text)), chunk)
+
+            stored_chunk_hashes = self.embedding_repo.get_chunk_hashes(base_source_id or source_id, archive_path)
+            if base_source_id:
+                self.embedding_repo.copy_from_source(
+                    base_source_id, source_id, [archive_path], stored_chunk_hashes & set(chunks), file_hash
+                )
+            elif staging_table:
+                self.bulk_loader.stage_existing(
+                    staging_table, source_id, archive_path, stored_chunk_hashes & set(chunks), file_hash
+                )
+            else:
+                stale_hashes = stored_chunk_hashes - set(chunks)
+                # Изменения на месте фиксирует _ingest_items вместе с новыми чанками
+                if stale_hashes:
+                    self.embedding_repo.delete_by_chunk_hashes(
+                        source_id, archive_path, list(stale_hashes), commit=False
+                    )
+                # Неизменившиеся чанки остаются, у них обновляется только хэш файла
+                self.embedding_repo.update_file_hash(source_id, archive_path, file_hash, commit=False)
+
+            for chunk_hash, chunk in chunks.items():
+                if chunk_hash not in stored_chunk_hashes:
+                    yield chunk.text, {
+                        "file_path": archive_path,
+                        "file_hash": file_hash,
+                        "chunk_hash": chunk_hash,
+                        **chunk.metadata,
+                    }
+
+    def collect_garbage(self, older_than: datetime) -> int:
+        """Удаляет эмбеддинги и индексы версий источников, замененных раньше older_than.
+
+        Задержка нужна, чтобы поиск, начатый до переключения версии, успел завершиться.
+        Возвращает количество удаленных версий.
+        """
+        collected = 0
+
+        for version in self.source_repo.get_garbage_versions(older_than):
+            self._drop_version_data(version.id)
+            self.source_repo.delete(version)
+            collected += 1
+
+        # Первая версия живет в строке самого источника, удаляются только ее эмбеддинги
+        for source in self.source_repo.get_superseded_roots(older_than):
+            self._drop_version_data(source.id)
+            collected += 1
 
-        if not combined_text:
-            logger.warning("No text was extracted from any files")
+        if collected:
+            logger.info(f"Garbage collected {collected} outdated source versions")
+        return collected
 
-        return "\n".join(combined_text)
+    def _drop_version_data(self, source_id: str) -> None:
+        if self.index_repo:
+            self.index_repo.drop_source_index(source_id)
+        self.embedding_repo.delete_by_source_id(source_id)
+
+    def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Векторизация чанков моделью из общего реестра."""
+        return self.text_service.create_embeddings_from_chunks(
+            chunks,
+            self.model_name_or_path,
+        )
 
     @staticmethod
-    def _get_loader(file_path: str) -> Any:
-        """Определение подходящего загрузчика для файла."""
-        mime = magic.Magic(mime=True)
-        file_type = mime.from_file(file_path)
-        logger.info(f"Detected MIME type for {file_path}: {file_type}")
-
-        if file_type == "application/json":
-            logger.info(f"Using JSONLoader for {file_path}")
-            return JSONLoader(
-                file_path=file_path,
-                jq_schema='. | tostring',
-                text_content=True
-            )
+    def iter_documents(
+            file_paths: List[str],
+            executor: Optional[Executor] = None,
+            stats: Optional[ParseStats] = None,
+            max_in_flight: int = 2 * config.ingestion.process_workers,
+    ) -> Iterator[Tuple[str, List[Tuple[str, dict]]]]:
+        """Пары (путь файла, документы файла с метаданными) по мере готовности.
+
+        С executor файлы разбираются параллельно, при этом в работе одновременно
+        не больше max_in_flight задач (вызывающий знает размер пула), чтобы готовые
+        результаты не копились в памяти.
+        Большой PDF разбивается на задачи по диапазонам страниц в том же пуле (вложенных
+        пулов нет); документы файла отдаются в порядке страниц, когда готовы все его диапазоны.
+        В stats накапливается время разбора по типам загрузчиков.
+        """
+        if executor is None:
+            for file_path in file_paths:
+                documents, timing = parse_file_documents(file_path)
+                if stats is not None:
+                    stats.add(timing)
+                yield file_path, documents
+            return
+
+        def parse_tasks() -> Iterator[Tuple[str, int, int, Optional[Tuple[int, int]]]]:
+            for file_path in file_paths:
+                page_ranges = pdf_parse_ranges(file_path)
+                for index, page_range in enumerate(page_ranges):
+                    yield file_path, index, len(page_ranges), page_range
+
+        max_in_flight = max(max_in_flight, 1)
+        pending_tasks = parse_tasks()
+        in_flight = {}
+        file_parts: Dict[str, Dict[int, Tuple[List[Tuple[str, dict]], ParseTiming]]] = {}
+
+        while True:
+            for file_path, index, parts_count, page_range in pending_tasks:
+                if page_range is None:
+                    future = executor.submit(parse_file_documents, file_path)
+                else:
+                    future = executor.submit(parse_pdf_range_documents, file_path, *page_range)
+                in_flight[future] = (file_path, index, parts_count)
+                if len(in_flight) >= max_in_flight:
+                    break
+
+            if not in_flight:
+                return
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, index, parts_count = in_flight.pop(future)
+                parts = file_parts.setdefault(file_path, {})
+                parts[index] = future.result()
+                if len(parts) < parts_count:
+                    continue
+
+                del file_parts[file_path]
+                results = [parts[part] for part in range(parts_count)]
+                documents = [document for part_documents, _ in results for document in part_documents]
+                if stats is not None:
+                    timings = [timing for _, timing in results]
+                    stats.add(ParseTiming(
+                        loader=timings[0].loader,
+                        detected_by=timings[0].detected_by,
+                        seconds=sum(timing.seconds for timing in timings),
+                        documents=len(documents),
+                        failed=any(timing.failed for timing in timings),
+                    ))
+                yield file_path, documents
+
+
+def document_metadata(loader_metadata: dict) -> dict:
+    """Положение документа в файле из метаданных загрузчика.
+
+    page (с 1), sheet и строки листа row_start / row_end, json_pointer записи JSON.
+    """
+    metadata = {}
+    if isinstance(loader_metadata.get("page"), int):
+        metadata["page"] = loader_metadata["page"] + 1  # PyPDFLoader нумерует страницы с 0
+    if loader_metadata.get("sheet"):
+        metadata["sheet"] = str(loader_metadata["sheet"])
+    for key in ("row_start", "row_end"):
+        if isinstance(loader_metadata.get(key), int):
+            metadata[key] = loader_metadata[key]
+    if isinstance(loader_metadata.get("json_pointer"), str):
+        metadata["json_pointer"] = loader_metadata["json_pointer"]
+    return metadata
+
+
+def load_file_documents(file_path: str) -> List[Tuple[str, dict]]:
+    """Разбор одного файла в список непустых документов (страниц/листов) с метаданными."""
+    return parse_file_documents(file_path)[0]
+
+
+def parse_file_documents(file_path: str) -> Tuple[List[Tuple[str, dict]], ParseTiming]:
+    """То же с временем разбора.
+
+    Функция уровня модуля, чтобы ее можно было отправить в пул процессов.
+    """
+    documents, timing = parse_file(file_path)
+    return [(text, document_metadata(metadata)) for text, metadata in documents], timing
+
+
+def index_key(model_name_or_path: str, policy: ChunkPolicy) -> str:
+    """Все, от чего зависят чанки и векторы источника: модель, ее бэкенд и политика чанкинга."""
+    return "|".join([
+        model_name_or_path, config.inference.backend, config.inference.onnx_quantization,
+        policy.name, policy.unit, str(policy.chunk_size), str(policy.chunk_overlap),
+    ])
+
+
+def transcript_path(video_id: str) -> str:
+    """Путь видео в источнике (колонка file_path)."""
+    return f"youtube/{video_id}"
+
+
+def transcript_sha256(segments: List[TranscriptSegment]) -> str:
+    """Хэш транскрипта: меняется вместе с текстом или разметкой сегментов по времени."""
+    return text_sha256(json.dumps([asdict(segment) for segment in segments], ensure_ascii=False))
+
+
+def pdf_parse_ranges(file_path: str) -> List[Optional[Tuple[int, int]]]:
+    """Задачи разбора файла в пуле: диапазоны страниц большого PDF или [None] - файл целиком."""
+    if loader_registry.detect(file_path)[0] != "pdf":
+        return [None]
+    try:
+        total_pages = len(PdfReader(file_path).pages)
+    except Exception:
+        return [None]  # ошибку покажет разбор файла целиком
+    if total_pages < config.loaders.pdf_parallel_min_pages:
+        return [None]
+    return pdf_page_ranges(total_pages, config.loaders.pdf_pages_per_task)
+
+
+def parse_pdf_range_documents(file_path: str, start: int, end: int) -> Tuple[List[Tuple[str, dict]], ParseTiming]:
+    """Документы страниц [start, end) PDF и время разбора; функция уровня модуля для пула процессов."""
+    started = time.perf_counter()
+    documents, failed = [], False
+    try:
+        pages, _ = extract_pdf_range(file_path, start, end)
+        documents = [(text, document_metadata({"page": page_number})) for page_number, text in pages]
+    except Exception as e:
+        failed = True
+        logger.error(f"Error loading pages {start}-{end} of {file_path}: {str(e)}", exc_info=True)
+    return documents, ParseTiming("pdf", "extension", time.perf_counter() - started, len(documents), failed)
+
 
-        if file_type.startswith("text"):
-            logger.info(f"Using TextLoader for {file_path}")
-            return TextLoader(file_path)
-
-        elif file_type == "application/pdf":
-            logger.info(f"Using PyPDFLoader for {file_path}")
-            return PyPDFLoader(file_path)
-
-        elif file_type in [
-            "application/vnd.ms-excel",  # .xls
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # .xlsx
-            "application/x-excel",
-        ]:
-            logger.info(f"Using ExcelLoader for {file_path}")
-            return ExcelLoader(file_path)
-
-        elif file_type in [
-            "application/msword",  # .doc
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
-            "application/vnd.ms-word.document.12",
-        ]:
-            logger.info(f"Using Docx2txtLoader for {file_path}")
-            return Docx2txtLoader(file_path)
-
-        logger.warning(f"No suitable loader found for file type: {file_type}")
-        return None
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Группирует элементы в списки по size штук."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,115 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from configs.config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetrievalCacheStats:
+    """Счетчики кэша результатов поиска."""
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class RetrievalResult:
+    """Эмбеддинг запроса и переранжированные чанки."""
+    query_vector: np.ndarray
+    chunks: List[str]
+
+
+class RetrievalCache:
+    """Кэш поиска по (набор источников, нормализованный запрос) с TTL и LRU вытеснением.
+
+    Хранит эмбеддинг запроса вместе с итоговыми чанками, так что повторный вопрос
+    не требует ни инференса модели, ни запроса к pgvector. Записи источника
+    сбрасываются при его переиндексации (invalidate_source).
+    """
+
+    def __init__(
+            self,
+            ttl_seconds: float = config.retrieval_cache.ttl_seconds,
+            max_items: int = config.retrieval_cache.max_items,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self._items: OrderedDict[Tuple, Tuple[float, RetrievalResult]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = RetrievalCacheStats()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Регистр, лишние пробелы и завершающая пунктуация не влияют на ключ."""
+        query = " ".join(unicodedata.normalize("NFC", query).casefold().split())
+        return re.sub(r"[\s?!.…]+$", "", query)
+
+    @staticmethod
+    def source_key(source_ids: Union[str, Iterable[str]]) -> Tuple[str, ...]:
+        """Набор источников запроса без учета порядка выбора."""
+        if isinstance(source_ids, (str, uuid.UUID)):
+            source_ids = [source_ids]
+        return tuple(sorted({str(source_id) for source_id in source_ids}))
+
+    @classmethod
+    def make_key(cls, source_ids: Union[str, Iterable[str]], query: str, *params: Hashable) -> Tuple:
+        return (cls.source_key(source_ids), cls.normalize_query(query), *params)
+
+    def get(self, key: Tuple) -> Optional[RetrievalResult]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.stats.misses += 1
+                return None
+
+            stored_at, result = item
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._items[key]
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+
+            self._items.move_to_end(key)
+            self.stats.hits += 1
+            return RetrievalResult(result.query_vector, list(result.chunks))
+
+    def put(self, key: Tuple, result: RetrievalResult) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic(), RetrievalResult(result.query_vector, list(result.chunks)))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate_source(self, source_id: str) -> None:
+        """Удаляет все записи с участием источника (вызывается при переиндексации)."""
+        source_id = str(source_id)
+        with self._lock:
+            stale_keys = [key for key in self._items if source_id in key[0]]
+            for key in stale_keys:
+                del self._items[key]
+            self.stats.invalidations += 1
+        logger.info(f"Retrieval cache invalidated for source {source_id}: {len(stale_keys)} entries")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+retrieval_cache = RetrievalCache() if config.retrieval_cache.enabled else None
@@ -0,0 +1,156 @@
+import logging
+import math
+from typing import List, Optional
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+logger = logging.getLogger(__name__)
+
+# idf термина, встречающегося только в одном из двух документов пары (запрос, чанк),
+# при smooth_idf=True: ln((1 + 2) / (1 + 1)) + 1. У общих терминов idf = 1.
+_PAIR_IDF_UNIQUE = math.log(3 / 2) + 1
+
+
+class HybridScorer:
+    """Пакетное гибридное ранжирование: все кандидаты оцениваются за один проход."""
+
+    def __init__(self, semantic_weight: float = 0.7, keyword_weight: float = 0.3):
+        self.semantic_weight = semantic_weight
+        self.keyword_weight = keyword_weight
+
+    @staticmethod
+    def semantic_scores(query_vector: np.ndarray, candidate_matrix: np.ndarray) -> np.ndarray:
+        """Косинусное сходство запроса со всеми кандидатами за одну векторную операцию."""
+        matrix = np.asarray(candidate_matrix, dtype=np.float64)
+        query = np.asarray(query_vector, dtype=np.float64)
+
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        # Построчная сумма: одинаковые чанки получают одинаковый скор (стабильная сортировка)
+        dots = np.sum(matrix * query, axis=1)
+        return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+    @staticmethod
+    def keyword_scores(query: str, texts: List[str]) -> np.ndarray:
+        """TF-IDF сходство запроса с каждым текстом.
+
+        Совпадает с обучением отдельного TfidfVectorizer на паре [query, text]:
+        idf в паре принимает лишь два значения (общий термин / термин одного документа),
+        поэтому достаточно одного CountVectorizer на всех кандидатов.
+        """
+        scores = np.zeros(len(texts), dtype=np.float64)
+        if not texts:
+            return scores
+
+        try:
+            counts = CountVectorizer().fit_transform([query, *texts]).astype(np.float64).tocsr()
+        except ValueError:
+            # Пустой словарь: ни запрос, ни тексты не содержат токенов
+            return scores
+
+        query_counts = counts[0].toarray().ravel()
+        text_counts = counts[1:]
+
+        query_mask = (query_counts > 0).astype(np.float64)
+        text_mask = text_counts.copy()
+        text_mask.data[:] = 1.0
+        text_squares = text_counts.multiply(text_counts).tocsr()
+
+        w2 = _PAIR_IDF_UNIQUE ** 2
+        dots = text_counts @ query_counts
+        query_norms_sq = w2 * np.sum(query_counts ** 2) - (w2 - 1) * (text_mask @ (query_counts ** 2))
+        text_norms_sq = (
+            w2 * np.asarray(text_squares.sum(axis=1)).ravel()
+            - (w2 - 1) * (text_squares @ query_mask)
+        )
+
+        norms = np.sqrt(query_norms_sq * text_norms_sq)
+        np.divide(dots, norms, out=scores, where=norms > 0)
+        return scores
+
+    @staticmethod
+    def normalize_by_source(scores: np.ndarray, source_ids: List) -> np.ndarray:
+        """Min-max нормализация скоров внутри каждого источника.
+
+        Шкалы скоров разных источников несопоставимы (плотность и длина чанков),
+        поэтому при поиске по нескольким источникам лучший кандидат каждого получает 1.
+        """
+        normalized = np.ones(len(scores), dtype=np.float64)
+        groups = np.asarray([str(source_id) for source_id in source_ids])
+        for group in np.unique(groups):
+            mask = groups == group
+            group_scores = scores[mask]
+            spread = group_scores.max() - group_scores.min()
+            if spread > 0:
+                normalized[mask] = (group_scores - group_scores.min()) / spread
+        return normalized
+
+    def score(
+            self,
+            query: str,
+            query_vector: np.ndarray,
+            texts: List[str],
+            candidate_matrix: np.ndarray,
+    ) -> np.ndarray:
+        """Итоговый гибридный скор для каждого кандидата."""
+        if not texts:
+            return np.zeros(0, dtype=np.float64)
+
+        return (
+                self.semantic_scores(query_vector, candidate_matrix) * self.semantic_weight +
+                self.keyword_scores(query, texts) * self.keyword_weight
+        )
+
+
+class MMRReranker:
+    """MMR переранжирование на матрице кандидатов с инкрементальным учетом разнообразия."""
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+    @classmethod
+    def select(
+            cls,
+            query_vector: np.ndarray,
+            candidate_matrix: np.ndarray,
+            lambda_param: float = 0.5,
+            max_results: int = 5,
+            relevance: Optional[np.ndarray] = None,
+    ) -> List[int]:
+        """Возвращает индексы выбранных кандидатов в порядке выбора.
+
+        Матрица нормализуется один раз; после каждого выбора вектор максимального
+        сходства с уже выбранными обновляется одной строкой сходств, а не пересчетом
+        со всеми выбранными. relevance заменяет косинусное сходство с запросом
+        (например, нормализованные по источникам скоры).
+        """
+        matrix = np.asarray(candidate_matrix, dtype=np.float64)
+        if matrix.size == 0 or max_results <= 0:
+            return []
+
+        normalized = cls._normalize(matrix)
+        if relevance is None:
+            # Построчное умножение вместо BLAS gemv: одинаковые строки дают бит-в-бит
+            # одинаковые сходства, и ничьи разрешаются так же, как в построчном варианте
+            relevance = np.sum(normalized * cls._normalize(np.asarray(query_vector, dtype=np.float64)), axis=1)
+        else:
+            relevance = np.asarray(relevance, dtype=np.float64)
+
+        available = np.ones(len(normalized), dtype=bool)
+        max_similarity = np.zeros(len(normalized), dtype=np.float64)
+        selected: List[int] = []
+
+        while len(selected) < max_results and available.any():
+            mmr = lambda_param * relevance - (1 - lambda_param) * max_similarity
+            mmr[~available] = -np.inf
+            # argmax берет первый максимум, как max() по списку оставшихся кандидатов
+            best = int(np.argmax(mmr))
+
+            similarity = np.sum(normalized * normalized[best], axis=1)
+            max_similarity = similarity if not selected else np.maximum(max_similarity, similarity)
+            selected.append(best)
+            available[best] = False
+
+        return selected
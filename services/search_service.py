@@ -1,122 +1,194 @@
+import asyncio
 import logging
+import uuid
 import numpy as np
-from typing import List, Tuple
-from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple, Union
+from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import RagSource, Embedding
 from sqlalchemy import select, or_
-from sklearn.feature_extraction.text import TfidfVectorizer
-from scipy.spatial.distance import cosine
 
+from configs.config import config
+from db.repos.embedding_repo import EXACT_SCAN, AsyncEmbeddingRepo
 from services.embedding_service import EmbeddingGenerator
+from services.retrieval_cache import RetrievalCache, RetrievalResult, retrieval_cache
+from services.scoring_service import HybridScorer, MMRReranker
 
 logger = logging.getLogger(__name__)
 
-
 class SearchService:
     """Сервис для поиска похожих текстов."""
 
-    def __init__(self, session: Session):
+    def __init__(self, session: AsyncSession, cache: Optional[RetrievalCache] = retrieval_cache):
         """Сервис использует веса: 70% для семантического (векторного)
         поиска и 30% для поиска по ключевым словам"""
         self.session = session
+        self.embedding_repo = AsyncEmbeddingRepo(session)
+        self.cache = cache
         self.semantic_weight = 0.7
         self.keyword_weight = 0.3
-
-    def calculate_cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Вычисляет косинусное сходство между векторами."""
-        return 1 - cosine(vec1, vec2)
-
-    def calculate_keyword_similarity(self, query: str, text: str) -> float:
-        """Вычисляет сходство на основе ключевых слов. TF-IDF."""
-        vectorizer = TfidfVectorizer()
-        try:
-            tfidf_matrix = vectorizer.fit_transform([query, text])
-            return (tfidf_matrix * tfidf_matrix.T).toarray()[0][1]
-        except:
-            return 0.0
+        self.scorer = HybridScorer(self.semantic_weight, self.keyword_weight)
 
     def mmr_rerank(
             self,
             query_vector: List[float],
             candidates: List[Tuple[str, List[float]]],
             lambda_param: float = 0.5,
-            max_results: int = 5
+            max_results: int = 5,
+            relevance: Optional[np.ndarray] = None,
     ) -> List[str]:
         """Переранжирует результаты с использованием MMR."""
-        selected = []
-        remaining = candidates.copy()
-
-        while len(selected) < max_results and remaining:
-            mmr_scores = []
-            for cand in remaining:
-                relevance = self.calculate_cosine_similarity(query_vector, cand[1])
-
-                if not selected:
-                    diversity = 0
-                else:
-                    # Максимальное сходство с уже выбранными документами
-                    diversity = max(
-                        self.calculate_cosine_similarity(cand[1], sel[1])
-                        for sel in selected
-                    )
-
-                mmr = lambda_param * relevance - (1 - lambda_param) * diversity
-                mmr_scores.append((cand, mmr))
-
-            best_candidate = max(mmr_scores, key=lambda x: x[1])[0]
-            selected.append(best_candidate)
-            remaining.remove(best_candidate)
-
-        return [text for text, _ in selected]
-
-    async def search(self, source_id: str, query: str, limit: int = 5) -> List[str]:
-        """Поиск похожих текстов с гибридным подходом и MMR."""
+        if not candidates:
+            return []
+
+        candidate_matrix = np.vstack([vector for _, vector in candidates])
+        selected = MMRReranker.select(query_vector, candidate_matrix, lambda_param, max_results, relevance)
+        return [candidates[i][0] for i in selected]
+
+    async def search(
+            self,
+            source_id: Union[str, List[str]],
+            query: str,
+            limit: int = 5,
+            ef_search: Optional[int] = None,
+            probes: Optional[int] = None,
+            candidates_limit: Optional[int] = None,
+    ) -> List[str]:
+        """Поиск похожих текстов с гибридным подходом и MMR.
+
+        ef_search / probes управляют балансом точности и скорости ANN индекса
+        (по умолчанию берутся из config.vector_index).
+        candidates_limit - размер выборки кандидатов для переранжирования
+        (по умолчанию config.RAG_SEARCH_CANDIDATES, при 0 - limit * 2).
+        source_id может быть списком: тогда поиск идет по всем источникам одним
+        ANN запросом с нормализацией скоров по источникам и общим MMR.
+        """
+        result = await self.retrieve(source_id, query, limit, ef_search, probes, candidates_limit)
+        return result.chunks
+
+    async def retrieve(
+            self,
+            source_id: Union[str, List[str]],
+            query: str,
+            limit: int = 5,
+            ef_search: Optional[int] = None,
+            probes: Optional[int] = None,
+            candidates_limit: Optional[int] = None,
+    ) -> RetrievalResult:
+        """То же, что search, но возвращает и эмбеддинг запроса.
+
+        Повторные запросы к тому же источнику отдаются из кэша без обращения к модели и БД.
+        """
+        candidates_limit = candidates_limit or config.RAG_SEARCH_CANDIDATES or limit * 2
+        candidates_limit = max(candidates_limit, limit)
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(source_id, query, limit, candidates_limit, ef_search, probes)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(
+                    f"Retrieval cache hit for source {source_id} "
+                    f"(hit rate: {self.cache.stats.hit_rate:.1%})"
+                )
+                return cached
+
+        result = await self._search(source_id, query, limit, ef_search, probes, candidates_limit)
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
+
+    @staticmethod
+    def _search_plan(source: RagSource, rows_count: int) -> Tuple[str, bool]:
+        """Как искать по источнику: (представление для запроса, есть ли частичный индекс).
+
+        Маленькие источники ищутся точным сканированием. Частичный индекс (в том числе
+        компактный halfvec/binary) есть только у источников от source_index_min_rows строк;
+        источники меньше порога ищутся по общему float32 HNSW индексу, а не перебором
+        с приведением каждого вектора к компактному типу.
+        """
+        if rows_count < config.vector_index.exact_scan_max_rows:
+            return EXACT_SCAN, False
+        if rows_count < config.vector_index.source_index_min_rows:
+            return "float32", False
+        return source.vector_storage, True
+
+    async def _search(
+            self,
+            source_id: Union[str, List[str]],
+            query: str,
+            limit: int,
+            ef_search: Optional[int],
+            probes: Optional[int],
+            candidates_limit: int,
+    ) -> RetrievalResult:
         logger.info("——— Start search vectors ———")
         logger.info(f"Search query: {query}")
 
-        # Получаем RAG источник
-        stmt = select(RagSource).where(RagSource.id == source_id)
-        result = self.session.execute(stmt)
-        source = result.scalar_one_or_none()
+        # Получаем RAG источники
+        source_ids = RetrievalCache.source_key(source_id)
+        result = await self.session.execute(
+            select(RagSource).where(RagSource.id.in_([uuid.UUID(source_id) for source_id in source_ids]))
+        )
+        sources = result.scalars().all()
+
+        if len(sources) != len(source_ids):
+            missing = set(source_ids) - {str(source.id) for source in sources}
+            raise ValueError(f"Source with ID {', '.join(sorted(missing))} not found")
+
+        # Эмбеддинги текущих версий источников (во время переиндексации - прежних)
+        version_ids = [source.search_source_id for source in sources]
+        rows_counts = await self.embedding_repo.count_rows(
+            version_ids,
+            max(config.vector_index.exact_scan_max_rows, config.vector_index.source_index_min_rows),
+        )
+        version_ids_by_group = {}
+        for source in sources:
+            storage, source_index = self._search_plan(source, rows_counts[str(source.search_source_id)])
+            # Источник с частичным индексом запрашивается отдельно, остальные - общим запросом
+            group = (storage, source.search_source_id if source_index else None)
+            version_ids_by_group.setdefault(group, []).append(source.search_source_id)
+
+        # Создаем эмбеддинг для запроса (инференс модели вне event loop)
+        embedding_generator = EmbeddingGenerator(config.RAG_EMBED_MODEL)
+        query_vector = (await asyncio.to_thread(embedding_generator.create_embeddings, [query]))[0]
 
-        if not source:
-            raise ValueError(f"Source with ID {source_id} not found")
+        # Компактный индекс отдает candidates_limit * rescore_factor строк, HNSW должен успеть их найти
+        coarse_limit = candidates_limit * config.vector_index.rescore_factor
+        if {storage for storage, _ in version_ids_by_group} - {"float32", EXACT_SCAN}:
+            ef_search = max(ef_search or config.vector_index.hnsw_ef_search, coarse_limit)
 
-        # Создаем эмбеддинг для запроса
-        embedding_generator = EmbeddingGenerator()
-        query_vector = embedding_generator.create_embeddings([query])[0]
+        # Параметры ANN индекса действуют только в рамках текущей транзакции
+        await self.embedding_repo.set_search_params(ef_search, probes)
 
         # Получаем расширенный набор кандидатов для последующего переранжирования
-        stmt = (
-            select(Embedding.text_chunk, Embedding.vector_512)
-            .where(Embedding.source_id == source_id)
-            .order_by(Embedding.vector_512.op("<=>")(query_vector))
-            .limit(limit * 2)  # Берем больше результатов для переранжирования
+        rows = await self.embedding_repo.search_candidates(
+            version_ids_by_group, query_vector, candidates_limit, coarse_limit
         )
+        candidates = [(row[0], row[1]) for row in rows]
 
-        result = self.session.execute(stmt)
-        candidates = [(row[0], row[1]) for row in result]
+        # Гибридное ранжирование всех кандидатов одним пакетом
+        texts = [text for text, _ in candidates]
+        candidate_matrix = np.vstack([vector for _, vector in candidates]) if candidates else None
+        final_scores = self.scorer.score(query, query_vector, texts, candidate_matrix)
 
-        # Гибридное ранжирование
-        ranked_results = []
-        for text, vector in candidates:
-            semantic_score = self.calculate_cosine_similarity(query_vector, vector)
-            keyword_score = self.calculate_keyword_similarity(query, text)
-            final_score = (
-                    semantic_score * self.semantic_weight +
-                    keyword_score * self.keyword_weight
-            )
-            ranked_results.append((text, vector, final_score))
+        # По нескольким источникам скоры нормализуются внутри каждого источника,
+        # и MMR ранжирует общий список по ним вместо косинуса с запросом
+        relevance = None
+        if len(version_ids) > 1 and candidates:
+            final_scores = self.scorer.normalize_by_source(final_scores, [row[2] for row in rows])
+            relevance = final_scores
 
-        # Сортируем по финальному скору
-        ranked_results.sort(key=lambda x: x[2], reverse=True)
+        # Сортируем по финальному скору (стабильно, как list.sort)
+        order = np.argsort(-final_scores, kind="stable")
+        ranked_results = [(texts[i], candidates[i][1], final_scores[i]) for i in order]
 
         # Применяем MMR для обеспечения разнообразия
         final_results = self.mmr_rerank(
             query_vector,
-            [(text, vector) for text, vector, _ in ranked_results[:limit * 2]],
+            [(text, vector) for text, vector, _ in ranked_results],
             lambda_param=0.5,
-            max_results=limit
+            max_results=limit,
+            relevance=relevance[order] if relevance is not None else None,
         )
 
         logger.info("——— End search vectors ———")
@@ -128,4 +200,4 @@ class SearchService:
             logger.info(f"{text}")
             logger.info("---")
 
-        return final_results
+        return RetrievalResult(query_vector, final_results)
@@ -1,10 +1,24 @@
+import io
 import os
+import posixpath
 import shutil
 import tempfile
-from typing import Any, List
+import zipfile
+from typing import Any, List, Union
 
 import patoolib
 
+from configs.config import config
+
+# Префикс каталогов, создаваемых потоковой распаковкой
+EXTRACT_DIR_PREFIX = "rag_extract_"
+# Размер буфера при копировании файла из архива
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ArchiveLimitError(ValueError):
+    """Архив превышает допустимые ограничения (число файлов, размер, степень сжатия)."""
+
 
 class TempFilesService:
     """Сервис для работы с временными файлами."""
@@ -16,6 +30,103 @@ class TempFilesService:
             file.save(temp_zip_file.name)
             return temp_zip_file.name
 
+    @staticmethod
+    def extract_files(archive: Union[str, bytes, bytearray]) -> List[str]:
+        """Распаковывает архив способом из config.ingestion.extraction_mode."""
+        if config.ingestion.extraction_mode == "patool" and isinstance(archive, str):
+            return TempFilesService.extract_and_store_files(archive)
+        return TempFilesService.stream_extract_files(archive)
+
+    @staticmethod
+    def stream_extract_files(
+            archive: Union[str, bytes, bytearray],
+            max_members: int = config.ingestion.max_archive_members,
+            max_uncompressed_bytes: int = config.ingestion.max_uncompressed_bytes,
+            max_compression_ratio: int = config.ingestion.max_compression_ratio,
+    ) -> List[str]:
+        """Извлекает файлы ZIP-архива (путь или байты из download_as_bytearray).
+
+        Каждый файл копируется из архива потоком ровно один раз, с исходным именем
+        и структурой папок. Ограничения проверяются и по заголовкам архива, и по
+        фактически распакованным байтам, поэтому zip-бомба не заполнит /tmp.
+        """
+        source = io.BytesIO(archive) if isinstance(archive, (bytes, bytearray)) else archive
+        temp_dir = tempfile.mkdtemp(prefix=EXTRACT_DIR_PREFIX)
+        extracted_files = []
+
+        try:
+            with zipfile.ZipFile(source) as zip_file:
+                members = [info for info in zip_file.infolist() if not info.is_dir()]
+                TempFilesService._check_limits(
+                    members, max_members, max_uncompressed_bytes, max_compression_ratio
+                )
+
+                total_bytes = 0
+                for info in members:
+                    relative_path = TempFilesService._safe_member_path(info)
+                    if not relative_path:
+                        continue
+
+                    target_path = os.path.join(temp_dir, relative_path)
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+                    with zip_file.open(info) as member, open(target_path, "wb") as target:
+                        while chunk := member.read(COPY_BUFFER_SIZE):
+                            total_bytes += len(chunk)
+                            if total_bytes > max_uncompressed_bytes:
+                                raise ArchiveLimitError(
+                                    f"Archive unpacks to more than {max_uncompressed_bytes} bytes"
+                                )
+                            target.write(chunk)
+
+                    extracted_files.append(target_path)
+
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        if not extracted_files:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return extracted_files
+
+    @staticmethod
+    def _check_limits(
+            members: List[zipfile.ZipInfo],
+            max_members: int,
+            max_uncompressed_bytes: int,
+            max_compression_ratio: int,
+    ) -> None:
+        if len(members) > max_members:
+            raise ArchiveLimitError(f"Archive has {len(members)} files, limit is {max_members}")
+
+        declared_size = sum(info.file_size for info in members)
+        if declared_size > max_uncompressed_bytes:
+            raise ArchiveLimitError(
+                f"Archive unpacks to {declared_size} bytes, limit is {max_uncompressed_bytes}"
+            )
+
+        for info in members:
+            if info.compress_size and info.file_size / info.compress_size > max_compression_ratio:
+                raise ArchiveLimitError(f"Suspicious compression ratio for {info.filename}")
+
+    @staticmethod
+    def _safe_member_path(info: zipfile.ZipInfo) -> str:
+        """Исходное имя файла в архиве без абсолютных путей и '..' (защита от zip slip)."""
+        filename = info.filename
+        if not info.flag_bits & 0x800:
+            # Имя без флага UTF-8 zipfile декодирует как cp437, архиваторы обычно пишут UTF-8
+            try:
+                filename = filename.encode("cp437").decode("utf-8")
+            except (UnicodeEncodeError, UnicodeDecodeError):
+                pass
+
+        parts = [
+            part for part in posixpath.normpath(filename.replace("\\", "/")).split("/")
+            if part not in ("", ".", "..")
+        ]
+        return os.path.join(*parts) if parts else ""
+
     @staticmethod
     def extract_and_store_files(zip_path: str) -> List[str]:
         """Извлекает файлы из ZIP-архива и сохраняет их во временные файлы."""
@@ -51,6 +162,28 @@ class TempFilesService:
 
     @staticmethod
     def clean_up_temp_files(files_list: List[str]) -> None:
-        """Удаляет все временные файлы из списка."""
+        """Удаляет все временные файлы из списка (и каталог потоковой распаковки)."""
         for temp_file in files_list:
             TempFilesService.clean_up_temp_file(temp_file)
+
+        extract_dirs = {
+            TempFilesService._extract_root(temp_file) for temp_file in files_list
+        } - {None}
+        for extract_dir in extract_dirs:
+            shutil.rmtree(extract_dir, ignore_errors=True)
+
+    @staticmethod
+    def archive_relative_path(file_path: str) -> str:
+        """Путь файла внутри архива (для потоковой распаковки), иначе имя файла."""
+        extract_root = TempFilesService._extract_root(file_path)
+        if extract_root:
+            return os.path.relpath(file_path, extract_root).replace(os.sep, "/")
+        return os.path.basename(file_path)
+
+    @staticmethod
+    def _extract_root(file_path: str):
+        relative = os.path.relpath(file_path, tempfile.gettempdir())
+        root = relative.split(os.sep, 1)[0]
+        if root.startswith(EXTRACT_DIR_PREFIX):
+            return os.path.join(tempfile.gettempdir(), root)
+        return None
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from configs.config import config
+from services.chunking_service import Chunk
+from utils.hashing import text_sha256
+
+logger = logging.getLogger(__name__)
+
+# Фетчер получает id видео и языки, возвращает сегменты вида {"text", "start", "duration"}
+TranscriptFetcher = Callable[[str, Sequence[str]], List[dict]]
+
+VIDEO_ID_RE = re.compile(r'[0-9A-Za-z_-]{11}')
+YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com"}
+SHORT_LINK_HOSTS = {"youtu.be", "www.youtu.be"}
+# Пути youtube.com, в которых ID видео - следующий сегмент
+VIDEO_PATH_PREFIXES = {"shorts", "embed", "live"}
+
+
+@dataclass
+class TranscriptSegment:
+    """Сегмент субтитров: текст и его положение в видео в секундах."""
+    text: str
+    start: float
+    duration: float
+
+
+def video_id_from_url(url: str) -> Optional[str]:
+    """ID видео из ссылки youtube.com (watch?v=, /shorts/, /embed/, /live/) или youtu.be."""
+    if "://" not in url:
+        url = f"https://{url}"
+    try:
+        parsed = urlsplit(url)
+        host = (parsed.hostname or "").lower()
+    except ValueError:
+        return None
+
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    candidate = None
+    if host in SHORT_LINK_HOSTS:
+        candidate = segments[0] if len(segments) == 1 else None
+    elif host in YOUTUBE_HOSTS:
+        if segments == ["watch"]:
+            candidate = next(iter(parse_qs(parsed.query).get("v", [])), None)
+        elif len(segments) == 2 and segments[0] in VIDEO_PATH_PREFIXES:
+            candidate = segments[1]
+
+    if candidate and VIDEO_ID_RE.fullmatch(candidate):
+        return candidate
+    return None
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """ID видео из ссылки YouTube или сам ID, если передан только он."""
+    url = url.strip()
+    if VIDEO_ID_RE.fullmatch(url):
+        return url
+    return video_id_from_url(url)
+
+
+def extract_video_ids(text: str) -> List[str]:
+    """ID видео из сообщения, без повторов.
+
+    Голые ID принимаются, только если сообщение целиком состоит из них; иначе
+    учитываются лишь ссылки на youtube.com и youtu.be, а остальные слова
+    (в том числе случайные слова из 11 символов) игнорируются.
+    """
+    tokens = text.split()
+    if tokens and all(VIDEO_ID_RE.fullmatch(token) for token in tokens):
+        candidates = tokens
+    else:
+        candidates = [video_id_from_url(token.strip("<>()[],;")) for token in tokens]
+
+    video_ids = []
+    for video_id in candidates:
+        if video_id and video_id not in video_ids:
+            video_ids.append(video_id)
+    return video_ids
+
+
+def transcript_source_name(video_ids: Sequence[str]) -> str:
+    """Имя источника по набору видео.
+
+    Одно видео - его ID. Для нескольких к первому ID добавляется хэш отсортированного
+    списка: тот же набор в любом порядке дает то же имя (и переиндексирует источник),
+    разные наборы с общим первым видео не совпадают.
+    """
+    name = f"YouTube {video_ids[0]}"
+    if len(video_ids) > 1:
+        digest = text_sha256("\n".join(sorted(video_ids)))[:8]
+        name += f" (+{len(video_ids) - 1}, {digest})"
+    return name
+
+
+def fetch_youtube_transcript(video_id: str, languages: Sequence[str]) -> List[dict]:
+    """Субтитры видео через youtube-transcript-api."""
+    from youtube_transcript_api import YouTubeTranscriptApi
+
+    return YouTubeTranscriptApi.get_transcript(video_id, languages=list(languages))
+
+
+class TranscriptCache:
+    """Сырые транскрипты на диске, по JSON файлу на видео и набор языков."""
+
+    def __init__(self, cache_dir: str = config.transcripts.cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, video_id: str, languages: Sequence[str]) -> str:
+        return os.path.join(self.cache_dir, f"{video_id}.{'-'.join(languages)}.json")
+
+    def get(self, video_id: str, languages: Sequence[str]) -> Optional[List[TranscriptSegment]]:
+        try:
+            with open(self.path(video_id, languages), encoding="utf-8") as file:
+                return [TranscriptSegment(**segment) for segment in json.load(file)]
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Corrupted transcript cache for video {video_id}, fetching again: {e}")
+            return None
+
+    def put(self, video_id: str, languages: Sequence[str], segments: List[TranscriptSegment]) -> None:
+        path = self.path(video_id, languages)
+        # Запись через временный файл: прерванная запись не оставляет битый кэш
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump([asdict(segment) for segment in segments], file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class TranscriptService:
+    """Получение транскриптов видео с кэшем на диске и ограниченным параллелизмом.
+
+    fetcher подменяется в тестах (например, записанными ответами); по умолчанию -
+    youtube-transcript-api. Транскрипт из кэша не запрашивается повторно.
+    """
+
+    def __init__(
+            self,
+            fetcher: TranscriptFetcher = fetch_youtube_transcript,
+            cache: Optional[TranscriptCache] = None,
+            languages: Sequence[str] = tuple(config.transcripts.languages.split(",")),
+            concurrency: int = config.transcripts.concurrency,
+    ):
+        self.fetcher = fetcher
+        self._cache = cache
+        self.languages = tuple(language.strip() for language in languages if language.strip())
+        self.concurrency = concurrency
+
+    @property
+    def cache(self) -> TranscriptCache:
+        # Каталог кэша создается при первом обращении, а не при импорте
+        if self._cache is None:
+            self._cache = TranscriptCache()
+        return self._cache
+
+    def fetch(self, video_id: str) -> List[TranscriptSegment]:
+        """Сегменты транскрипта видео: из кэша или через fetcher с сохранением в кэш."""
+        segments = self.cache.get(video_id, self.languages)
+        if segments is not None:
+            return segments
+
+        segments = [
+            TranscriptSegment(
+                text=str(entry["text"]),
+                start=float(entry["start"]),
+                duration=float(entry.get("duration", 0.0)),
+            )
+            for entry in self.fetcher(video_id, self.languages)
+        ]
+        self.cache.put(video_id, self.languages, segments)
+        logger.info(f"Fetched transcript for video {video_id}: {len(segments)} segments")
+        return segments
+
+    def fetch_many(
+            self, video_ids: Sequence[str]
+    ) -> Iterator[Tuple[str, Optional[List[TranscriptSegment]], Optional[Exception]]]:
+        """(id видео, сегменты, ошибка) по мере готовности; не больше concurrency запросов одновременно."""
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="transcripts") as executor:
+            futures = {executor.submit(self.fetch, video_id): video_id for video_id in video_ids}
+            for future in as_completed(futures):
+                video_id = futures[future]
+                try:
+                    yield video_id, future.result(), None
+                except Exception as e:
+                    logger.warning(f"Could not fetch transcript for video {video_id}: {e}")
+                    yield video_id, None, e
+
+
+def window_segments(
+        segments: Sequence[TranscriptSegment],
+        window_seconds: float = config.transcripts.window_seconds,
+        max_length: Optional[int] = None,
+        length_function: Callable[[str], int] = len,
+) -> List[Chunk]:
+    """Чанки транскрипта по временным окнам.
+
+    Сегменты подряд собираются в окно, пока оно не длиннее window_seconds и (если задан
+    max_length) его длина по length_function не превышает max_length. Длина окна считается
+    суммой длин сегментов. Чанк получает start_seconds и duration_seconds окна.
+    """
+    chunks = []
+    window: List[TranscriptSegment] = []
+    window_length = 0
+
+    def flush() -> None:
+        start = window[0].start
+        end = max(segment.start + segment.duration for segment in window)
+        chunks.append(Chunk(
+            text=" ".join(segment.text for segment in window),
+            metadata={"start_seconds": start, "duration_seconds": round(end - start, 3)},
+        ))
+
+    for segment in segments:
+        text = " ".join(segment.text.split())
+        if not text:
+            continue
+        segment = TranscriptSegment(text, segment.start, segment.duration)
+        segment_length = length_function(text)
+
+        if window and (
+                segment.start + segment.duration - window[0].start > window_seconds
+                or (max_length is not None and window_length + segment_length > max_length)
+        ):
+            flush()
+            window, window_length = [], 0
+
+        window.append(segment)
+        window_length += segment_length
+
+    if window:
+        flush()
+    return chunks
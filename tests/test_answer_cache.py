@@ -0,0 +1,87 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("anthropic")
+
+from handlers import qviz  # noqa: E402
+from services.answer_cache import AnswerCache  # noqa: E402
+
+SOURCE_A = "0b7a4c1e-6f5d-4e57-9a52-2f3b2d0c9a11"
+SOURCE_B = "7d1e2f4a-0c3b-4b8e-8f6d-5a9c1e2b3d44"
+CHUNKS = ["Latoken hackathon is held every month.", "The prize pool is paid in LA tokens."]
+
+
+class FakeLLM:
+    """Подмена request_claude_response: отдает ответ частями и считает вызовы."""
+
+    def __init__(self, parts=("Хакатон ", "проходит ", "каждый месяц.")):
+        self.parts = parts
+        self.calls = []
+
+    async def __call__(self, user_query, context):
+        self.calls.append((user_query, context))
+        for part in self.parts:
+            yield part
+
+
+@pytest.fixture
+def llm(monkeypatch, tmp_path):
+    fake = FakeLLM()
+    monkeypatch.setattr(qviz, "request_claude_response", fake)
+    monkeypatch.setattr(qviz, "answer_cache", AnswerCache(str(tmp_path / "answers.sqlite3"), similarity_threshold=0.95))
+    return fake
+
+
+def ask(query, vector, source_id=SOURCE_A, chunks=CHUNKS, on_text=None):
+    return asyncio.run(qviz.get_claude_response(query, chunks, source_id, np.asarray(vector, dtype=np.float32), on_text))
+
+
+def test_similar_question_is_answered_from_cache(llm):
+    assert ask("Когда хакатон?", [1.0, 0.0, 0.0]) == "Хакатон проходит каждый месяц."
+
+    streamed = []
+
+    async def on_text(text):
+        streamed.append(text)
+
+    assert ask("Как часто хакатон?", [0.99, 0.05, 0.0], on_text=on_text) == "Хакатон проходит каждый месяц."
+    assert len(llm.calls) == 1
+    assert streamed == ["Хакатон проходит каждый месяц."]
+    assert (qviz.answer_cache.stats.hits, qviz.answer_cache.stats.misses) == (1, 1)
+
+
+def test_cache_misses_on_other_question_context_or_sources(llm):
+    ask("Когда хакатон?", [1.0, 0.0, 0.0])
+
+    ask("Какой призовой фонд?", [0.0, 1.0, 0.0])
+    ask("Когда хакатон?", [1.0, 0.0, 0.0], chunks=CHUNKS[:1])
+    ask("Когда хакатон?", [1.0, 0.0, 0.0], source_id=[SOURCE_A, SOURCE_B])
+
+    assert len(llm.calls) == 4
+    assert qviz.answer_cache.stats.hits == 0
+
+
+def test_source_order_does_not_matter_and_reindex_invalidates(llm):
+    ask("Когда хакатон?", [1.0, 0.0, 0.0], source_id=[SOURCE_A, SOURCE_B])
+    ask("Когда хакатон?", [1.0, 0.0, 0.0], source_id=[SOURCE_B, SOURCE_A])
+    assert len(llm.calls) == 1
+
+    qviz.answer_cache.invalidate_source(SOURCE_B)
+    ask("Когда хакатон?", [1.0, 0.0, 0.0], source_id=[SOURCE_B, SOURCE_A])
+    assert len(llm.calls) == 2
+
+
+def test_failed_generation_is_not_cached(llm, monkeypatch):
+    async def failing(user_query, context):
+        yield "Хакатон "
+        raise RuntimeError("overloaded")
+
+    monkeypatch.setattr(qviz, "request_claude_response", failing)
+    assert ask("Когда хакатон?", [1.0, 0.0, 0.0]) == qviz.CLAUDE_ERROR_MESSAGE
+
+    monkeypatch.setattr(qviz, "request_claude_response", llm)
+    assert ask("Когда хакатон?", [1.0, 0.0, 0.0]) == "Хакатон проходит каждый месяц."
+    assert len(llm.calls) == 1
@@ -0,0 +1,55 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from db.repos.embedding_bulk_loader import COPY_COLUMNS, encode_copy_binary  # noqa: E402
+from services.rag_service import document_metadata, parse_file_documents  # noqa: E402
+
+
+def test_loader_positions_are_passed_through():
+    assert document_metadata({"source": "a.pdf", "page": 0}) == {"page": 1}
+    assert document_metadata({"source": "a.xlsx", "sheet": "Team", "row_start": 2, "row_end": 40}) == {
+        "sheet": "Team", "row_start": 2, "row_end": 40,
+    }
+    assert document_metadata({"source": "a.json", "json_pointer": "/items/3"}) == {"json_pointer": "/items/3"}
+
+
+def test_json_lines_records_keep_their_pointer(tmp_path):
+    path = tmp_path / "members.jsonl"
+    path.write_text("\n".join(json.dumps({"name": name}) for name in ("Ann", "Bob")), encoding="utf-8")
+
+    documents, _ = parse_file_documents(str(path))
+
+    assert [metadata for _, metadata in documents] == [{"json_pointer": "/0"}, {"json_pointer": "/1"}]
+
+
+def test_excel_rows_reach_the_chunks(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Team"
+    sheet.append(["name", "role"])
+    sheet.append(["Ann", "CTO"])
+    sheet.append(["Bob", "QA"])
+    path = tmp_path / "team.xlsx"
+    workbook.save(path)
+
+    documents, _ = parse_file_documents(str(path))
+
+    metadata = documents[0][1]
+    assert metadata["sheet"] == "Team"
+    assert 1 <= metadata["row_start"] <= metadata["row_end"] == 3
+
+
+def test_copy_rows_carry_record_position():
+    metadata = [{"row_start": 2, "row_end": 40, "json_pointer": "/items/3"}]
+
+    payload = encode_copy_binary(np.zeros((1, 4), dtype=np.float32), ["chunk"], "0b7a4c1e-6f5d-4e57-9a52-2f3b2d0c9a11", metadata)
+
+    assert {"row_start", "row_end", "json_pointer"} <= set(COPY_COLUMNS)
+    # Поля COPY: int32 длина и значение; row_start, row_end и json_pointer идут подряд
+    assert struct.pack("!iiii", 4, 2, 4, 40) + struct.pack("!i", 8) + b"/items/3" in payload
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from sentence_transformers import SentenceTransformer, models  # noqa: E402
+
+from services.embedding_service import EmbeddingModelRegistry  # noqa: E402
+
+
+def test_onnx_params_include_model_file(tmp_path):
+    onnx_file = tmp_path / "onnx" / "model_qint8_avx2.onnx"
+    onnx_file.parent.mkdir()
+    onnx_file.write_bytes(b"\0" * 3000)
+    (tmp_path / "onnx" / "model_qint8_avx2.onnx_data").write_bytes(b"\0" * 500)
+    # Оставшийся torch модуль, как Dense слой distiluse
+    dense = torch.nn.Linear(8, 4)
+    dense_bytes = (8 * 4 + 4) * 4
+
+    onnx_registry = EmbeddingModelRegistry(cache_dir=str(tmp_path), backend="onnx")
+    torch_registry = EmbeddingModelRegistry(cache_dir=str(tmp_path), backend="torch")
+
+    assert onnx_registry._params_bytes(dense, onnx_file) == dense_bytes + 3500
+    assert torch_registry._params_bytes(dense, tmp_path) == dense_bytes
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    """Сохраненная маленькая случайная BERT модель с пулингом и Dense слоем, как у distiluse."""
+    transformers = pytest.importorskip("transformers")
+    path = tmp_path_factory.mktemp("tiny_bert")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + [chr(c) for c in range(97, 123)]
+    vocab += [f"##{chr(c)}" for c in range(97, 123)]
+    (path / "vocab.txt").write_text("\n".join(vocab))
+    transformers.BertTokenizerFast(str(path / "vocab.txt")).save_pretrained(path)
+    torch.manual_seed(0)
+    transformers.BertModel(transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+    )).save_pretrained(path)
+
+    modules = [
+        models.Transformer(str(path), max_seq_length=24),
+        models.Pooling(32, "mean"),
+        models.Dense(32, 16, activation_function=torch.nn.Tanh()),
+    ]
+    SentenceTransformer(modules=modules, device="cpu").save(str(path / "model"))
+    return str(path / "model")
+
+
+@pytest.mark.parametrize("quantization, min_cosine", [("", 0.9999), ("avx2", 0.98)])
+def test_onnx_vectors_match_torch(model_path, tmp_path, quantization, min_cosine):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("optimum.onnxruntime")
+    rng = np.random.default_rng(0)
+    texts = ["".join(rng.choice(list("abcdefghij "), size=rng.integers(1, 60))) for _ in range(32)]
+
+    vectors = {}
+    for backend in ("torch", "onnx"):
+        registry = EmbeddingModelRegistry(
+            cache_dir=str(tmp_path), backend=backend, onnx_quantization=quantization, onnx_dir=str(tmp_path / "onnx"),
+        )
+        encoded = registry.engine(model_path).encode(texts)
+        vectors[backend] = encoded / np.linalg.norm(encoded, axis=1, keepdims=True)
+        registry.close()
+
+    cosines = np.sum(vectors["torch"] * vectors["onnx"], axis=1)
+    assert cosines.min() >= min_cosine
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from services.chunking_service import CHUNK_POLICIES, Chunk, DocumentChunker  # noqa: E402
+from services.rag_service import RagArchiveProcessor  # noqa: E402
+from utils.hashing import text_sha256  # noqa: E402
+
+
+class FakeEmbeddingRepo:
+    """Таблица embeddings в памяти с транзакцией: изменения с commit=False видны только после commit."""
+
+    def __init__(self, rows=None):
+        self.committed = dict(rows or {})  # (file_path, chunk_hash) -> file_hash
+        self.rows = dict(self.committed)
+
+    def _finish(self, commit):
+        if commit:
+            self.commit()
+
+    def commit(self):
+        self.committed = dict(self.rows)
+
+    def rollback(self):
+        self.rows = dict(self.committed)
+
+    def get_file_hashes(self, source_id):
+        return {file_path: file_hash for (file_path, _), file_hash in self.rows.items()}
+
+    def get_chunk_hashes(self, source_id, file_path):
+        return {chunk_hash for path, chunk_hash in self.rows if path == file_path}
+
+    def delete_by_files(self, source_id, file_paths, commit=True):
+        self.rows = {key: value for key, value in self.rows.items() if key[0] not in file_paths}
+        self._finish(commit)
+
+    def delete_by_chunk_hashes(self, source_id, file_path, chunk_hashes, commit=True):
+        for chunk_hash in chunk_hashes:
+            self.rows.pop((file_path, chunk_hash))
+        self._finish(commit)
+
+    def update_file_hash(self, source_id, file_path, file_hash, commit=True):
+        for key in self.rows:
+            if key[0] == file_path:
+                self.rows[key] = file_hash
+        self._finish(commit)
+
+    def insert_data(self, embeddings, chunks, source_id, metadata=None, commit=True):
+        for chunk_metadata in metadata:
+            self.rows[(chunk_metadata["file_path"], chunk_metadata["chunk_hash"])] = chunk_metadata["file_hash"]
+        self._finish(commit)
+
+
+class FakeTextService:
+    def create_embeddings_from_chunks(self, chunks, model_name_or_path):
+        return np.zeros((len(chunks), 4), dtype=np.float32)
+
+
+def _processor(repo, model_name_or_path="unused", policy="legacy"):
+    return RagArchiveProcessor(
+        source_repo=None, embedding_repo=repo, text_service=FakeTextService(), temp_files=None,
+        model_name_or_path=model_name_or_path, chunker=DocumentChunker("unused", CHUNK_POLICIES[policy]),
+    )
+
+
+def _chunks(*texts):
+    return [Chunk(text) for text in texts]
+
+
+def test_cancelled_in_place_ingestion_leaves_source_unchanged():
+    repo = FakeEmbeddingRepo({("a.txt", text_sha256("old")): "hash-1", ("b.txt", text_sha256("b")): "hash-b"})
+    items = {"a.txt": ("a.txt", "hash-2")}  # b.txt удален, a.txt изменен
+    file_chunks = {"a.txt": _chunks("new 1", "new 2", "new 3")}
+
+    def cancel(chunks_count):
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        _processor(repo)._ingest_items(
+            "source", items, lambda changed: ((key, file_chunks[key]) for key in changed),
+            batch_size=1, progress=cancel, base_source_id=None,
+        )
+
+    assert repo.committed == {("a.txt", text_sha256("old")): "hash-1", ("b.txt", text_sha256("b")): "hash-b"}
+    assert repo.get_file_hashes("source") == {"a.txt": "hash-1", "b.txt": "hash-b"}
+
+
+def test_in_place_ingestion_commits_new_hash_with_new_chunks():
+    processor = _processor(FakeEmbeddingRepo())
+    old, kept, new = (processor._indexed_hash(text_sha256(text)) for text in ("old", "kept", "new"))
+    repo = processor.embedding_repo = FakeEmbeddingRepo({("a.txt", old): "hash-1", ("a.txt", kept): "hash-1"})
+    items = {"a.txt": ("a.txt", "hash-2")}
+    file_chunks = {"a.txt": _chunks("kept", "new")}
+
+    added = processor._ingest_items(
+        "source", items, lambda changed: ((key, file_chunks[key]) for key in changed),
+        batch_size=1, progress=None, base_source_id=None,
+    )
+
+    assert added == 1
+    assert repo.committed == {("a.txt", kept): "hash-2", ("a.txt", new): "hash-2"}
+
+
+@pytest.mark.parametrize("model_name_or_path, policy", [("other-model", "legacy"), ("unused", "tokens")])
+def test_model_or_policy_change_reembeds_unchanged_files(model_name_or_path, policy):
+    repo = FakeEmbeddingRepo()
+    file_chunks = {"a.txt": _chunks("same 1", "same 2")}
+
+    def ingest(processor):
+        # Содержимое файла не меняется между индексациями
+        items = {"a.txt": ("a.txt", processor._indexed_hash("hash-1"))}
+        return processor._ingest_items(
+            "source", items, lambda changed: ((key, file_chunks[key]) for key in changed),
+            batch_size=8, progress=None, base_source_id=None,
+        )
+
+    assert ingest(_processor(repo)) == 2
+    assert ingest(_processor(repo)) == 0
+    assert ingest(_processor(repo, model_name_or_path, policy)) == 2
+    assert len(repo.committed) == 2
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+transformers = pytest.importorskip("transformers")
+
+from sentence_transformers import SentenceTransformer, models  # noqa: E402
+
+from services.inference_engine import InferenceEngine  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    """Маленькая случайная BERT модель с пулингом и Dense слоем, как у distiluse, без загрузки из сети."""
+    path = tmp_path_factory.mktemp("tiny_bert")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + [chr(c) for c in range(97, 123)]
+    vocab += [f"##{chr(c)}" for c in range(97, 123)]
+    (path / "vocab.txt").write_text("\n".join(vocab))
+    transformers.BertTokenizerFast(str(path / "vocab.txt")).save_pretrained(path)
+    transformers.BertModel(transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+    )).save_pretrained(path)
+
+    modules = [
+        models.Transformer(str(path), max_seq_length=24),
+        models.Pooling(32, "mean"),
+        models.Dense(32, 16, activation_function=torch.nn.Tanh()),
+    ]
+    return SentenceTransformer(modules=modules, device="cpu")
+
+
+def test_encode_matches_sentence_transformer_and_tokenizes_once(model, monkeypatch):
+    rng = np.random.default_rng(0)
+    texts = ["".join(rng.choice(list("abcdefghij "), size=rng.integers(1, 60))) for _ in range(57)]
+    engine = InferenceEngine(model, batch_size=8, max_batch_tokens=64, processes=0)
+
+    tokenized = []
+    tokenize = model.tokenize
+    monkeypatch.setattr(model, "tokenize", lambda batch: tokenized.append(len(batch)) or tokenize(batch))
+    vectors = engine.encode(texts)
+
+    assert tokenized == [len(texts)]
+    np.testing.assert_allclose(vectors, model.encode(texts, batch_size=8), atol=1e-5)
+    assert engine.stats.tokens <= engine.stats.padded_tokens
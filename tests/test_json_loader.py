@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+
+from utils.custom_loaders import JSONStreamLoader, _JSONStream
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 5, 9, 64])
+def test_numbers_split_by_read_boundary(read_size):
+    text = '{"count": 12.5, "items": [1.25, 3e10, 7, -0.5E-3, true, null, {"n": 10}], "tail": 42}'
+    stream = _JSONStream(io.StringIO(text), read_size=read_size)
+
+    records = list(stream.records(["items"]))
+
+    assert records == [
+        ("/items/0", 1.25), ("/items/1", 3e10), ("/items/2", 7), ("/items/3", -0.5e-3),
+        ("/items/4", True), ("/items/5", None), ("/items/6", {"n": 10}),
+    ]
+
+
+@pytest.mark.parametrize("read_size", [1, 4, 7])
+def test_top_level_number_at_end_of_file(read_size):
+    stream = _JSONStream(io.StringIO("  123.75e2"), read_size=read_size)
+
+    assert stream.value() == 123.75e2
+    assert stream.peek() == ""
+
+
+def test_number_on_first_read_boundary(tmp_path):
+    # "." из "12.5" - последний символ первого чтения в 64 KiB
+    prefix = '{"pad": "'
+    middle = '", "count": 12'
+    padding = (1 << 16) - len(prefix) - len(middle) - 1
+    text = prefix + "x" * padding + middle + '.5, "items": [{"name": "Ann"}, {"name": "Bob"}]}'
+    assert text[(1 << 16) - 1] == "."
+    path = tmp_path / "data.json"
+    path.write_text(text, encoding="utf-8")
+    json.loads(text)
+
+    documents = list(JSONStreamLoader(path, records_pointer="/items").lazy_load())
+
+    assert [document.page_content for document in documents] == ["name: Ann", "name: Bob"]
+    assert [document.metadata["json_pointer"] for document in documents] == ["/items/0", "/items/1"]
@@ -0,0 +1,79 @@
+from pypdf import PdfReader
+
+from utils.custom_loaders import ParallelPDFLoader, extract_pdf_pages
+
+
+def _stream(content: bytes, extra: bytes = b"") -> bytes:
+    return b"<< /Length %d %s>>\nstream\n%s\nendstream" % (len(content), extra, content)
+
+
+def _write_pdf(path, objects: list, page_ids: list) -> None:
+    """objects[0] и objects[1] - каталог и дерево страниц, их заполняет функция."""
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids)
+    )
+    with open(path, "wb") as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        file.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def _page(resources: bytes, contents: bytes) -> bytes:
+    return b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources %s %s >>" % (resources, contents)
+
+
+def _make_pdf(path) -> None:
+    objects = [
+        b"", b"",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",  # 3
+        _stream(b"BT /F1 12 Tf 50 700 Td (Hello indirect) Tj ET"),  # 4
+        b"<< /Font << /F1 3 0 R >> >>",  # 5 - ресурсы косвенной ссылкой
+        b"<< /F1 3 0 R >>",  # 6 - словарь шрифтов косвенной ссылкой
+        _stream(b"BT /F1 12 Tf 50 700 Td (Hello direct) Tj ET"),  # 7
+        _stream(b"\xff\x00" * 32, b"/Type /XObject /Subtype /Image /Width 8 /Height 8 "
+                                  b"/ColorSpace /DeviceGray /BitsPerComponent 8 "),  # 8
+        _stream(b"q 200 0 0 200 100 400 cm /Im1 Do Q"),  # 9
+        _stream(b"BT /F1 12 Tf 50 700 Td (Hello font ref) Tj ET"),  # 10
+    ]
+    pages = [
+        _page(b"5 0 R", b"/Contents 4 0 R"),
+        _page(b"<< /Font << /F1 3 0 R >> >>", b"/Contents 7 0 R"),
+        _page(b"<< >>", b""),
+        _page(b"<< /XObject << /Im1 8 0 R >> >>", b"/Contents 9 0 R"),
+        _page(b"<< /Font 6 0 R >>", b"/Contents 10 0 R"),
+    ]
+    page_ids = []
+    for page in pages:
+        objects.append(page)
+        page_ids.append(len(objects))
+    _write_pdf(path, objects, page_ids)
+
+
+def test_indirect_resources_are_not_skipped(tmp_path):
+    path = tmp_path / "indirect.pdf"
+    _make_pdf(path)
+
+    pages, skipped = extract_pdf_pages(PdfReader(path), 0, 5)
+
+    assert [(number, text.strip()) for number, text in pages] == [
+        (0, "Hello indirect"), (1, "Hello direct"), (4, "Hello font ref"),
+    ]
+    assert skipped == 2  # пустая страница и страница только с картинкой
+
+
+
+def test_loader_yields_pages_in_order(tmp_path):
+    path = tmp_path / "indirect.pdf"
+    _make_pdf(path)
+
+    documents = list(ParallelPDFLoader(path, workers=2, pages_per_task=1, min_parallel_pages=1).lazy_load())
+
+    assert [document.metadata["page"] for document in documents] == [0, 1, 4]
+    assert all(document.metadata["total_pages"] == 5 for document in documents)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from services.scoring_service import HybridScorer
+
+TEXTS = [
+    "Latoken hackathon hackathon runs every month for the whole team",
+    "Хакатон Latoken проходит каждый месяц, призы выплачиваются токенами LA",
+    "The culture deck describes values: ownership, speed and radical candor",
+    "Listing a token on the exchange requires a security audit",
+    "",
+    "!!! ... ???",
+    "a b c",
+    "hackathon",
+    "token token token exchange exchange listing",
+]
+
+
+def pair_tfidf_score(query, text):
+    """Исходный расчет: отдельный TfidfVectorizer на каждую пару (запрос, текст)."""
+    try:
+        tfidf_matrix = TfidfVectorizer().fit_transform([query, text])
+        return (tfidf_matrix * tfidf_matrix.T).toarray()[0][1]
+    except ValueError:
+        return 0.0
+
+
+@pytest.mark.parametrize("query", [
+    "When is the Latoken hackathon?",
+    "хакатон Latoken каждый месяц",
+    "token listing exchange token",
+    "culture",
+    "???",
+    "",
+])
+def test_keyword_scores_match_per_pair_tfidf(query):
+    expected = np.array([pair_tfidf_score(query, text) for text in TEXTS])
+
+    scores = HybridScorer.keyword_scores(query, TEXTS)
+
+    np.testing.assert_allclose(scores, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_keyword_scores_empty_candidates():
+    assert HybridScorer.keyword_scores("hackathon", []).shape == (0,)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from utils import telegram_stream
+from utils.telegram_stream import StreamingMessage
+
+
+class FakeChat:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, text):
+        message = FakeMessage(self, text)
+        self.messages.append(message)
+        return message
+
+
+class FakeMessage:
+    """Сообщение, правки которого первые throttled раз отклоняются с RetryAfter."""
+
+    def __init__(self, chat, text="", throttled=0, retry_after=0.05):
+        self.chat = chat
+        self.text = text
+        self.throttled = throttled
+        self.retry_after = retry_after
+        self.edits = 0
+
+    async def edit_text(self, text):
+        if self.throttled:
+            self.throttled -= 1
+            raise RetryAfter(self.retry_after)
+        self.edits += 1
+        self.text = text
+
+
+def test_full_message_survives_repeated_retry_after(monkeypatch):
+    monkeypatch.setattr(telegram_stream, "MESSAGE_LIMIT", 600)
+
+    async def scenario():
+        chat = FakeChat()
+        first = FakeMessage(chat, "⏳", throttled=3)
+        stream = StreamingMessage(first, header="Ответ:\n", edit_interval=0.01)
+
+        started = time.monotonic()
+        for i in range(200):
+            await stream.append(f"word{i} ")
+        appended = time.monotonic() - started
+        await stream.finish()
+        return first, chat, appended
+
+    first, chat, appended = asyncio.run(scenario())
+
+    # Токены принимаются без ожидания пауз Telegram
+    assert appended < 0.05
+    text = first.text + " " + " ".join(message.text for message in chat.messages)
+    assert text.split() == ["Ответ:"] + [f"word{i}" for i in range(200)]
+    assert all(len(message.text) <= 600 for message in [first, *chat.messages])
+
+
+def test_edits_are_rate_limited():
+    async def scenario():
+        message = FakeMessage(FakeChat(), "⏳")
+        stream = StreamingMessage(message, edit_interval=0.2)
+        for i in range(20):
+            await stream.append(f"{i} ")
+            await asyncio.sleep(0.01)
+        await stream.finish()
+        return message
+
+    message = asyncio.run(scenario())
+
+    assert message.text == " ".join(str(i) for i in range(20)) + " "
+    assert message.edits <= 3
@@ -0,0 +1,37 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+from utils.telegram_updates import PerChatUpdateProcessor
+
+
+def make_update(update_id, chat_id):
+    chat = Chat(chat_id, Chat.PRIVATE)
+    message = Message(update_id, datetime.now(timezone.utc), chat, from_user=User(chat_id, "user", False), text="hi")
+    return Update(update_id, message=message)
+
+
+def test_updates_of_one_chat_run_in_order_other_chats_in_parallel():
+    events = []
+
+    async def handle(name, delay):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    async def scenario():
+        processor = PerChatUpdateProcessor(max_concurrent_updates=8)
+        await asyncio.gather(
+            processor.process_update(make_update(1, 100), handle("a1", 0.05)),
+            processor.process_update(make_update(2, 100), handle("a2", 0.0)),
+            processor.process_update(make_update(3, 200), handle("b1", 0.0)),
+        )
+        return processor
+
+    processor = asyncio.run(scenario())
+
+    # Второй апдейт чата 100 ждет первый, чат 200 не ждет никого
+    assert events.index("end a1") < events.index("start a2")
+    assert events.index("end b1") < events.index("end a1")
+    assert processor._locks == {}
@@ -0,0 +1,100 @@
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from services.transcript_service import (  # noqa: E402
+    TranscriptCache, TranscriptSegment, TranscriptService, extract_video_id, extract_video_ids, window_segments,
+)
+
+
+def test_bare_ids_only_when_whole_message_is_ids():
+    assert extract_video_ids("dQw4w9WgXcQ\njNQXAC9IVRw dQw4w9WgXcQ") == ["dQw4w9WgXcQ", "jNQXAC9IVRw"]
+    assert extract_video_ids("please index this channel dQw4w9WgXcQ") == []
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42s",
+    "youtube.com/watch?feature=share&v=dQw4w9WgXcQ",
+    "https://m.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+])
+def test_youtube_links(url):
+    assert extract_video_ids(f"смотри ({url}), спасибо") == ["dQw4w9WgXcQ"]
+    assert extract_video_id(url) == "dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/watch?v=dQw4w9WgXcQ",
+    "https://notyoutube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/channel/dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=tooShort",
+    "https://youtu.be/dQw4w9WgXcQ/extra",
+])
+def test_foreign_or_malformed_links_are_ignored(url):
+    assert extract_video_ids(f"link: {url}") == []
+    assert extract_video_id(url) is None
+
+RECORDED = {
+    "dQw4w9WgXcQ": [
+        {"text": "hello", "start": 0.0, "duration": 2.0},
+        {"text": " and\nwelcome ", "start": 2.0, "duration": 3.0},
+        {"text": "   ", "start": 5.0, "duration": 1.0},
+        {"text": "to the show", "start": 9.0, "duration": 2.5},
+    ],
+}
+
+
+class RecordedFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, video_id, languages):
+        self.calls.append((video_id, tuple(languages)))
+        if video_id not in RECORDED:
+            raise LookupError(f"no transcript for {video_id}")
+        return RECORDED[video_id]
+
+
+def test_fetch_uses_disk_cache(tmp_path):
+    fetcher = RecordedFetcher()
+    service = TranscriptService(fetcher=fetcher, cache=TranscriptCache(str(tmp_path)), languages=("ru", "en"))
+
+    first = service.fetch("dQw4w9WgXcQ")
+    second = service.fetch("dQw4w9WgXcQ")
+
+    assert fetcher.calls == [("dQw4w9WgXcQ", ("ru", "en"))]
+    assert second == first
+    assert first[3] == TranscriptSegment("to the show", 9.0, 2.5)
+
+    # Кэш на диске переживает пересоздание сервиса
+    TranscriptService(fetcher=fetcher, cache=TranscriptCache(str(tmp_path)), languages=("ru", "en")).fetch("dQw4w9WgXcQ")
+    assert len(fetcher.calls) == 1
+
+
+def test_fetch_many_reports_errors_per_video(tmp_path):
+    service = TranscriptService(fetcher=RecordedFetcher(), cache=TranscriptCache(str(tmp_path)), concurrency=2)
+
+    results = {video_id: (segments, error) for video_id, segments, error in service.fetch_many(["dQw4w9WgXcQ", "missing0000"])}
+
+    assert len(results["dQw4w9WgXcQ"][0]) == 4 and results["dQw4w9WgXcQ"][1] is None
+    assert results["missing0000"][0] is None and isinstance(results["missing0000"][1], LookupError)
+
+
+def test_window_segments_boundaries_and_metadata():
+    segments = [TranscriptSegment(**entry) for entry in RECORDED["dQw4w9WgXcQ"]]
+
+    chunks = window_segments(segments, window_seconds=6)
+
+    assert [chunk.text for chunk in chunks] == ["hello and welcome", "to the show"]
+    assert chunks[0].metadata == {"start_seconds": 0.0, "duration_seconds": 5.0}
+    assert chunks[1].metadata == {"start_seconds": 9.0, "duration_seconds": 2.5}
+
+
+def test_window_segments_respects_max_length():
+    segments = [TranscriptSegment(**entry) for entry in RECORDED["dQw4w9WgXcQ"]]
+
+    chunks = window_segments(segments, window_seconds=60, max_length=12)
+
+    assert [chunk.text for chunk in chunks] == ["hello", "and welcome", "to the show"]
+    assert [chunk.metadata["start_seconds"] for chunk in chunks] == [0.0, 2.0, 9.0]
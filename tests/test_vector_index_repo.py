@@ -0,0 +1,23 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("pgvector")
+
+from db.repos.vector_index_repo import VectorIndexRepo  # noqa: E402
+
+
+def test_storage_change_replaces_source_index(monkeypatch):
+    source_id = str(uuid.uuid4())
+    repo = VectorIndexRepo(session=None)
+    executed = []
+    monkeypatch.setattr(repo, "_execute_autocommit", lambda statement: executed.append(str(statement)))
+
+    float32_index = repo.create_source_index(source_id, method="hnsw", storage="float32")
+    executed.clear()
+    halfvec_index = repo.create_source_index(source_id, method="hnsw", storage="halfvec")
+
+    assert halfvec_index != float32_index
+    assert executed[0].startswith(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {halfvec_index} ")
+    assert f"DROP INDEX CONCURRENTLY IF EXISTS {float32_index}" in executed
+    assert not any(halfvec_index in statement for statement in executed[1:])
@@ -1,18 +1,36 @@
-from typing import Union, Iterator, Optional
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from pathlib import Path
 
 import openpyxl
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject
 from langchain_core.documents import Document
 from langchain_community.document_loaders.base import BaseLoader
 
+# Сигнатура OLE2 (Compound File Binary) - формат .xls до Excel 2007
+OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
 
 class ExcelLoader(BaseLoader):
-    """Load Excel file (xlsx) and convert to Document format.
+    """Load Excel workbook (xlsx, xls) as a stream of row-group Documents.
+
+    Every sheet is read (or only `sheet_name`), `.xlsx` in openpyxl read-only mode and
+    legacy `.xls` through xlrd, so rows are never materialized all at once. Each
+    Document holds up to `rows_per_document` non-empty rows and has metadata
+    `source`, `sheet`, `row_start` and `row_end` (1-based sheet row numbers).
 
     Args:
         file_path: Path to the Excel file to load.
-        sheet_name: Name of the sheet to load. If `None`, loads the first sheet.
+        sheet_name: Name of the sheet to load. If `None`, loads all sheets.
         start_row: Row to start reading from. Defaults to 1 (first row).
+        rows_per_document: Maximum number of rows in one Document.
+        header: If `True`, the first non-empty row of each sheet is used as column
+            labels and every row is rendered as `label: value` pairs.
     """
 
     def __init__(
@@ -20,22 +38,472 @@ class ExcelLoader(BaseLoader):
             file_path: Union[str, Path],
             sheet_name: Optional[str] = None,
             start_row: int = 1,
+            rows_per_document: int = 50,
+            header: bool = False,
     ):
         """Initialize with file path and optional sheet name."""
         self.file_path = file_path
         self.sheet_name = sheet_name
         self.start_row = start_row
+        self.rows_per_document = rows_per_document
+        self.header = header
 
     def lazy_load(self) -> Iterator[Document]:
-        """Lazy load documents from the Excel file."""
-        workbook = openpyxl.load_workbook(self.file_path)
-        sheet = workbook[self.sheet_name] if self.sheet_name else workbook.active
-
-        rows = []
-        for row in sheet.iter_rows(min_row=self.start_row, values_only=True):
-            row_text = "\t".join([str(cell) if cell is not None else "" for cell in row])
-            rows.append(row_text)
-
-        combined_text = "\n".join(rows)
-        metadata = {"source": str(self.file_path), "sheet": sheet.title}
-        yield Document(page_content=combined_text, metadata=metadata)
+        """Lazy load row-group documents from every sheet of the workbook."""
+        for sheet_title, rows in self._iter_sheets():
+            yield from self._iter_documents(sheet_title, rows)
+
+    def _iter_sheets(self) -> Iterator[Tuple[str, Iterable[Tuple[int, Sequence[Any]]]]]:
+        with open(self.file_path, "rb") as file:
+            is_xls = file.read(len(OLE2_SIGNATURE)) == OLE2_SIGNATURE
+
+        if is_xls:
+            yield from self._iter_xls_sheets()
+            return
+
+        workbook = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            sheets = [workbook[self.sheet_name]] if self.sheet_name else workbook.worksheets
+            for sheet in sheets:
+                # Только листы с ячейками (у chartsheet нет iter_rows)
+                if hasattr(sheet, "iter_rows"):
+                    rows = sheet.iter_rows(min_row=self.start_row, values_only=True)
+                    yield sheet.title, enumerate(rows, start=self.start_row)
+        finally:
+            workbook.close()
+
+    def _iter_xls_sheets(self) -> Iterator[Tuple[str, Iterable[Tuple[int, Sequence[Any]]]]]:
+        try:
+            import xlrd
+        except ImportError as e:
+            raise ImportError("xlrd package not found, please install it with `pip install xlrd`") from e
+
+        # on_demand: листы разбираются по одному и выгружаются после чтения
+        workbook = xlrd.open_workbook(self.file_path, on_demand=True)
+        try:
+            sheet_names = [self.sheet_name] if self.sheet_name else workbook.sheet_names()
+            for sheet_name in sheet_names:
+                sheet = workbook.sheet_by_name(sheet_name)
+                rows = (
+                    (row_index + 1, sheet.row_values(row_index))
+                    for row_index in range(self.start_row - 1, sheet.nrows)
+                )
+                yield sheet_name, rows
+                workbook.unload_sheet(sheet_name)
+        finally:
+            workbook.release_resources()
+
+    def _iter_documents(self, sheet_title: str, rows: Iterable[Tuple[int, Sequence[Any]]]) -> Iterator[Document]:
+        labels: Optional[List[str]] = None
+        lines: List[str] = []
+        row_start = row_end = 0
+
+        for row_number, row in rows:
+            cells = ["" if cell is None else str(cell).strip() for cell in row]
+            if not any(cells):
+                continue
+
+            if self.header and labels is None:
+                labels = [label or f"Column {i}" for i, label in enumerate(cells, start=1)]
+                continue
+
+            if not lines:
+                row_start = row_number
+            row_end = row_number
+            lines.append(self._format_row(cells, labels))
+
+            if len(lines) >= self.rows_per_document:
+                yield self._document(sheet_title, lines, row_start, row_end)
+                lines = []
+
+        if lines:
+            yield self._document(sheet_title, lines, row_start, row_end)
+
+    @staticmethod
+    def _format_row(cells: List[str], labels: Optional[List[str]]) -> str:
+        if labels is None:
+            return "\t".join(cells).rstrip("\t")
+        return "; ".join(
+            f"{labels[i] if i < len(labels) else f'Column {i + 1}'}: {value}"
+            for i, value in enumerate(cells)
+            if value
+        )
+
+    def _document(self, sheet_title: str, lines: List[str], row_start: int, row_end: int) -> Document:
+        metadata = {
+            "source": str(self.file_path),
+            "sheet": sheet_title,
+            "row_start": row_start,
+            "row_end": row_end,
+        }
+        return Document(page_content="\n".join(lines), metadata=metadata)
+
+
+def _resolve(value: Any) -> Any:
+    """Значение словаря PDF с раскрытой косвенной ссылкой (DictionaryObject.get ее не раскрывает)."""
+    return None if value is None else value.get_object()
+
+
+def _has_contents(page: Any) -> bool:
+    """Есть ли у страницы поток содержимого (пустой массив потоков - пустая страница)."""
+    contents = _resolve(page.get("/Contents"))
+    # Словарь потока бывает пустым (pypdf убирает /Length), поэтому проверка на None, а не на истинность
+    return contents is not None and not (isinstance(contents, ArrayObject) and len(contents) == 0)
+
+
+def _has_fonts(resources: Any, depth: int = 2) -> bool:
+    """Есть ли шрифты в ресурсах страницы или ее Form XObject: без шрифта текст не нарисовать."""
+    resources = _resolve(resources)
+    if not isinstance(resources, DictionaryObject):
+        return False
+    if _resolve(resources.get("/Font")):
+        return True
+    if depth == 0:
+        return False
+    xobjects = _resolve(resources.get("/XObject"))
+    if not isinstance(xobjects, DictionaryObject):
+        return False
+    for xobject in xobjects.values():
+        xobject = _resolve(xobject)
+        if xobject.get("/Subtype") == "/Form" and _has_fonts(xobject.get("/Resources"), depth - 1):
+            return True
+    return False
+
+
+def extract_pdf_pages(reader: PdfReader, start: int, end: int) -> Tuple[List[Tuple[int, str]], int]:
+    """Текст страниц [start, end) и число пропущенных страниц без текста.
+
+    Пустые страницы и страницы только с картинками (без шрифтов в ресурсах)
+    отбрасываются до извлечения текста.
+    """
+    pages, skipped = [], 0
+    for page_number in range(start, end):
+        page = reader.pages[page_number]
+        if not _has_contents(page) or not _has_fonts(page.get("/Resources")):
+            skipped += 1
+            continue
+        text = page.extract_text()
+        if text.strip():
+            pages.append((page_number, text))
+        else:
+            skipped += 1
+    return pages, skipped
+
+
+def pdf_page_ranges(total_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    """Диапазоны страниц [start, end) по pages_per_task страниц."""
+    return [
+        (start, min(start + pages_per_task, total_pages))
+        for start in range(0, total_pages, pages_per_task)
+    ]
+
+
+# PdfReader последнего файла в процессе: задачи с диапазонами одного файла, попавшие
+# в один процесс пула, не разбирают xref и дерево страниц заново
+_cached_reader: Optional[Tuple[Tuple[str, float], PdfReader]] = None
+
+
+def cached_pdf_reader(file_path: Union[str, Path]) -> PdfReader:
+    global _cached_reader
+    key = (str(file_path), os.path.getmtime(file_path))
+    if _cached_reader is None or _cached_reader[0] != key:
+        _cached_reader = (key, PdfReader(file_path))
+    return _cached_reader[1]
+
+
+def extract_pdf_range(file_path: Union[str, Path], start: int, end: int) -> Tuple[List[Tuple[int, str]], int]:
+    """extract_pdf_pages по пути файла; функция уровня модуля для пула процессов."""
+    return extract_pdf_pages(cached_pdf_reader(file_path), start, end)
+
+
+class ParallelPDFLoader(BaseLoader):
+    """Load PDF as per-page Documents, extracting page ranges in a process pool.
+
+    Documents are yielded in page order with metadata `source`, `page` (0-based, as in
+    PyPDFLoader) and `total_pages`. Empty and image-only pages are skipped before text
+    extraction. PDFs shorter than `min_parallel_pages` are read in the current process,
+    as is any PDF loaded inside a worker process: pools are never nested, and ingestion
+    schedules page ranges on its own pool instead (see `RagArchiveProcessor.iter_documents`).
+
+    Args:
+        file_path: Path to the PDF file to load.
+        workers: Number of worker processes. If `0`, uses the number of CPUs.
+        pages_per_task: Number of pages extracted by one task.
+        min_parallel_pages: Minimal page count for parallel extraction.
+    """
+
+    def __init__(
+            self,
+            file_path: Union[str, Path],
+            workers: int = 0,
+            pages_per_task: int = 16,
+            min_parallel_pages: int = 64,
+    ):
+        self.file_path = file_path
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.min_parallel_pages = min_parallel_pages
+        self.skipped_pages = 0
+
+    def lazy_load(self) -> Iterator[Document]:
+        """Lazy load page documents in page order."""
+        reader = PdfReader(self.file_path)
+        total_pages = len(reader.pages)
+        ranges = pdf_page_ranges(total_pages, self.pages_per_task)
+        self.skipped_pages = 0
+
+        in_worker = multiprocessing.parent_process() is not None
+        if self.workers == 1 or total_pages < self.min_parallel_pages or in_worker:
+            for start, end in ranges:
+                yield from self._documents(*extract_pdf_pages(reader, start, end), total_pages)
+            return
+        del reader
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(ranges))) as executor:
+            futures = [executor.submit(extract_pdf_range, self.file_path, start, end) for start, end in ranges]
+            try:
+                # Диапазоны отдаются по порядку, как только готовы все предыдущие
+                for future in futures:
+                    yield from self._documents(*future.result(), total_pages)
+            finally:
+                # Прерванная итерация не ждет оставшиеся диапазоны
+                for future in futures:
+                    future.cancel()
+
+    def _documents(self, pages: List[Tuple[int, str]], skipped: int, total_pages: int) -> Iterator[Document]:
+        self.skipped_pages += skipped
+        for page_number, text in pages:
+            metadata = {"source": str(self.file_path), "page": page_number, "total_pages": total_pages}
+            yield Document(page_content=text, metadata=metadata)
+
+
+def escape_pointer_token(token: Any) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Токены JSON-указателя (RFC 6901): "/items/0" -> ["items", "0"]."""
+    if not pointer:
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"JSON pointer must start with '/': {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+# Символы, которыми может продолжаться число JSON
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+
+class _JSONStream:
+    """Инкрементальный разбор JSON из текстового файла поверх json.JSONDecoder.raw_decode.
+
+    В памяти одновременно только буфер чтения и одно значение (запись или пропускаемое
+    поддерево), а не весь документ.
+    """
+
+    def __init__(self, file, read_size: int = 1 << 16):
+        self.file = file
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.dropped = 0  # символов отброшено из начала буфера
+        self.eof = False
+
+    @property
+    def offset(self) -> int:
+        return self.dropped + self.pos
+
+    def _read(self, size: int) -> None:
+        if self.pos > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.pos:]
+            self.dropped += self.pos
+            self.pos = 0
+        data = self.file.read(size)
+        if data:
+            self.buffer += data
+        else:
+            self.eof = True
+
+    def peek(self) -> str:
+        """Следующий значимый символ ('' в конце файла)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n\ufeff":
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._read(self.read_size)
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.offset}, found {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        size = self.read_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # Число, за которым до конца буфера идут только символы числа ("12." или "3e"),
+                # могло быть обрезано чтением: raw_decode принял бы его начало
+                truncated = (
+                    isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and _NUMBER_TAIL.fullmatch(self.buffer, end)
+                )
+                if not truncated or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read(size)
+            size *= 2  # значение больше буфера: дочитываем с удвоением, без квадратичного разбора
+
+    def members(self) -> Iterator[str]:
+        """Ключи объекта; значение каждого ключа читает вызывающий код до следующей итерации."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def items(self) -> Iterator[int]:
+        """Индексы элементов массива; элемент читает вызывающий код."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+    def records(self, tokens: List[str], path: str = "") -> Iterator[Tuple[str, Any]]:
+        """Записи по указателю tokens: элементы массива или само значение."""
+        char = self.peek()
+        if not tokens:
+            if char == "[":
+                for index in self.items():
+                    yield f"{path}/{index}", self.value()
+            else:
+                yield path, self.value()
+            return
+
+        token, rest = tokens[0], tokens[1:]
+        if char == "{":
+            for key in self.members():
+                if key == token:
+                    yield from self.records(rest, f"{path}/{escape_pointer_token(key)}")
+                else:
+                    self.value()
+        elif char == "[":
+            for index in self.items():
+                if str(index) == token:
+                    yield from self.records(rest, f"{path}/{index}")
+                else:
+                    self.value()
+        else:
+            self.value()
+
+
+def flatten_record(value: Any, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+    """Пары (ключ через точку, скалярное значение); списки скаляров склеиваются через запятую."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten_record(item, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(value, list):
+        if all(not isinstance(item, (dict, list)) for item in value):
+            if value:
+                yield prefix, ", ".join(str(item) for item in value if item is not None)
+            return
+        for index, item in enumerate(value):
+            yield from flatten_record(item, f"{prefix}.{index}" if prefix else str(index))
+    elif value is not None and value != "":
+        yield prefix, value
+
+
+class JSONStreamLoader(BaseLoader):
+    """Load JSON or JSON Lines file as a stream of per-record Documents.
+
+    Records are the elements of the array at `records_pointer` (or the value itself
+    if it is not an array); in JSON Lines every line is a separate value and the
+    pointer is applied to each line. The file is parsed incrementally, so memory is
+    bounded by the largest record rather than the file size.
+
+    Each record is flattened to `key: value` lines (nested keys joined with dots) and
+    has metadata `source` and `json_pointer` - the RFC 6901 pointer of the record
+    (for JSON Lines, as if the file were an array of its lines).
+
+    Args:
+        file_path: Path to the JSON or JSON Lines file to load.
+        records_pointer: JSON pointer to the records, e.g. `/data/items`.
+        fields: Dotted keys to keep (a key also selects its nested keys).
+            If empty, keeps all fields.
+        json_lines: Parse as JSON Lines. If `None`, decided by `.jsonl`/`.ndjson` extension.
+        encoding: File encoding.
+    """
+
+    def __init__(
+            self,
+            file_path: Union[str, Path],
+            records_pointer: str = "",
+            fields: Sequence[str] = (),
+            json_lines: Optional[bool] = None,
+            encoding: str = "utf-8",
+    ):
+        self.file_path = file_path
+        self.records_pointer = parse_pointer(records_pointer)
+        self.fields = tuple(fields)
+        if json_lines is None:
+            json_lines = Path(file_path).suffix.lower() in (".jsonl", ".ndjson")
+        self.json_lines = json_lines
+        self.encoding = encoding
+
+    def lazy_load(self) -> Iterator[Document]:
+        """Lazy load record documents from the file."""
+        with open(self.file_path, encoding=self.encoding) as file:
+            stream = _JSONStream(file)
+            if not self.json_lines:
+                yield from self._documents(stream.records(self.records_pointer))
+                if stream.peek():
+                    raise ValueError(f"Extra data after JSON value at offset {stream.offset}")
+                return
+
+            line = 0
+            while stream.peek():
+                yield from self._documents(stream.records(self.records_pointer, f"/{line}"))
+                line += 1
+
+    def _documents(self, records: Iterable[Tuple[str, Any]]) -> Iterator[Document]:
+        for pointer, record in records:
+            text = self._format_record(record)
+            if text:
+                metadata = {"source": str(self.file_path), "json_pointer": pointer}
+                yield Document(page_content=text, metadata=metadata)
+
+    def _format_record(self, record: Any) -> str:
+        if not isinstance(record, (dict, list)):
+            return "" if record is None else str(record)
+        return "\n".join(
+            f"{key}: {value}"
+            for key, value in flatten_record(record)
+            if self._selected(key)
+        )
+
+    def _selected(self, key: str) -> bool:
+        return not self.fields or any(key == field or key.startswith(f"{field}.") for field in self.fields)
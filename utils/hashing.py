@@ -0,0 +1,23 @@
+import hashlib
+
+# Размер блока при хэшировании файлов
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 содержимого файла (читается блоками, без загрузки целиком)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(HASH_BUFFER_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    """SHA-256 текста чанка."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def keyed_sha256(value: str, key: str) -> str:
+    """SHA-256 значения вместе с ключом: одно и то же значение при разных ключах дает разные хэши."""
+    return text_sha256(f"{key}\n{value}")
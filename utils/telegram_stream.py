@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+class StreamingMessage:
+    """Постепенный вывод текста в сообщение Telegram по мере генерации.
+
+    Текст дописывается в исходное сообщение (например, плейсхолдер "⏳ ..."),
+    правки отправляются не чаще edit_interval секунд. Когда текст не помещается
+    в MESSAGE_LIMIT, заполненное сообщение фиксируется и продолжение идет
+    в новом сообщении, уже отправленные части не переотправляются.
+
+    append только дописывает буфер: правки отправляет фоновая задача, поэтому
+    паузы RetryAfter не задерживают получение токенов. Заполненные части и
+    последняя правка повторяются до успеха, промежуточные правки догоняют текст
+    после паузы.
+    """
+
+    def __init__(self, message: Message, header: str = "", edit_interval: float = 1.0):
+        self.message = message
+        self.edit_interval = edit_interval
+        self._text = header
+        self._sent_text = None
+        self._next_edit = 0.0
+        self._changed = asyncio.Event()
+        self._finished = False
+        self._writer = None
+
+    async def append(self, text: str) -> None:
+        self._text += text
+        self._changed.set()
+        self._ensure_writer()
+
+    async def finish(self) -> None:
+        """Дожидается отправки всего текста; последняя правка без ограничения частоты."""
+        self._finished = True
+        self._changed.set()
+        self._ensure_writer()
+        await self._writer
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+        elif self._writer.done() and not self._finished:
+            # Ошибка фоновой отправки (кроме RetryAfter/BadRequest) прерывает генерацию
+            self._writer.result()
+
+    async def _write_loop(self) -> None:
+        while True:
+            await self._changed.wait()
+            delay = self._next_edit - time.monotonic()
+            if delay > 0 and not self._finished:
+                # Текст, пришедший за паузу, уйдет одной правкой
+                await asyncio.sleep(delay)
+            self._changed.clear()
+
+            while len(self._text) > MESSAGE_LIMIT:
+                split_at = self._split_position(self._text)
+                head, self._text = self._text[:split_at], self._text[split_at:].lstrip()
+                await self._edit(head, retry=True)
+
+                # Продолжение сразу отправляется новым сообщением, если оно уже помещается
+                initial_text = self._text if self._text.strip() and len(self._text) <= MESSAGE_LIMIT else "…"
+                self.message = await self._send(initial_text)
+                self._sent_text = initial_text
+                self._next_edit = time.monotonic() + self.edit_interval
+
+            if self._finished:
+                await self._edit(self._text, retry=True)
+                return
+            if not await self._edit(self._text):
+                # Правку отклонили до конца паузы: повторится с актуальным текстом
+                self._changed.set()
+
+    @staticmethod
+    def _split_position(text: str) -> int:
+        # Режем по переносу строки или пробелу, если он недалеко от границы
+        for separator in ("\n", " "):
+            position = text.rfind(separator, MESSAGE_LIMIT - 500, MESSAGE_LIMIT)
+            if position > 0:
+                return position
+        return MESSAGE_LIMIT
+
+    async def _send(self, text: str) -> Message:
+        while True:
+            try:
+                return await self.message.chat.send_message(text)
+            except RetryAfter as e:
+                logger.warning(f"Streaming message throttled by Telegram for {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+
+    async def _edit(self, text: str, retry: bool = False) -> bool:
+        """Правка сообщения; False - Telegram попросил подождать, а retry не задан."""
+        while True:
+            if not text.strip() or text == self._sent_text:
+                return True
+
+            self._next_edit = time.monotonic() + self.edit_interval
+            try:
+                await self.message.edit_text(text)
+                self._sent_text = text
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Streaming edit throttled by Telegram for {e.retry_after}s")
+                self._next_edit = time.monotonic() + e.retry_after
+                if not retry:
+                    return False
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                logger.warning(f"Could not update streaming message: {e}")
+                return True
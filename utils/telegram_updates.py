@@ -0,0 +1,55 @@
+import asyncio
+from typing import Awaitable, Dict, Hashable, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def update_chat_key(update: object) -> Optional[Hashable]:
+    """Чат апдейта (или пользователь, если чата нет); None - апдейт не привязан к диалогу."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Апдейты разных чатов обрабатываются параллельно, одного чата - строго по очереди.
+
+    ConversationHandler и context.user_data не защищены от гонок: при concurrent_updates(True)
+    два сообщения пользователя подряд (например, архив и /cancel) обрабатывались бы одновременно
+    и читали бы устаревшее состояние диалога.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 256):
+        super().__init__(max_concurrent_updates)
+        # Замок чата и число апдейтов, которые его держат или ждут
+        self._locks: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = update_chat_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        lock, users = self._locks.get(key, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,29 +1,4 @@
-from youtube_transcript_api import YouTubeTranscriptApi
-import re
-
-
-def extract_video_id(url: str) -> str:
-    """Извлекает ID видео из URL."""
-    patterns = [
-        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-        r'youtu\.be\/([0-9A-Za-z_-]{11})',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-
-def get_transcript(video_id: str, languages=['ru', 'en']) -> list:
-    """Получает субтитры для видео."""
-    try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=languages)
-        return transcript
-    except Exception as e:
-        print(f"Ошибка при получении субтитров: {e}")
-        return None
+from services.transcript_service import TranscriptService, extract_video_id
 
 
 def save_transcript(transcript: list, video_id: str):
@@ -33,7 +8,7 @@ def save_transcript(transcript: list, video_id: str):
 
     filename = f'sugar_transcript_{video_id}.txt'
     with open(filename, 'w', encoding='utf-8') as f:
-        full_text = ' '.join(entry['text'] for entry in transcript)
+        full_text = ' '.join(segment.text for segment in transcript)
         f.write(full_text)
 
     print(f"Текст сохранен в файл: {filename}")
@@ -47,8 +22,12 @@ def process_youtube_url(url: str):
         print("Не удалось извлечь ID видео из URL")
         return
 
-    # Получаем субтитры
-    transcript = get_transcript(video_id)
+    # Получаем субтитры (тот же кэш на диске, что и у индексации в боте)
+    try:
+        transcript = TranscriptService().fetch(video_id)
+    except Exception as e:
+        print(f"Ошибка при получении субтитров: {e}")
+        return
     if not transcript:
         print("Не удалось получить субтитры")
         return
@@ -59,4 +38,4 @@ def process_youtube_url(url: str):
 
 if __name__ == "__main__":
     url = "https://www.youtube.com/watch?v=pxBQLFLei70&t=509s"
-    process_youtube_url(url)
\ No newline at end of file
+    process_youtube_url(url)